@@ -0,0 +1,65 @@
+"""Llena total_vuelo, moneda, origen y destino de las cotizaciones creadas
+antes de migrations/0006 (parseado = false), por lotes.
+
+    python backfill_pedidos.py              # todo lo pendiente
+    python backfill_pedidos.py --lote 1000 --pausa 0.2
+    python backfill_pedidos.py --dry-run    # solo cuenta y muestra ejemplos
+    python backfill_pedidos.py --todas      # re-parsea también las ya parseadas
+                                            # (tras corregir pedido.py)
+
+Se puede cortar y volver a correr: cada lote queda marcado como parseado.
+"""
+import argparse
+import os
+import time
+
+from supabase import create_client
+
+from pedido import parsear_pedido
+
+COLUMNAS = ("total_vuelo", "moneda", "origen", "destino")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lote", type=int, default=500)
+    parser.add_argument("--pausa", type=float, default=0.0, help="segundos entre lotes (para no cargar la base)")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--todas", action="store_true", help="incluye las filas ya parseadas")
+    args = parser.parse_args()
+
+    supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+
+    ultimo, total, con_total = 0, 0, 0
+    inicio = time.perf_counter()
+    while True:
+        query = supabase.table("cotizaciones").select("id, pedido_completo")
+        if not args.todas:
+            query = query.eq("parseado", False)
+        filas = query.gt("id", ultimo).order("id").limit(args.lote).execute().data
+        if not filas:
+            break
+        ultimo = filas[-1]["id"]
+
+        items = []
+        for f in filas:
+            campos = parsear_pedido(f.get("pedido_completo"))
+            items.append({"id": f["id"], **{c: campos[c] for c in COLUMNAS}})
+            con_total += campos["total_vuelo"] is not None
+
+        if args.dry_run:
+            for item in items[:3]:
+                print(item)
+        else:
+            supabase.rpc("aplicar_pedidos_parseados", {"items": items}).execute()
+
+        total += len(items)
+        print(f"{total} procesadas ({con_total} con total), último id {ultimo}")
+        if args.pausa:
+            time.sleep(args.pausa)
+
+    print(f"listo: {total} cotizaciones en {time.perf_counter() - inicio:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""Prueba de carga de los handlers de bot.py.
+
+Arma la Application real con bot.construir_app(), pero con la API de
+Telegram falsa (fake_telegram.py) y Supabase sustituido por SQLite
+(fake_supabase.py). Cada usuario sintético recorre el flujo completo:
+
+    /start -> Datos de vuelo -> texto -> foto (cotización) -> [monto desde
+    el dashboard] -> Enviar Pago -> ID -> foto (comprobante) -> admin confirma
+
+Los updates pasan por el ProcesadorPorUsuario igual que en producción,
+así que la latencia medida incluye la espera por el límite de updates
+concurrentes. Reporta p50/p95/p99 por tipo de paso y updates/segundo.
+
+    python bench/bench_bot.py --usuarios 500 --rondas 2 --db-ms 20 --api-ms 40
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import math
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+os.environ.setdefault("SUPABASE_KEY", "bench.bench.bench")
+os.environ["ESTADO_BACKEND"] = "memoria"
+os.environ.pop("WEBHOOK_URL", None)
+
+from telegram import Update  # noqa: E402
+
+import bot  # noqa: E402
+import fotos  # noqa: E402
+from fake_supabase import SupabaseSQLite  # noqa: E402
+from fake_telegram import FakeBotAPI  # noqa: E402
+
+logging.getLogger().setLevel(logging.WARNING)
+
+USUARIO_BASE = 100000
+_update_ids = itertools.count(1)
+_mensaje_ids = itertools.count(1)
+
+
+# --- UPDATES SINTÉTICOS ---
+
+def _usuario(uid: int) -> dict:
+    return {"id": uid, "is_bot": False, "first_name": "Bench", "username": f"u{uid}"}
+
+
+def _mensaje(uid: int, **extra) -> dict:
+    msg = {
+        "message_id": next(_mensaje_ids),
+        "date": int(time.time()),
+        "chat": {"id": uid, "type": "private"},
+        "from": _usuario(uid),
+    }
+    msg.update(extra)
+    return msg
+
+
+def texto(uid: int, t: str) -> dict:
+    return {"update_id": next(_update_ids), "message": _mensaje(uid, text=t)}
+
+
+def comando(uid: int, cmd: str) -> dict:
+    return {
+        "update_id": next(_update_ids),
+        "message": _mensaje(uid, text=cmd, entities=[{"type": "bot_command", "offset": 0, "length": len(cmd)}]),
+    }
+
+
+def foto(uid: int) -> dict:
+    n = next(_mensaje_ids)
+    # los tamaños que manda Telegram para una foto: miniatura, media, grande
+    tamanos = [
+        {"file_id": f"foto-{uid}-{n}-{ancho}", "file_unique_id": f"fu{uid}{n}{ancho}", "width": ancho, "height": ancho * 3 // 4}
+        for ancho in (90, 320, 1280)
+    ]
+    return {"update_id": next(_update_ids), "message": _mensaje(uid, photo=tamanos)}
+
+
+def confirmar_pago(admin: int, v_id) -> dict:
+    return {
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_mensaje_ids)),
+            "from": _usuario(admin),
+            "chat_instance": "bench",
+            "data": f"conf_pago_{v_id}",
+            "message": _mensaje(admin, photo=[{"file_id": "c", "file_unique_id": "c", "width": 1, "height": 1}],
+                                caption="💰 COMPROBANTE DE PAGO RECIBIDO"),
+        },
+    }
+
+
+# --- CARGA ---
+
+class Medidor:
+    def __init__(self):
+        self.tiempos = defaultdict(list)  # paso -> [segundos]
+        self.errores = 0
+
+    def resumen(self):
+        todos = [t for ts in self.tiempos.values() for t in ts]
+        return list(self.tiempos.items()) + [("TOTAL", todos)]
+
+
+def percentil(valores: list, p: float) -> float:
+    if not valores:
+        return 0.0
+    orden = sorted(valores)
+    return orden[max(0, math.ceil(p / 100 * len(orden)) - 1)]
+
+
+async def enviar(app, medidor: Medidor, paso: str, data: dict):
+    update = Update.de_json(data, app.bot)
+    inicio = time.perf_counter()
+    await app.update_processor.process_update(update, app.process_update(update))
+    medidor.tiempos[paso].append(time.perf_counter() - inicio)
+
+
+async def flujo_usuario(app, db: SupabaseSQLite, medidor: Medidor, uid: int, rondas: int):
+    for _ in range(rondas):
+        await enviar(app, medidor, "start", comando(uid, "/start"))
+        await enviar(app, medidor, "menu", texto(uid, "📝 Datos de vuelo"))
+        await enviar(app, medidor, "datos_vuelo", texto(uid, f"CDMX a Cancún el 25-12-2025 usuario {uid}"))
+        await enviar(app, medidor, "foto_cotizacion", foto(uid))
+
+        filas = db.ejecutar(
+            "select id from cotizaciones where user_id = ? order by id desc limit 1", (str(uid),)
+        )
+        if not filas:
+            medidor.errores += 1
+            return
+        v_id = filas[0][0]
+        # lo que haría el admin desde el dashboard (no se mide)
+        db.ejecutar("update cotizaciones set monto = ?, estado = ? where id = ?", ("5633.00", "Cotizado", v_id))
+
+        await enviar(app, medidor, "menu", texto(uid, "📸 Enviar Pago"))
+        await enviar(app, medidor, "id_pago", texto(uid, str(v_id)))
+        await enviar(app, medidor, "foto_comprobante", foto(uid))
+        await enviar(app, medidor, "admin_confirma", confirmar_pago(bot.ADMIN_CHAT_ID, v_id))
+
+
+async def correr(args):
+    db = SupabaseSQLite(latencia_ms=args.db_ms)
+    bot.supabase = db
+    if args.fotos:
+        bot.almacen_fotos = fotos.AlmacenFotosLocal(tempfile.mkdtemp(prefix="bench-fotos-"))
+    app = bot.construir_app(request_factory=lambda: FakeBotAPI(args.api_ms))
+    medidor = Medidor()
+
+    async def contar_error(update, context):
+        medidor.errores += 1
+        if medidor.errores <= 5:
+            print(f"error en handler: {context.error!r}", file=sys.stderr)
+
+    app.add_error_handler(contar_error)
+
+    limite = asyncio.Semaphore(args.concurrencia)
+
+    async def usuario(uid):
+        async with limite:
+            await flujo_usuario(app, db, medidor, uid, args.rondas)
+
+    async with app:
+        inicio = time.perf_counter()
+        await asyncio.gather(*(usuario(USUARIO_BASE + i) for i in range(args.usuarios)))
+        duracion = time.perf_counter() - inicio
+
+    confirmados = db.ejecutar("select count(*) from cotizaciones where estado = 'Pago Confirmado'")[0][0]
+    return medidor, duracion, db.consultas, confirmados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--usuarios", type=int, default=200)
+    parser.add_argument("--rondas", type=int, default=1, help="veces que cada usuario repite el flujo")
+    parser.add_argument("--concurrencia", type=int, default=100, help="usuarios activos a la vez")
+    parser.add_argument("--db-ms", type=float, default=0.0, help="latencia simulada por consulta a Supabase")
+    parser.add_argument("--api-ms", type=float, default=0.0, help="latencia simulada por llamada a Telegram")
+    parser.add_argument("--fotos", action="store_true", help="descarga y guarda las fotos (fotos.py) en una carpeta temporal")
+    args = parser.parse_args()
+
+    medidor, duracion, consultas, confirmados = asyncio.run(correr(args))
+
+    total = sum(len(ts) for ts in medidor.tiempos.values())
+    print(
+        f"{args.usuarios} usuarios x {args.rondas} ronda(s), concurrencia {args.concurrencia}, "
+        f"db {args.db_ms} ms, api {args.api_ms} ms, "
+        f"DB_MAX_CONCURRENCIA={bot.DB_MAX_CONCURRENCIA}, MAX_UPDATES_CONCURRENTES={bot.MAX_UPDATES_CONCURRENTES}"
+    )
+    print(f"{'paso':<18} {'n':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for paso, ts in medidor.resumen():
+        print(
+            f"{paso:<18} {len(ts):>7} {percentil(ts, 50) * 1000:>9.2f} {percentil(ts, 95) * 1000:>9.2f} "
+            f"{percentil(ts, 99) * 1000:>9.2f} {max(ts, default=0) * 1000:>9.2f}"
+        )
+    print(f"\n{total} updates en {duracion:.2f}s -> {total / duracion:.0f} updates/s")
+    print(f"consultas a Supabase: {consultas} ({consultas / max(total, 1):.2f} por update)")
+    print(f"llamadas a Telegram: {sum(FakeBotAPI.llamadas.values())} {dict(FakeBotAPI.llamadas)}")
+    print(f"pagos confirmados: {confirmados}/{args.usuarios * args.rondas}, errores: {medidor.errores}")
+
+
+if __name__ == "__main__":
+    main()
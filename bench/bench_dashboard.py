@@ -0,0 +1,294 @@
+"""Benchmark y perfilado de las rutas del dashboard.
+
+Siembra una base SQLite local (fake_supabase.py) con N cotizaciones y sus
+filas de workspace, la conecta en lugar de Supabase y golpea cada ruta con
+varios clientes concurrentes (Flask test client, un hilo por cliente, como
+los hilos de gunicorn). Por ruta reporta latencia p50/p95/p99, consultas
+por request, tiempo en DB, tiempo de render de la plantilla y bytes.
+
+    python bench/bench_dashboard.py --filas 1000 100000 1000000 --clientes 8
+    python bench/bench_dashboard.py --filas 100000 --rutas workspace historial --perfil cprofile
+    python bench/bench_dashboard.py --filas 100000 --db-ms 30 --replica
+
+Con --replica las páginas leen de la réplica local (dashboard/replica.py),
+sincronizada una vez desde la base sembrada antes de medir.
+
+Con --perfil se guarda además un perfil por ruta y volumen en --salida
+(cProfile .prof para snakeviz/pstats, o HTML de pyinstrument si está instalado).
+"""
+import argparse
+import cProfile
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+
+RAIZ = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, os.path.join(RAIZ, "dashboard"))
+
+_tmp = tempfile.mkdtemp(prefix="bench_dashboard_")
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+os.environ.setdefault("SUPABASE_KEY", "bench.bench.bench")
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+os.environ["OUTBOX_DB"] = os.path.join(_tmp, "outbox.db")
+os.environ["OUTBOX_HILOS"] = "0"
+os.environ["REALTIME_ACTIVO"] = "0"
+
+from flask import before_render_template, template_rendered  # noqa: E402
+
+import app_dashboard as dash  # noqa: E402
+from fake_supabase import SupabaseSQLite  # noqa: E402
+from replica import Replica  # noqa: E402
+
+ESTADOS = [
+    ("Esperando atención", 0.05),
+    ("Cotizado", 0.10),
+    ("Esperando confirmación de pago", 0.03),
+    ("Pago Confirmado", 0.05),
+    ("QR Enviados", 0.77),
+]
+CIUDADES = ["CDMX", "Cancún", "Monterrey", "Guadalajara", "Tijuana", "Mérida", "Madrid", "Bogotá"]
+ETIQUETAS = ["declinado", "ban", "aprobado", "riesgoso"]
+
+
+# --- SEMILLA ---
+
+def sembrar(db: SupabaseSQLite, filas: int, pct_workspace: float, seed: int = 42) -> dict:
+    """Llena cotizaciones y workspace; devuelve datos útiles para armar URLs."""
+    rng = random.Random(seed)
+    usuarios = max(1, filas // 5)
+    hoy = date.today()
+    ahora = datetime.now(timezone.utc)
+    pesos = [p for _, p in ESTADOS]
+    nombres = [e for e, _ in ESTADOS]
+
+    def cotizaciones():
+        for i in range(filas):
+            uid = 100000 + int(rng.paretovariate(1.2)) % usuarios  # unos pocos usuarios con muchas filas
+            estado = rng.choices(nombres, pesos)[0]
+            fecha = hoy + timedelta(days=rng.randint(-180, 180))
+            total = rng.randint(1500, 25000)
+            origen, destino = rng.sample(CIUDADES, 2)
+            creado = ahora - timedelta(seconds=(filas - i) * 60 + rng.random())
+            yield (
+                creado.isoformat(),
+                str(uid),
+                f"u{uid}",
+                f"{origen} a {destino} el {fecha:%d-%m-%Y}. Total: ${total:,}.00 MXN",
+                estado,
+                None if estado == "Esperando atención" else f"{total * 0.6:.2f}",
+                fecha.isoformat(),
+                float(total),
+                "MXN",
+                origen,
+                destino,
+            )
+
+    with db.lock:
+        db.conn.execute("begin")
+        db.conn.executemany(
+            "insert into cotizaciones (created_at, user_id, username, pedido_completo, estado, monto, fecha, "
+            "total_vuelo, moneda, origen, destino, parseado) values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)",
+            cotizaciones(),
+        )
+        db.conn.execute(
+            "insert into workspace (cotizacion_id, user_id, username, etiqueta, notas) "
+            "select id, user_id, username, ?, 'nota de prueba' from cotizaciones "
+            "where abs(random()) % 1000 < ?",
+            (rng.choice(ETIQUETAS), int(pct_workspace * 1000)),
+        )
+        # Lo que en Postgres mantiene el trigger de migrations/0007
+        db.conn.create_function("normalizar", 1, lambda t: " ".join(dash.terminos_busqueda(t)))
+        db.conn.execute(
+            "update cotizaciones set busqueda = normalizar(id || ' ' || username || ' ' || pedido_completo || ' ' || "
+            "coalesce((select notas from workspace w where w.cotizacion_id = cotizaciones.id), ''))"
+        )
+        db.conn.execute("commit")
+        db.conn.execute("analyze")
+
+    # resumen_general lo mantienen triggers en Postgres (migrations/0002):
+    # aquí se calcula una vez y la rpc lo devuelve sin recorrer la tabla.
+    resumen = db.ejecutar(
+        "select count(distinct user_id), coalesce(sum(case when estado in ('Pago Confirmado', 'QR Enviados') "
+        "then cast(monto as real) else 0 end), 0) from cotizaciones"
+    )[0]
+    db.registrar_rpc(
+        "resumen_general",
+        lambda db: [{"usuarios_unicos": resumen[0], "total_recaudado": resumen[1]}],
+    )
+
+    usuario_top = db.ejecutar(
+        "select user_id from cotizaciones group by user_id order by count(*) desc limit 1"
+    )[0][0]
+    return {"filas": filas, "usuario_top": usuario_top}
+
+
+# --- RUTAS ---
+
+RUTAS = {
+    "general": lambda rng, d: "/",
+    "por_cotizar": lambda rng, d: "/por-cotizar",
+    "validar_pagos": lambda rng, d: "/validar-pagos",
+    "workspace": lambda rng, d: "/workspace",
+    "historial": lambda rng, d: "/historial",
+    "historial_usuario": lambda rng, d: f"/historial/usuario/{d['usuario_top']}",
+    "proximos_vuelos": lambda rng, d: "/proximos-vuelos",
+    "vuelo_detalle": lambda rng, d: f"/vuelo/{rng.randint(1, d['filas'])}",
+    "buscar": lambda rng, d: f"/buscar?q={rng.choice(CIUDADES)[:4]}",
+}
+
+
+# --- MEDICIÓN ---
+
+_local = threading.local()
+
+
+def _antes_render(sender, template, context, **extra):
+    _local.inicio_render = time.perf_counter()
+
+
+def _despues_render(sender, template, context, **extra):
+    _local.render = getattr(_local, "render", 0.0) + time.perf_counter() - _local.inicio_render
+
+
+before_render_template.connect(_antes_render, dash.app)
+template_rendered.connect(_despues_render, dash.app)
+
+
+def percentil(valores: list, p: float) -> float:
+    if not valores:
+        return 0.0
+    orden = sorted(valores)
+    return orden[max(0, math.ceil(p / 100 * len(orden)) - 1)]
+
+
+def un_request(db: SupabaseSQLite, url: str) -> dict:
+    cliente = getattr(_local, "cliente", None)
+    if cliente is None:
+        cliente = _local.cliente = dash.app.test_client()
+    db.medicion_hilo()
+    _local.render = 0.0
+
+    inicio = time.perf_counter()
+    resp = cliente.get(url)
+    cuerpo = resp.get_data()
+    latencia = time.perf_counter() - inicio
+
+    consultas, segundos_db = db.medicion_hilo()
+    return {
+        "latencia": latencia,
+        "consultas": consultas,
+        "db": segundos_db,
+        "render": _local.render,
+        "bytes": len(cuerpo),
+        "status": resp.status_code,
+    }
+
+
+def medir_ruta(db, datos: dict, ruta: str, requests: int, clientes: int) -> list:
+    dash.cache_cotizaciones.limpiar()
+    dash.cache_workspace.limpiar()
+    rng = random.Random(ruta)
+    urls = [RUTAS[ruta](rng, datos) for _ in range(requests)]
+    with ThreadPoolExecutor(max_workers=clientes) as pool:
+        return list(pool.map(lambda url: un_request(db, url), urls))
+
+
+def perfilar_ruta(db, datos: dict, ruta: str, requests: int, modo: str, salida: str):
+    rng = random.Random(ruta)
+    urls = [RUTAS[ruta](rng, datos) for _ in range(requests)]
+    cliente = dash.app.test_client()
+    base = os.path.join(salida, f"{ruta}_{datos['filas']}")
+
+    if modo == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            sys.exit("pyinstrument no está instalado: pip install pyinstrument (o usa --perfil cprofile)")
+
+        perfil = Profiler()
+        perfil.start()
+        for url in urls:
+            cliente.get(url)
+        perfil.stop()
+        with open(base + ".html", "w", encoding="utf-8") as f:
+            f.write(perfil.output_html())
+        return base + ".html"
+
+    perfil = cProfile.Profile()
+    perfil.enable()
+    for url in urls:
+        cliente.get(url)
+    perfil.disable()
+    perfil.dump_stats(base + ".prof")
+    return base + ".prof"
+
+
+def imprimir(ruta: str, res: list):
+    lat = [r["latencia"] * 1000 for r in res]
+    errores = sum(r["status"] != 200 for r in res)
+    print(
+        f"{ruta:<18} {len(res):>5} {percentil(lat, 50):>8.1f} {percentil(lat, 95):>8.1f} {percentil(lat, 99):>8.1f} "
+        f"{sum(r['consultas'] for r in res) / len(res):>6.1f} "
+        f"{percentil([r['db'] * 1000 for r in res], 50):>8.1f} "
+        f"{percentil([r['render'] * 1000 for r in res], 50):>9.1f} "
+        f"{sum(r['bytes'] for r in res) / len(res) / 1024:>8.1f} {errores:>5}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, nargs="+", default=[1000, 10000], help="cotizaciones a sembrar (una corrida por valor)")
+    parser.add_argument("--workspace", type=float, default=0.3, help="fracción de cotizaciones con fila en workspace")
+    parser.add_argument("--rutas", nargs="+", choices=sorted(RUTAS), default=list(RUTAS))
+    parser.add_argument("--requests", type=int, default=100, help="requests por ruta")
+    parser.add_argument("--clientes", type=int, default=8, help="clientes concurrentes")
+    parser.add_argument("--db-ms", type=float, default=0.0, help="latencia simulada por consulta a Supabase")
+    parser.add_argument("--replica", action="store_true", help="leer de la réplica local en SQLite")
+    parser.add_argument("--perfil", choices=["cprofile", "pyinstrument"])
+    parser.add_argument("--perfil-requests", type=int, default=20)
+    parser.add_argument("--salida", default=os.path.join(os.path.dirname(__file__), "perfiles"))
+    args = parser.parse_args()
+
+    if args.perfil:
+        os.makedirs(args.salida, exist_ok=True)
+
+    for filas in args.filas:
+        db = SupabaseSQLite(os.path.join(_tmp, f"cotizaciones_{filas}.db"), latencia_ms=args.db_ms)
+        inicio = time.perf_counter()
+        datos = sembrar(db, filas, args.workspace)
+        semilla = time.perf_counter() - inicio
+        dash.supabase = db
+        # sin Realtime, pero nadie escribe mientras se mide: las cachés se
+        # usan como con el canal suscrito en producción
+        dash.difusor.marcar_suscrito(True)
+        copia = ""
+        if args.replica:
+            inicio = time.perf_counter()
+            dash.replica = Replica(os.path.join(_tmp, f"replica_{filas}.db"), db)
+            dash.replica.sincronizar()
+            copia = f", réplica {time.perf_counter() - inicio:.1f}s"
+        print(
+            f"\n== {filas} cotizaciones (semilla {semilla:.1f}s{copia}), "
+            f"{args.clientes} clientes, {args.requests} req/ruta, db {args.db_ms} ms =="
+        )
+        print(
+            f"{'ruta':<18} {'n':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'q/req':>6} "
+            f"{'db ms':>8} {'render ms':>9} {'KB/resp':>8} {'err':>5}"
+        )
+        for ruta in args.rutas:
+            imprimir(ruta, medir_ruta(db, datos, ruta, args.requests, args.clientes))
+
+        if args.perfil:
+            for ruta in args.rutas:
+                archivo = perfilar_ruta(db, datos, ruta, args.perfil_requests, args.perfil, args.salida)
+                print(f"perfil: {archivo}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Benchmark del reparto de updates entre procesos (shards.py).
+
+Reparte con Ingreso los updates de muchos usuarios a N procesos que corren
+el worker real, bot.ejecutar_worker(), con los handlers de bot.py. Como en
+bench_bot.py, Telegram es la API falsa (fake_telegram.py) y Supabase una
+base SQLite (fake_supabase.py), aquí un archivo compartido por todos los
+workers como lo sería la base real.
+
+Cada usuario repite el flujo /start -> Datos de vuelo -> texto -> foto, que
+crea una cotización. Al final se comprueba que cada usuario tenga todas sus
+cotizaciones y en el orden en que mandó los textos: un update fuera de
+orden rompe la máquina de estados y la cotización no se crea o se cruza.
+
+    python bench/bench_shards.py --workers 1 2 4 --usuarios 500 --rondas 2 --db-ms 5 --api-ms 20
+"""
+import argparse
+import functools
+import logging
+import multiprocessing as mp
+import os
+import re
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+os.environ.setdefault("SUPABASE_KEY", "bench.bench.bench")
+os.environ["ESTADO_BACKEND"] = "memoria"
+os.environ["REALTIME_ACTIVO"] = "0"
+os.environ.pop("WEBHOOK_URL", None)
+
+import bot  # noqa: E402
+from bench_bot import USUARIO_BASE, comando, foto, texto  # noqa: E402
+from fake_supabase import SupabaseSQLite  # noqa: E402
+from fake_telegram import FakeBotAPI  # noqa: E402
+from shards import Ingreso  # noqa: E402
+
+SECUENCIA_RE = re.compile(r"#(\d+)$")
+
+
+def worker_bench(indice: int, cola, resultados, ruta_db: str, db_ms: float, api_ms: float):
+    """Corre en cada proceso: el worker real con Supabase y Telegram falsos."""
+    logging.getLogger().setLevel(logging.WARNING)
+    db = SupabaseSQLite(ruta_db, latencia_ms=db_ms)
+    bot.supabase = db
+    resultados.put(("listo", indice))  # el arranque del proceso no entra en la medición
+    bot.ejecutar_worker(indice, cola, request_factory=functools.partial(FakeBotAPI, api_ms))
+    resultados.put((indice, db.consultas, dict(FakeBotAPI.llamadas)))
+
+
+def generar_updates(n_usuarios: int, rondas: int) -> list:
+    """Los pasos de todos los usuarios intercalados, como llegarían de Telegram."""
+    updates = []
+    for ronda in range(1, rondas + 1):
+        for paso in range(4):
+            for i in range(n_usuarios):
+                uid = USUARIO_BASE + i
+                if paso == 0:
+                    updates.append(comando(uid, "/start"))
+                elif paso == 1:
+                    updates.append(texto(uid, "📝 Datos de vuelo"))
+                elif paso == 2:
+                    updates.append(texto(uid, f"CDMX a Cancún el 25-12-2025 #{ronda}"))
+                else:
+                    updates.append(foto(uid))
+    return updates
+
+
+def verificar(db: SupabaseSQLite, n_usuarios: int, rondas: int):
+    """(cotizaciones creadas, usuarios con cotizaciones faltantes o fuera de orden)."""
+    por_usuario = defaultdict(list)
+    for user_id, pedido in db.ejecutar("select user_id, pedido_completo from cotizaciones order by id"):
+        m = SECUENCIA_RE.search(pedido or "")
+        por_usuario[user_id].append(int(m.group(1)) if m else -1)
+    esperado = list(range(1, rondas + 1))
+    malos = sum(por_usuario.get(str(USUARIO_BASE + i)) != esperado for i in range(n_usuarios))
+    return sum(len(v) for v in por_usuario.values()), malos
+
+
+def correr(n_workers: int, updates: list, args):
+    ruta_db = os.path.join(tempfile.mkdtemp(prefix="bench-shards-"), "supabase.db")
+    db = SupabaseSQLite(ruta_db)
+    db.ejecutar("pragma journal_mode=wal")  # varios procesos escribiendo a la vez
+
+    resultados = mp.get_context("spawn").Queue()
+    ingreso = Ingreso(n_workers, worker_bench, args=(resultados, ruta_db, args.db_ms, args.api_ms))
+    ingreso.iniciar()
+    for _ in range(n_workers):
+        resultados.get()
+
+    inicio = time.perf_counter()
+    for u in updates:
+        ingreso.despachar(u)
+    ingreso.detener(timeout=600)
+    duracion = time.perf_counter() - inicio
+
+    consultas, llamadas = 0, Counter()
+    for _ in range(n_workers):
+        _, c, ll = resultados.get()
+        consultas += c
+        llamadas.update(ll)
+    creadas, malos = verificar(db, args.usuarios, args.rondas)
+    return duracion, consultas, llamadas, creadas, malos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--usuarios", type=int, default=200)
+    parser.add_argument("--rondas", type=int, default=2, help="veces que cada usuario repite el flujo")
+    parser.add_argument("--db-ms", type=float, default=0.0, help="latencia simulada por consulta a Supabase")
+    parser.add_argument("--api-ms", type=float, default=0.0, help="latencia simulada por llamada a Telegram")
+    args = parser.parse_args()
+
+    updates = generar_updates(args.usuarios, args.rondas)
+    print(
+        f"{len(updates)} updates, {args.usuarios} usuarios x {args.rondas} ronda(s), "
+        f"db {args.db_ms} ms, api {args.api_ms} ms, MAX_UPDATES_CONCURRENTES={bot.MAX_UPDATES_CONCURRENTES}"
+    )
+    print(
+        f"{'workers':>8} {'updates/s':>10} {'segundos':>9} {'speedup':>8} {'q/update':>9} "
+        f"{'api/update':>11} {'cotizaciones':>13} {'usuarios mal':>13}"
+    )
+    base = None
+    esperadas = args.usuarios * args.rondas
+    for n in args.workers:
+        duracion, consultas, llamadas, creadas, malos = correr(n, updates, args)
+        tasa = len(updates) / duracion
+        base = base or tasa
+        print(
+            f"{n:>8} {tasa:>10.0f} {duracion:>9.2f} {tasa / base:>7.2f}x {consultas / len(updates):>9.2f} "
+            f"{sum(llamadas.values()) / len(updates):>11.2f} {f'{creadas}/{esperadas}':>13} {malos:>13}"
+        )
+
+
+if __name__ == "__main__":
+    main()
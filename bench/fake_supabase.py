@@ -0,0 +1,481 @@
+"""Sustituto local de Supabase/PostgREST sobre SQLite para los benchmarks.
+
+Implementa el subconjunto del query builder de supabase-py que usan
+bot.py y el dashboard (select/insert/update/upsert/delete, filtros, or_,
+order, limit, count, rpc y recursos embebidos uno a uno como
+`workspace(etiqueta, notas)`) contra una base SQLite, y cuenta las consultas
+ejecutadas para poder reportar consultas por request.
+"""
+import json
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+AHORA_SQL = "(strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))"
+
+ESQUEMA = {
+    "cotizaciones": {
+        "id": "integer primary key autoincrement",
+        "created_at": f"text not null default {AHORA_SQL}",
+        "user_id": "text",
+        "username": "text",
+        "pedido_completo": "text",
+        "estado": "text",
+        "monto": "text",
+        "fecha": "text",
+        "total_vuelo": "real",
+        "moneda": "text",
+        "origen": "text",
+        "destino": "text",
+        "parseado": "integer not null default 0",
+        "foto_ref": "text",
+        "foto_ref_mini": "text",
+        "comprobante": "text",
+        "comprobante_mini": "text",
+        # En Postgres es tsvector (migrations/0007); aquí el texto normalizado
+        "busqueda": "text",
+        "updated_at": f"text not null default {AHORA_SQL}",
+    },
+    "workspace": {
+        "id": "integer primary key autoincrement",
+        "cotizacion_id": "integer unique",
+        "user_id": "text",
+        "username": "text",
+        "etiqueta": "text",
+        "notas": "text",
+        "updated_at": f"text not null default {AHORA_SQL}",
+    },
+    "conversaciones": {
+        "user_id": "integer primary key",
+        "datos": "text",
+        "actualizado": "text",
+    },
+}
+
+INDICES = [
+    "create index if not exists cot_estado_created on cotizaciones (estado, created_at)",
+    "create index if not exists cot_created_id on cotizaciones (created_at, id)",
+    "create index if not exists cot_fecha on cotizaciones (fecha)",
+    "create index if not exists cot_user_created on cotizaciones (user_id, created_at)",
+    "create index if not exists cot_estado_total on cotizaciones (estado, total_vuelo)",
+    "create index if not exists cot_updated_id on cotizaciones (updated_at, id)",
+]
+
+# Lo que hace el trigger tocar_updated_at() de migrations/0012
+TRIGGER_UPDATED_AT = (
+    "create trigger if not exists {tabla}_updated_at after update on {tabla} "
+    "when new.updated_at = old.updated_at begin "
+    "update {tabla} set updated_at = " + AHORA_SQL + " where rowid = new.rowid; end"
+)
+
+# Recursos embebidos: (tabla, relación) -> (columna propia, columna de la relación).
+# Uno a uno como en PostgREST cuando la FK es única: objeto o None.
+RELACIONES = {
+    ("cotizaciones", "workspace"): ("id", "cotizacion_id"),
+}
+
+OPERADORES = {"eq": "=", "neq": "<>", "gt": ">", "gte": ">=", "lt": "<", "lte": "<=", "like": "like", "ilike": "like"}
+
+
+class Respuesta:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class SupabaseSQLite:
+    def __init__(self, ruta: str = ":memory:", esquema: dict = None, indices: bool = True, latencia_ms: float = 0.0):
+        self.esquema = esquema or ESQUEMA
+        # ida y vuelta simulada a PostgREST (fuera del lock, como la red real)
+        self.latencia = latencia_ms / 1000.0
+        self.conn = sqlite3.connect(ruta, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.RLock()
+        self.rpcs = {"transicionar": rpc_transicionar, "transicionar_lote": rpc_transicionar_lote}
+        self.consultas = 0
+        # hilo -> [consultas, segundos] del request en curso. Se cuenta en el
+        # hilo que armó la consulta, aunque la ejecute otro (consultas en paralelo)
+        self._por_hilo = {}
+        for tabla, columnas in self.esquema.items():
+            cols = ", ".join(f"{c} {tipo}" for c, tipo in columnas.items())
+            self.conn.execute(f"create table if not exists {tabla} ({cols})")
+            if "updated_at" in columnas:
+                self.conn.execute(TRIGGER_UPDATED_AT.format(tabla=tabla))
+        if indices:
+            for sql in INDICES:
+                self.conn.execute(sql)
+
+    def table(self, nombre: str) -> "Consulta":
+        return Consulta(self, nombre)
+
+    def registrar_rpc(self, nombre: str, fn):
+        """`fn(db, **params)` devuelve lo que PostgREST devolvería en .data."""
+        self.rpcs[nombre] = fn
+
+    def rpc(self, nombre: str, params: dict = None):
+        db = self
+        hilo = threading.get_ident()
+
+        class _Rpc:
+            def execute(self_inner):
+                inicio = time.perf_counter()
+                db.esperar_red()
+                with db.lock:
+                    res = Respuesta(db.rpcs[nombre](db, **(params or {})))
+                db.contar(time.perf_counter() - inicio, hilo)
+                return res
+
+        return _Rpc()
+
+    def contar(self, segundos: float, hilo: int = None):
+        with self.lock:
+            self.consultas += 1
+            medicion = self._por_hilo.setdefault(hilo or threading.get_ident(), [0, 0.0])
+            medicion[0] += 1
+            medicion[1] += segundos
+
+    def medicion_hilo(self, reiniciar: bool = True):
+        """(consultas, segundos en DB) del hilo actual desde el último reinicio."""
+        with self.lock:
+            if reiniciar:
+                return tuple(self._por_hilo.pop(threading.get_ident(), (0, 0.0)))
+            return tuple(self._por_hilo.get(threading.get_ident(), (0, 0.0)))
+
+    def esperar_red(self):
+        if self.latencia:
+            time.sleep(self.latencia)
+
+    def ejecutar(self, sql: str, args=()):
+        with self.lock:
+            return self.conn.execute(sql, args).fetchall()
+
+
+class Consulta:
+    def __init__(self, db: SupabaseSQLite, tabla: str):
+        self.db = db
+        self.tabla = tabla
+        self.hilo = threading.get_ident()
+        self.columnas = list(db.esquema[tabla])
+        self.op = "select"
+        self.cols = "*"
+        self.valores = None
+        self.conflicto = None
+        self.where = []
+        self.args = []
+        self.orden = []
+        self.limite = None
+        self.contar = False
+        self.solo_conteo = False
+        self.una = False
+
+    # --- operación ---
+
+    def select(self, cols: str = "*", count=None, head=False):
+        self.op, self.cols = "select", cols
+        self.contar = count is not None
+        self.solo_conteo = head
+        return self
+
+    def insert(self, valores):
+        self.op, self.valores = "insert", valores
+        return self
+
+    def upsert(self, valores, on_conflict: str = None):
+        self.op, self.valores, self.conflicto = "upsert", valores, on_conflict
+        return self
+
+    def update(self, valores: dict):
+        self.op, self.valores = "update", valores
+        return self
+
+    def delete(self):
+        self.op = "delete"
+        return self
+
+    # --- filtros ---
+
+    def _col(self, col: str) -> str:
+        if col not in self.columnas:
+            raise ValueError(f"columna desconocida {self.tabla}.{col}")
+        return col
+
+    def _filtro(self, col, op, valor):
+        self.where.append(f"{self._col(col)} {OPERADORES[op]} ?")
+        self.args.append(_valor(valor))
+        return self
+
+    def eq(self, col, valor):
+        return self._filtro(col, "eq", valor)
+
+    def neq(self, col, valor):
+        return self._filtro(col, "neq", valor)
+
+    def gt(self, col, valor):
+        return self._filtro(col, "gt", valor)
+
+    def gte(self, col, valor):
+        return self._filtro(col, "gte", valor)
+
+    def lt(self, col, valor):
+        return self._filtro(col, "lt", valor)
+
+    def lte(self, col, valor):
+        return self._filtro(col, "lte", valor)
+
+    def like(self, col, patron):
+        return self._filtro(col, "like", patron.replace("*", "%"))
+
+    def ilike(self, col, patron):
+        return self._filtro(col, "ilike", patron.replace("*", "%"))
+
+    def is_(self, col, valor):
+        self.where.append(f"{self._col(col)} is {'null' if valor in (None, 'null') else '?'}")
+        if valor not in (None, "null"):
+            self.args.append(_valor(valor))
+        return self
+
+    def in_(self, col, valores):
+        valores = list(valores)
+        if not valores:
+            self.where.append("0")
+            return self
+        self.where.append(f"{self._col(col)} in ({', '.join('?' * len(valores))})")
+        self.args.extend(_valor(v) for v in valores)
+        return self
+
+    def filter(self, col, operador: str, valor):
+        # Solo fts(...) con términos prefijo "a:* & b:*": LIKE por término
+        if not operador.startswith("fts"):
+            return self._filtro(col, operador, valor)
+        for termino in valor.split("&"):
+            termino = termino.strip().removesuffix(":*")
+            self.where.append(f"(' ' || {self._col(col)}) like ?")
+            self.args.append(f"% {termino}%")
+        return self
+
+    def or_(self, expr: str):
+        sql, args = self._or_sql(expr, "or")
+        self.where.append(sql)
+        self.args.extend(args)
+        return self
+
+    def _or_sql(self, expr: str, union: str):
+        partes, args = [], []
+        for cond in _partir(expr):
+            m = re.match(r"^(and|or)\((.*)\)$", cond)
+            if m:
+                sql, a = self._or_sql(m.group(2), m.group(1))
+                partes.append(sql)
+                args.extend(a)
+                continue
+            col, op, valor = cond.split(".", 2)
+            if op == "in":
+                vals = [_sin_comillas(v) for v in _partir(valor.strip("()"))]
+                partes.append(f"{self._col(col)} in ({', '.join('?' * len(vals))})")
+                args.extend(vals)
+            elif op == "is":
+                partes.append(f"{self._col(col)} is null")
+            else:
+                partes.append(f"{self._col(col)} {OPERADORES[op]} ?")
+                args.append(_sin_comillas(valor))
+        return "(" + f" {union} ".join(partes) + ")", args
+
+    def order(self, col, desc=False, nullsfirst=False):
+        # mismo lugar para los NULL que Postgres por defecto
+        nulos = "first" if (desc or nullsfirst) else "last"
+        self.orden.append(f"{self._col(col)} {'desc' if desc else 'asc'} nulls {nulos}")
+        return self
+
+    def limit(self, n: int):
+        self.limite = int(n)
+        return self
+
+    def single(self):
+        self.una = True
+        return self
+
+    def maybe_single(self):
+        return self.single()
+
+    # --- ejecución ---
+
+    def _where_sql(self):
+        return (" where " + " and ".join(self.where)) if self.where else ""
+
+    def _proyeccion(self):
+        if self.cols.strip() == "*":
+            return self.columnas, []
+        cols, embebidos = [], []
+        for c in _partir(self.cols):
+            m = re.fullmatch(r"(\w+)\((.*)\)", c, re.S)
+            if not m:
+                cols.append(self._col(c))
+                continue
+            relacion, sub = m.group(1), m.group(2)
+            propia, ajena = RELACIONES[(self.tabla, relacion)]
+            sub_cols = list(self.db.esquema[relacion]) if sub.strip() == "*" else _partir(sub)
+            pares = ", ".join(f"'{c}', r.{c}" for c in sub_cols)
+            cols.append(
+                f"(select json_object({pares}) from {relacion} r "
+                f"where r.{ajena} = {self.tabla}.{propia}) as {relacion}"
+            )
+            embebidos.append(relacion)
+        return cols, embebidos
+
+    def execute(self) -> Respuesta:
+        inicio = time.perf_counter()
+        self.db.esperar_red()
+        with self.db.lock:
+            res = getattr(self, f"_exec_{self.op}")()
+        self.db.contar(time.perf_counter() - inicio, self.hilo)
+        return res
+
+    def _exec_select(self):
+        cols, embebidos = self._proyeccion()
+        where = self._where_sql()
+        count = None
+        if self.contar:
+            count = self.db.conn.execute(
+                f"select count(*) from {self.tabla}{where}", self.args
+            ).fetchone()[0]
+            if self.solo_conteo:
+                return Respuesta([], count)
+
+        sql = f"select {', '.join(cols)} from {self.tabla}{where}"
+        if self.orden:
+            sql += " order by " + ", ".join(self.orden)
+        if self.limite is not None:
+            sql += f" limit {self.limite}"
+        filas = [dict(f) for f in self.db.conn.execute(sql, self.args)]
+        for f in filas:
+            for relacion in embebidos:
+                f[relacion] = json.loads(f[relacion]) if f[relacion] else None
+        if self.una:
+            return Respuesta(filas[0] if filas else None, count)
+        return Respuesta(filas, count)
+
+    def _filas_valores(self):
+        return self.valores if isinstance(self.valores, list) else [self.valores]
+
+    def _exec_insert(self, conflicto: str = None):
+        ids = []
+        for fila in self._filas_valores():
+            cols = [self._col(c) for c in fila]
+            sql = (
+                f"insert into {self.tabla} ({', '.join(cols)}) "
+                f"values ({', '.join('?' * len(cols))})"
+            )
+            if conflicto:
+                sets = ", ".join(f"{c} = excluded.{c}" for c in cols if c != conflicto)
+                sql += f" on conflict ({conflicto}) do update set {sets}"
+            cur = self.db.conn.execute(sql, [_valor(fila[c]) for c in cols])
+            ids.append(fila.get(conflicto) if conflicto else cur.lastrowid)
+
+        clave = conflicto or "rowid"
+        marcas = ", ".join("?" * len(ids))
+        filas = self.db.conn.execute(
+            f"select * from {self.tabla} where {clave} in ({marcas})", ids
+        ).fetchall()
+        return Respuesta([dict(f) for f in filas])
+
+    def _exec_upsert(self):
+        return self._exec_insert(conflicto=self.conflicto)
+
+    def _exec_update(self):
+        where = self._where_sql()
+        rowids = [r[0] for r in self.db.conn.execute(f"select rowid from {self.tabla}{where}", self.args)]
+        if not rowids:
+            return Respuesta([])
+        sets = ", ".join(f"{self._col(c)} = ?" for c in self.valores)
+        marcas = ", ".join("?" * len(rowids))
+        self.db.conn.execute(
+            f"update {self.tabla} set {sets} where rowid in ({marcas})",
+            [_valor(v) for v in self.valores.values()] + rowids,
+        )
+        filas = self.db.conn.execute(
+            f"select * from {self.tabla} where rowid in ({marcas})", rowids
+        ).fetchall()
+        return Respuesta([dict(f) for f in filas])
+
+    def _exec_delete(self):
+        where = self._where_sql()
+        filas = [dict(f) for f in self.db.conn.execute(f"select * from {self.tabla}{where}", self.args)]
+        self.db.conn.execute(f"delete from {self.tabla}{where}", self.args)
+        return Respuesta(filas)
+
+
+# --- RPCS DE LAS MIGRACIONES ---
+
+# transiciones_permitidas de migrations/0010
+TRANSICIONES = {
+    ("Esperando atención", "Cotizado"),
+    ("Cotizado", "Cotizado"),
+    ("Cotizado", "Esperando confirmación de pago"),
+    ("Esperando confirmación de pago", "Esperando confirmación de pago"),
+    ("Esperando confirmación de pago", "Pago Confirmado"),
+    ("Pago Confirmado", "QR Enviados"),
+}
+CAMPOS_TRANSICION = ("monto", "comprobante", "comprobante_mini")
+
+
+def rpc_transicionar(db, p_id, p_hacia, p_desde=None, p_campos=None):
+    """Misma respuesta que transicionar() en Postgres; corre con db.lock tomado."""
+    fila = db.conn.execute("select * from cotizaciones where id = ?", (p_id,)).fetchone()
+    if fila is None:
+        return {"ok": False, "error": "no_existe"}
+    actual = dict(fila)
+    if (p_desde is not None and actual["estado"] != p_desde) or (actual["estado"], p_hacia) not in TRANSICIONES:
+        return {"ok": False, "error": "estado", "estado": actual["estado"], "fila": actual}
+
+    campos = {"estado": p_hacia, **{c: v for c, v in (p_campos or {}).items() if c in CAMPOS_TRANSICION}}
+    db.conn.execute(
+        f"update cotizaciones set {', '.join(f'{c} = ?' for c in campos)} where id = ?",
+        [*campos.values(), p_id],
+    )
+    nueva = dict(db.conn.execute("select * from cotizaciones where id = ?", (p_id,)).fetchone())
+    return {"ok": True, "desde": actual["estado"], "fila": nueva}
+
+
+def rpc_transicionar_lote(db, p_hacia, p_items, p_desde=None):
+    """transicionar_lote() de migrations/0013: una respuesta por item, con su id."""
+    return [
+        {**rpc_transicionar(db, i["id"], p_hacia, p_desde, i.get("campos")), "id": i["id"]}
+        for i in sorted(p_items, key=lambda i: i["id"])
+    ]
+
+
+def _valor(v):
+    if isinstance(v, (dict, list)):
+        return json.dumps(v)
+    if isinstance(v, datetime):
+        return v.astimezone(timezone.utc).isoformat()
+    return v
+
+
+def _sin_comillas(v: str) -> str:
+    v = v.strip()
+    if len(v) >= 2 and v[0] == v[-1] == '"':
+        return v[1:-1]
+    return v
+
+
+def _partir(expr: str) -> list:
+    """Parte por comas de primer nivel (respeta paréntesis y comillas)."""
+    partes, actual, nivel, comillas = [], "", 0, False
+    for ch in expr:
+        if ch == '"':
+            comillas = not comillas
+        elif not comillas and ch == "(":
+            nivel += 1
+        elif not comillas and ch == ")":
+            nivel -= 1
+        elif not comillas and nivel == 0 and ch == ",":
+            partes.append(actual)
+            actual = ""
+            continue
+        actual += ch
+    if actual:
+        partes.append(actual)
+    return [p.strip() for p in partes]
@@ -0,0 +1,98 @@
+"""API de Telegram falsa, en proceso, para los benchmarks del bot.
+
+Es un BaseRequest de python-telegram-bot: el Bot "envía" sus llamadas aquí
+en vez de a api.telegram.org y recibe respuestas con la forma real
+(Message, User, True). Cuenta llamadas por método y puede simular la
+latencia de red con `latencia_ms`.
+"""
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter
+
+from telegram.request import BaseRequest
+
+BOT_ID = 1
+_mensajes = itertools.count(1)
+
+
+class FakeBotAPI(BaseRequest):
+    llamadas = Counter()  # compartido entre las instancias del mismo proceso
+
+    def __init__(self, latencia_ms: float = 0.0):
+        self.latencia = latencia_ms / 1000.0
+
+    @property
+    def read_timeout(self):
+        return 5.0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        descarga = "/file/bot" in url
+        metodo = "descarga" if descarga else url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        FakeBotAPI.llamadas[metodo] += 1
+        if self.latencia:
+            await asyncio.sleep(self.latencia)
+        if descarga:
+            # contenido distinto por archivo, del tamaño de una foto chica
+            return 200, url.encode() * (20000 // len(url))
+
+        resultado = responder(metodo, params)
+        if resultado is None:
+            cuerpo = {"ok": False, "error_code": 404, "description": f"Not Found: method {metodo}"}
+            return 404, json.dumps(cuerpo).encode()
+        return 200, json.dumps({"ok": True, "result": resultado}).encode()
+
+
+def _mensaje(params: dict, **extra) -> dict:
+    chat_id = params.get("chat_id", 0)
+    try:
+        chat_id = int(chat_id)
+    except (TypeError, ValueError):
+        pass
+    msg = {
+        "message_id": next(_mensajes),
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": {"id": BOT_ID, "is_bot": True, "first_name": "Bench"},
+    }
+    msg.update(extra)
+    return msg
+
+
+def _foto(params: dict) -> list:
+    fid = params.get("photo") if isinstance(params.get("photo"), str) else "foto-bench"
+    return [{"file_id": fid, "file_unique_id": fid[-32:], "width": 640, "height": 480}]
+
+
+def responder(metodo: str, params: dict):
+    if metodo == "getMe":
+        return {
+            "id": BOT_ID, "is_bot": True, "first_name": "Bench", "username": "bench_bot",
+            "can_join_groups": False, "can_read_all_group_messages": False,
+            "supports_inline_queries": False,
+        }
+    if metodo == "sendMessage":
+        return _mensaje(params, text=params.get("text", ""))
+    if metodo == "sendPhoto":
+        return _mensaje(params, photo=_foto(params), caption=params.get("caption", ""))
+    if metodo == "sendMediaGroup":
+        return [_mensaje(params, photo=_foto({})) for _ in params.get("media", [])]
+    if metodo in ("editMessageCaption", "editMessageText"):
+        return _mensaje(params, caption=params.get("caption", ""), text=params.get("text", ""))
+    if metodo == "getFile":
+        fid = params.get("file_id", "")
+        return {"file_id": fid, "file_unique_id": fid[-32:], "file_size": 20000, "file_path": f"photos/{fid}.jpg"}
+    if metodo in ("answerCallbackQuery", "deleteWebhook", "setWebhook", "setMyCommands"):
+        return True
+    if metodo == "getUpdates":
+        return []
+    return None
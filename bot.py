@@ -1,35 +1,75 @@
 import logging
 import os
-import threading
 import asyncio
-import re
-from datetime import datetime
-
-from flask import Flask
-from supabase import create_client, Client
+import queue
+import signal
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.routing import Route
+from supabase import acreate_client, create_client, Client
 from telegram import (
-    Update, InlineKeyboardButton, InlineKeyboardMarkup,
+    Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup,
     ReplyKeyboardMarkup, KeyboardButton, InputMediaPhoto
 )
+from telegram.error import TelegramError
 from telegram.ext import (
     ApplicationBuilder, ContextTypes, CommandHandler,
-    MessageHandler, CallbackQueryHandler, filters
+    MessageHandler, CallbackQueryHandler, filters,
+    BaseUpdateProcessor, TypeHandler,
 )
 
-# --- 1. SERVIDOR KEEP-ALIVE ---
-app_web = Flask('')
-app_web.secret_key = os.getenv(
-    "FLASK_SECRET_KEY",
-    "bf3145e6595577f099e00638d96e4405b24bb0cd17f6908d34b065943b97dd27"
-)
+import fotos
+import metricas
+from pedido import parsear_pedido
+from persistencia import AlmacenSQLite, AlmacenSupabase, PersistenciaConversaciones
+from shards import Ingreso
+
+# --- 1. SERVIDOR HTTP (health check + webhook) ---
+# Corre en el mismo event loop que el bot (uvicorn), sin hilos aparte.
+
+async def home(request: Request):
+    return PlainTextResponse("Sistema Vuelos Pro - Online 🚀")
+
+async def cache_stats(request: Request):
+    return JSONResponse(cache_cotizaciones.estadisticas())
+
+async def metrics(request: Request):
+    cuerpo, tipo = metricas.exponer()
+    return Response(cuerpo, media_type=tipo)
 
-@app_web.route('/')
-def home():
-    return "Sistema Vuelos Pro - Online 🚀"
+async def telegram_webhook(request: Request):
+    """Recibe updates de Telegram y los pasa a `despachar` (cola de la
+    Application o, con BOT_WORKERS > 1, la cola del worker del usuario)."""
+    token = request.headers.get("X-Telegram-Bot-Api-Secret-Token")
+    if token != WEBHOOK_SECRET:
+        return Response(status_code=403)
 
-def run_server():
-    port = int(os.environ.get("PORT", 10000))
-    app_web.run(host='0.0.0.0', port=port)
+    try:
+        data = await request.json()
+    except ValueError:
+        return Response(status_code=400)
+
+    try:
+        await request.app.state.despachar(data)
+    except queue.Full:
+        return Response(status_code=503)  # Telegram lo reintenta
+    return Response()
+
+def crear_servidor_web(despachar, con_cache: bool = True) -> Starlette:
+    rutas = [Route("/", home), Route("/metrics", metrics)]
+    if con_cache:
+        rutas.append(Route("/cache", cache_stats))
+    if WEBHOOK_URL:
+        rutas.append(Route(WEBHOOK_PATH, telegram_webhook, methods=["POST"]))
+    web = Starlette(routes=rutas)
+    web.state.despachar = despachar
+    return web
 
 
 # --- 2. CONFIGURACIÓN ---
@@ -40,9 +80,281 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 SOPORTE_USER = "@TuUsuarioSoporte"
 
+PORT = int(os.environ.get("PORT", 10000))
+# Si WEBHOOK_URL está definida se usa webhook; si no, long polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = "/telegram"
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+
+# Estado de conversación: "sqlite" (un nodo), "supabase" (varias réplicas) o "memoria"
+ESTADO_BACKEND = os.getenv("ESTADO_BACKEND", "sqlite")
+ESTADO_SQLITE = os.getenv("ESTADO_SQLITE", "conversaciones.db")
+ESTADO_TTL = float(os.getenv("ESTADO_TTL", str(24 * 3600)))
+ESTADO_FLUSH_SEG = float(os.getenv("ESTADO_FLUSH_SEG", "5"))
+ESTADO_REFRESCAR = os.getenv("ESTADO_REFRESCAR", "0") == "1"
+
+# Procesos worker; con más de 1 este proceso solo recibe y reparte updates
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
+
+# Máximo de consultas a Supabase en paralelo (hilos del pool)
+DB_MAX_CONCURRENCIA = int(os.getenv("DB_MAX_CONCURRENCIA", "8"))
+# Máximo de updates procesándose a la vez (chats distintos)
+MAX_UPDATES_CONCURRENTES = int(os.getenv("MAX_UPDATES_CONCURRENTES", "64"))
+# Updates recibidos sin terminar de procesar; con más, el webhook responde 503
+COLA_MAX = int(os.getenv("COLA_MAX", "10000"))
+# Caché de cotizaciones por ID (consulta de pago)
+CACHE_TTL = float(os.getenv("CACHE_TTL", "60"))
+CACHE_MAX = int(os.getenv("CACHE_MAX", "2048"))
+# Sin Realtime el bot no se entera de los cambios del dashboard y no cachea
+REALTIME_ACTIVO = os.getenv("REALTIME_ACTIVO", "1") == "1"
+
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 logging.basicConfig(level=logging.INFO)
 
+# Fotos de referencia y comprobantes (FOTOS_DIR o FOTOS_BUCKET, ver fotos.py)
+almacen_fotos = fotos.almacen_desde_entorno(supabase)
+
+
+# --- 2.1 REPOSITORIO COTIZACIONES (fuera del event loop) ---
+# El cliente de Supabase es síncrono: cada consulta corre en un pool de
+# hilos acotado para no bloquear el loop de python-telegram-bot.
+
+_db_pool = ThreadPoolExecutor(
+    max_workers=DB_MAX_CONCURRENCIA, thread_name_prefix="supabase"
+)
+
+
+async def _db(nombre: str, query):
+    """Ejecuta la consulta en el pool, medida como `nombre` en /metrics."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_pool, metricas.medir, nombre, query)
+
+
+class CacheLRU:
+    """LRU con TTL; solo la usa el loop del bot, así que no lleva lock."""
+
+    def __init__(self, maximo: int, ttl: float):
+        self.maximo = maximo
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def obtener(self, clave):
+        entrada = self._datos.get(str(clave))
+        if entrada and entrada[0] > time.monotonic():
+            self._datos.move_to_end(str(clave))
+            self.hits += 1
+            return entrada[1]
+        self.misses += 1
+        return None
+
+    def guardar(self, clave, valor):
+        self._datos[str(clave)] = (time.monotonic() + self.ttl, valor)
+        self._datos.move_to_end(str(clave))
+        while len(self._datos) > self.maximo:
+            self._datos.popitem(last=False)
+
+    def invalidar(self, clave):
+        self._datos.pop(str(clave), None)
+
+    def vaciar(self):
+        self._datos.clear()
+
+    def estadisticas(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "tamano": len(self._datos),
+            "maximo": self.maximo,
+            "ttl": self.ttl,
+        }
+
+
+cache_cotizaciones = CacheLRU(CACHE_MAX, CACHE_TTL)
+# True solo mientras la suscripción a Realtime está viva (escuchar_cambios)
+_cache_confiable = False
+
+
+async def db_obtener_cotizacion(v_id, columnas: str = "*"):
+    """Devuelve la cotización como dict, o None si no existe."""
+    res = await _db(
+        "cotizaciones.por_id",
+        supabase.table("cotizaciones")
+        .select(columnas)
+        .eq("id", v_id)
+        .limit(1),
+    )
+    return res.data[0] if res.data else None
+
+
+async def db_cotizacion_cacheada(v_id):
+    """Igual que db_obtener_cotizacion(v_id) pero pasando por la caché.
+    Solo se guardan cotizaciones ya cotizadas (con monto) y solo mientras
+    Realtime avisa de los cambios que hace el dashboard (p. ej. corregir
+    el monto); sin esa suscripción cada consulta va a la base."""
+    fila = cache_cotizaciones.obtener(v_id) if _cache_confiable else None
+    if fila is None:
+        fila = await db_obtener_cotizacion(v_id)
+        if fila and fila.get("monto") and _cache_confiable:
+            cache_cotizaciones.guardar(v_id, fila)
+    return fila
+
+
+def _al_cambiar_cotizacion(payload: dict):
+    datos = payload.get("data", payload)
+    fila = datos.get("record") or datos.get("old_record") or datos.get("new") or datos.get("old") or {}
+    if fila.get("id") is not None:
+        cache_cotizaciones.invalidar(fila["id"])
+
+
+def _al_suscribir(estado, error=None):
+    global _cache_confiable
+    _cache_confiable = getattr(estado, "value", estado) == "SUBSCRIBED"
+    if _cache_confiable:
+        logging.info("realtime: caché de cotizaciones suscrita")
+    else:
+        cache_cotizaciones.vaciar()
+        logging.warning(f"realtime: suscripción {estado} ({error}); caché apagada")
+
+
+async def escuchar_cambios():
+    """Invalida la caché con los UPDATE/DELETE de cotizaciones que llegan por
+    Supabase Realtime (migrations/0003). Corre en el loop del bot, así que
+    la caché sigue sin lock; si la conexión se cae se vacía y no se usa
+    hasta volver a suscribirse."""
+    global _cache_confiable
+    espera = 1
+    while True:
+        cliente = None
+        try:
+            cliente = await acreate_client(SUPABASE_URL, SUPABASE_KEY)
+            canal = cliente.channel("bot-cache")
+            canal.on_postgres_changes("*", schema="public", table="cotizaciones", callback=_al_cambiar_cotizacion)
+            await canal.subscribe(_al_suscribir)
+            await cliente.realtime.listen()
+            espera = 1
+            # según la versión de realtime, listen() bloquea o vuelve enseguida
+            while cliente.realtime.is_connected:
+                await asyncio.sleep(5)
+            logging.error(f"realtime: conexión perdida, reintento en {espera}s")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"realtime: conexión perdida ({e}), reintento en {espera}s")
+        finally:
+            _cache_confiable = False
+            cache_cotizaciones.vaciar()
+            if cliente is not None:
+                try:
+                    await cliente.realtime.close()
+                except Exception:
+                    pass
+        await asyncio.sleep(espera)
+        espera = min(espera * 2, 60)
+
+
+async def db_crear_cotizacion(datos: dict):
+    """Inserta una cotización y devuelve la fila creada."""
+    res = await _db(
+        "cotizaciones.insertar",
+        supabase.table("cotizaciones").insert(datos),
+    )
+    return res.data[0] if res.data else None
+
+
+async def db_transicionar(v_id, hacia: str, desde: str = None, campos: dict = None) -> dict:
+    """Cambia el estado con la rpc transicionar() (migrations/0010), la misma
+    que usa el dashboard: valida el paso y aplica el cambio en una consulta.
+    Devuelve {"ok", "desde", "fila"} o {"ok": False, "error", "estado"}."""
+    res = await _db(
+        "rpc.transicionar",
+        supabase.rpc(
+            "transicionar",
+            {"p_id": int(v_id), "p_hacia": hacia, "p_desde": desde, "p_campos": campos or {}},
+        ),
+    )
+    cache_cotizaciones.invalidar(v_id)
+    return res.data
+
+
+# --- 2.2 PROCESAMIENTO CONCURRENTE POR USUARIO ---
+
+class ProcesadorPorUsuario(BaseUpdateProcessor):
+    """Procesa chats distintos en paralelo pero mantiene el orden dentro
+    de cada usuario, porque el flujo depende de user_data["estado"]."""
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._locks = {}  # user_id -> [asyncio.Lock, referencias]
+
+    # PTB lo marca @final solo para el tipado. Se reemplaza para tomar el
+    # lock del usuario antes que el semáforo: al revés, los updates en cola
+    # de un usuario que manda muchos ocupan lugares del semáforo esperando
+    # su turno y frenan a todos los demás chats.
+    async def process_update(self, update, coroutine):  # type: ignore[misc]
+        user = getattr(update, "effective_user", None)
+        if user is None:
+            async with self._semaphore:
+                await self.do_process_update(update, coroutine)
+            return
+
+        entrada = self._locks.setdefault(user.id, [asyncio.Lock(), 0])
+        entrada[1] += 1
+        try:
+            async with entrada[0], self._semaphore:
+                await self.do_process_update(update, coroutine)
+        finally:
+            entrada[1] -= 1
+            if entrada[1] == 0:
+                self._locks.pop(user.id, None)
+
+    async def do_process_update(self, update, coroutine):
+        with metricas.UPDATE.labels(metricas.tipo_update(update)).time():
+            await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+class ColaUpdates(asyncio.Queue):
+    """update_queue de la Application acotada por updates sin terminar.
+    PTB la vacía enseguida y crea una tarea por update, así que un maxsize
+    no acota nada: se cuenta desde put hasta el task_done que hace PTB al
+    terminar de procesar cada update."""
+
+    def __init__(self, maximo: int):
+        super().__init__()
+        self.maximo = maximo
+        self.pendientes = 0
+        self._lugar = asyncio.Event()
+
+    def put_nowait(self, item):
+        super().put_nowait(item)
+        self.pendientes += 1
+
+    async def put(self, item):
+        # polling y workers esperan aquí en vez de acumular tareas
+        while self.pendientes >= self.maximo:
+            self._lugar.clear()
+            await self._lugar.wait()
+        self.put_nowait(item)
+
+    def ofrecer(self, item):
+        """Para el webhook: lanza queue.Full en vez de esperar (Telegram reintenta)."""
+        if self.pendientes >= self.maximo:
+            raise queue.Full
+        self.put_nowait(item)
+
+    def task_done(self):
+        super().task_done()
+        self.pendientes -= 1
+        if self.pendientes < self.maximo:
+            self._lugar.set()
+
 
 # --- 3. TECLADOS ---
 
@@ -56,22 +368,6 @@ def get_user_keyboard():
     )
 
 
-# --- 4. EXTRAER FECHA DEL TEXTO ---
-
-DATE_PATTERN = re.compile(r"\b(\d{1,2})[/-](\d{1,2})[/-](\d{4})\b")
-
-def extraer_fecha(texto: str):
-    m = DATE_PATTERN.search(texto)
-    if not m:
-        return None
-    d, mth, y = m.groups()
-    try:
-        dt = datetime(int(y), int(mth), int(d))
-        return dt.date().isoformat()
-    except ValueError:
-        return None
-
-
 # --- 5. HANDLERS USUARIO ---
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -120,9 +416,11 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Usuario manda descripción del vuelo
     elif udata.get("estado") == "usr_esperando_datos":
+        # se parsea una vez aquí y se guarda tal cual al crear la cotización
+        parseado = parsear_pedido(texto)
         udata["tmp_datos"] = texto
-        fecha = extraer_fecha(texto)
-        udata["tmp_fecha"] = fecha
+        udata["tmp_parseado"] = parseado
+        fecha = parseado["fecha"]
 
         if fecha:
             msg_fecha = f"✅ Fecha detectada: {fecha}"
@@ -140,19 +438,17 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Usuario indica ID de vuelo a pagar
     elif udata.get("estado") == "usr_esperando_id_pago":
         v_id = texto.strip()
-        res = (
-            supabase.table("cotizaciones")
-            .select("monto, estado")
-            .eq("id", v_id)
-            .single()
-            .execute()
-        )
+        if not v_id.isdigit():
+            await update.message.reply_text("❌ ID no encontrado. Verifica tu ID.")
+            return
 
-        if not res.data:
+        fila = await db_cotizacion_cacheada(v_id)
+
+        if not fila:
             await update.message.reply_text("❌ ID no encontrado. Verifica tu ID.")
             return
 
-        monto = res.data.get("monto")
+        monto = fila.get("monto")
         if not monto:
             await update.message.reply_text(
                 "⚠️ Ese vuelo aún no tiene monto. Espera a que sea cotizado."
@@ -182,6 +478,19 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # --- 6. FOTOS: NUEVA COTIZACIÓN y COMPROBANTE ---
 
+async def guardar_fotos(fotos_msg, columna: str) -> dict:
+    """Guarda la foto y su miniatura; devuelve {columna, columna_mini} para
+    la fila. Si falla se sigue sin foto: el admin la recibe igual por Telegram."""
+    if almacen_fotos is None:
+        return {}
+    try:
+        grande, mini = await fotos.guardar_fotos(almacen_fotos, fotos_msg, _db_pool)
+    except Exception as e:
+        logging.warning(f"No se pudo guardar la foto ({columna}): {e}")
+        return {}
+    return {columna: grande, f"{columna}_mini": mini}
+
+
 async def handle_media(update: Update, context: ContextTypes.DEFAULT_TYPE):
     uid = update.effective_user.id
     if uid == ADMIN_CHAT_ID:
@@ -195,23 +504,21 @@ async def handle_media(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # 1) Foto de referencia de la cotización
     if udata.get("estado") == "usr_esperando_foto_vuelo":
-        fecha = udata.get("tmp_fecha")
-        res = (
-            supabase.table("cotizaciones")
-            .insert(
-                {
-                    "user_id": str(uid),
-                    "username": update.effective_user.username or "SinUser",
-                    "pedido_completo": udata.get("tmp_datos"),
-                    "estado": "Esperando atención",
-                    "monto": None,
-                    "fecha": fecha,
-                }
-            )
-            .execute()
+        # conversaciones guardadas antes de tmp_parseado traen solo el texto
+        parseado = udata.get("tmp_parseado") or parsear_pedido(udata.get("tmp_datos"))
+        fila = await db_crear_cotizacion(
+            {
+                "user_id": str(uid),
+                "username": update.effective_user.username or "SinUser",
+                "pedido_completo": udata.get("tmp_datos"),
+                "estado": "Esperando atención",
+                "monto": None,
+                **parseado,
+                **await guardar_fotos(update.message.photo, "foto_ref"),
+            }
         )
 
-        v_id = res.data[0]["id"]
+        v_id = fila["id"]
 
         await update.message.reply_text(
             f"✅ Cotización recibida.\n"
@@ -237,9 +544,19 @@ async def handle_media(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif udata.get("estado") == "usr_esperando_comprobante":
         v_id = udata.get("pago_vuelo_id")
 
-        supabase.table("cotizaciones").update(
-            {"estado": "Esperando confirmación de pago"}
-        ).eq("id", v_id).execute()
+        res = await db_transicionar(
+            v_id,
+            "Esperando confirmación de pago",
+            campos=await guardar_fotos(update.message.photo, "comprobante"),
+        )
+        if not res.get("ok"):
+            await update.message.reply_text(
+                f"⚠️ El vuelo {v_id} ya no está esperando pago "
+                f"(estado: {res.get('estado', 'desconocido')}). "
+                f"Si crees que es un error escribe a {SOPORTE_USER}."
+            )
+            udata.clear()
+            return
 
         await update.message.reply_text(
             "✅ Comprobante enviado. Tu pago está en revisión."
@@ -280,18 +597,19 @@ async def callbacks(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if query.data.startswith("conf_pago_"):
         v_id = query.data.split("_")[2]
 
-        res = (
-            supabase.table("cotizaciones")
-            .update({"estado": "Pago Confirmado"})
-            .eq("id", v_id)
-            .execute()
-        )
+        res = await db_transicionar(v_id, "Pago Confirmado", desde="Esperando confirmación de pago")
 
-        if not res.data:
+        if res.get("error") == "no_existe":
             await query.message.reply_text("No se encontró el vuelo.")
             return
+        if not res.get("ok"):
+            # ya lo confirmó alguien (el dashboard o un doble toque): sin avisar otra vez
+            await query.edit_message_caption(
+                caption=f"ℹ️ ID Vuelo: {v_id}\nEstado actual: {res.get('estado')}"
+            )
+            return
 
-        user_id = res.data[0]["user_id"]
+        user_id = res["fila"]["user_id"]
 
         await context.bot.send_message(
             user_id,
@@ -304,16 +622,214 @@ async def callbacks(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 
+# --- 7.1 MÉTRICAS DE ESTADO ---
+# Un handler antes (grupo -1) y otro después (grupo 1) de los handlers del
+# flujo comparan user_data["estado"] para contar las transiciones. PTB usa
+# el mismo CallbackContext en todos los grupos de un update: el estado previo
+# viaja en él y se descarta con el update aunque un handler falle.
+
+async def _estado_antes(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if context.user_data is not None:
+        context.estado_previo = context.user_data.get("estado")
+
+
+async def _estado_despues(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if hasattr(context, "estado_previo"):
+        metricas.transicion(context.estado_previo, context.user_data.get("estado"))
+    if ESTADO_REFRESCAR and context.application.persistence and update.effective_user:
+        # otra réplica puede recibir el siguiente mensaje de este usuario y
+        # relee el estado del almacén: se escribe ya, no en el próximo flush
+        context.application.mark_data_for_update_persistence(user_ids=update.effective_user.id)
+        await context.application.update_persistence()
+
+
 # --- 8. ARRANQUE ---
 
-if __name__ == "__main__":
-    threading.Thread(target=run_server).start()
+def crear_persistencia():
+    if ESTADO_BACKEND == "memoria":
+        return None
+    if ESTADO_BACKEND == "supabase":
+        almacen = AlmacenSupabase(supabase)
+    else:
+        # un solo archivo (WAL) para todos los workers: cada uno escribe solo
+        # sus usuarios y, si cambia BOT_WORKERS, el nuevo dueño los encuentra
+        almacen = AlmacenSQLite(ESTADO_SQLITE)
+    return PersistenciaConversaciones(
+        almacen,
+        ttl=ESTADO_TTL,
+        update_interval=ESTADO_FLUSH_SEG,
+        refrescar=ESTADO_REFRESCAR,
+    )
 
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+
+def construir_app(shard=None, request_factory=None):
+    """`request_factory` devuelve un BaseRequest por cada cliente HTTP del bot
+    (la API falsa de bench/bench_bot.py); por defecto, HTTPX contra Telegram."""
+    builder = (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(ProcesadorPorUsuario(MAX_UPDATES_CONCURRENTES))
+        .update_queue(ColaUpdates(COLA_MAX))
+    )
+    if request_factory:
+        builder = builder.request(request_factory()).get_updates_request(request_factory())
+    else:
+        # mismo pool que el default de PTB, pero midiendo cada llamada
+        builder = builder.request(metricas.RequestMedido(connection_pool_size=256))
+    persistencia = crear_persistencia()
+    if persistencia:
+        builder = builder.persistence(persistencia)
+    if WEBHOOK_URL or shard is not None:
+        builder = builder.updater(None)  # los updates llegan por /telegram o por la cola
+
+    app = builder.build()
+    app.add_handler(TypeHandler(Update, _estado_antes), group=-1)
+    app.add_handler(TypeHandler(Update, _estado_despues), group=1)
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CallbackQueryHandler(callbacks))
     app.add_handler(MessageHandler(filters.PHOTO, handle_media))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
-    app.run_polling()
+    return app
+
+
+async def main():
+    if WEBHOOK_URL and not WEBHOOK_SECRET:
+        raise SystemExit("WEBHOOK_SECRET es obligatorio en modo webhook.")
+
+    app = construir_app()
+
+    async def despachar(data):
+        app.update_queue.ofrecer(Update.de_json(data, app.bot))
+
+    servidor = uvicorn.Server(
+        uvicorn.Config(crear_servidor_web(despachar), host="0.0.0.0", port=PORT, log_level="info")
+    )
+
+    async with app:
+        if WEBHOOK_URL:
+            await app.bot.set_webhook(
+                url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=Update.ALL_TYPES,
+                max_connections=100,
+            )
+        else:
+            await app.updater.start_polling()
+        await app.start()
+        cambios = asyncio.create_task(escuchar_cambios()) if REALTIME_ACTIVO else None
+
+        # uvicorn atiende SIGINT/SIGTERM; al salir detenemos el bot
+        await servidor.serve()
+
+        if cambios:
+            cambios.cancel()
+        if app.updater:
+            await app.updater.stop()
+        await app.stop()
+
+
+# --- 9. MODO MULTIPROCESO (BOT_WORKERS > 1) ---
+
+def ejecutar_worker(indice: int, cola, request_factory=None):
+    """Proceso worker: procesa los updates de sus usuarios en orden.
+    El ingreso decide cuándo parar (manda None), no las señales.
+    `request_factory` como en construir_app() (bench/bench_shards.py)."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    asyncio.run(_worker(indice, cola, request_factory))
+
+
+async def _worker(indice: int, cola, request_factory=None):
+    app = construir_app(shard=indice, request_factory=request_factory)
+    loop = asyncio.get_running_loop()
+    async with app:
+        await app.start()
+        cambios = asyncio.create_task(escuchar_cambios()) if REALTIME_ACTIVO else None
+        logging.info(f"worker {indice}: listo")
+        while True:
+            data = await loop.run_in_executor(None, cola.get)
+            if data is None:
+                break
+            await app.update_queue.put(Update.de_json(data, app.bot))
+        if cambios:
+            cambios.cancel()
+        await app.stop()
+
+
+async def _polling_ingreso(bot: Bot, ingreso: Ingreso):
+    loop = asyncio.get_running_loop()
+    offset = None
+    try:
+        while True:
+            try:
+                updates = await bot.get_updates(
+                    offset=offset, timeout=30, allowed_updates=Update.ALL_TYPES
+                )
+            except TelegramError as e:
+                logging.warning(f"ingreso: get_updates falló ({e}), reintento en 3s")
+                await asyncio.sleep(3)
+                continue
+            for u in updates:
+                await loop.run_in_executor(None, ingreso.despachar, u.to_dict())
+                offset = u.update_id + 1
+    except asyncio.CancelledError:
+        # Telegram solo olvida un update cuando se le pide el offset siguiente:
+        # sin esto, los últimos repartidos llegan otra vez al reiniciar
+        if offset is not None:
+            try:
+                await bot.get_updates(offset=offset, timeout=0, allowed_updates=Update.ALL_TYPES)
+            except TelegramError as e:
+                logging.warning(f"ingreso: no se confirmó el offset {offset} ({e})")
+        raise
+
+
+async def main_ingreso():
+    if WEBHOOK_URL and not WEBHOOK_SECRET:
+        raise SystemExit("WEBHOOK_SECRET es obligatorio en modo webhook.")
+
+    ingreso = Ingreso(BOT_WORKERS, ejecutar_worker, tam_cola=COLA_MAX)
+    ingreso.iniciar()
+
+    async def despachar(data):
+        ingreso.despachar(data, bloquear=False)
+
+    servidor = uvicorn.Server(
+        uvicorn.Config(
+            crear_servidor_web(despachar, con_cache=False),
+            host="0.0.0.0", port=PORT, log_level="info",
+        )
+    )
+
+    bot = Bot(BOT_TOKEN)
+    async with bot:
+        tarea = None
+        if WEBHOOK_URL:
+            await bot.set_webhook(
+                url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=Update.ALL_TYPES,
+                max_connections=100,
+            )
+        else:
+            await bot.delete_webhook()
+            tarea = asyncio.create_task(_polling_ingreso(bot, ingreso))
+
+        await servidor.serve()
+
+        if tarea:
+            tarea.cancel()
+            try:
+                await tarea
+            except asyncio.CancelledError:
+                pass
+
+    await asyncio.get_running_loop().run_in_executor(None, ingreso.detener)
+
+
+if __name__ == "__main__":
+    if BOT_WORKERS > 1:
+        asyncio.run(main_ingreso())
+    else:
+        asyncio.run(main())
 
 
@@ -1,26 +1,58 @@
 import os
+import csv
+import io
+import time
+import hashlib
+import base64
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
-import requests
 import json
 import re
+import unicodedata
 from flask import (
     Flask, render_template, request,
-    redirect, url_for, flash, jsonify
+    redirect, url_for, flash, jsonify,
+    Response, stream_with_context, abort, send_from_directory
 )
 from supabase import create_client, Client
-from telegram import Bot, InputMediaPhoto
+
+import en_vivo
+import metricas
+from cache import CacheLRU
+from metricas import medir
+from outbox import Outbox
+from replica import Replica
+from telegram_http import TelegramClient
 
 # ----------------- CONFIG -----------------
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+OUTBOX_DB = os.getenv("OUTBOX_DB", os.path.join(os.path.dirname(__file__), "outbox.db"))
+REALTIME_ACTIVO = os.getenv("REALTIME_ACTIVO", "1") == "1"
+OUTBOX_HILOS = int(os.getenv("OUTBOX_HILOS", "4"))
+CACHE_TTL = float(os.getenv("CACHE_TTL", "60"))
+CACHE_MAX = int(os.getenv("CACHE_MAX", "2048"))
+# Consultas independientes de una misma página, en paralelo (ver en_paralelo)
+PARALELO_HILOS = int(os.getenv("PARALELO_HILOS", "16"))
+PARALELO_PLAZO = float(os.getenv("PARALELO_PLAZO", "5"))
+# Fotos que guarda el bot (fotos.py en la raíz): misma carpeta o mismo bucket
+FOTOS_DIR = os.getenv("FOTOS_DIR")
+FOTOS_BUCKET = os.getenv("FOTOS_BUCKET")
+# Réplica local de lecturas (replica.py); sin REPLICA_DB se lee de Supabase
+REPLICA_DB = os.getenv("REPLICA_DB")
+REPLICA_INTERVALO = float(os.getenv("REPLICA_INTERVALO", "5"))
+REPLICA_MARGEN = float(os.getenv("REPLICA_MARGEN", "30"))
+REPLICA_AVISO = float(os.getenv("REPLICA_AVISO", "60"))  # segundos de atraso para avisar en la página
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-bot = Bot(token=BOT_TOKEN)
 
 app = Flask(__name__)
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "cambia_esto")
+metricas.instrumentar(app)
 
 def construir_info_vuelo(v: dict) -> str:
     """Texto base para importar dentro del textarea."""
@@ -43,20 +75,439 @@ def rango_proximos():
     return hoy, hasta
 
 
-def enviar_mensaje(chat_id: int, texto: str):
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
+# ----------------- CACHÉ DE LECTURAS POR ID -----------------
+# Detalle, cotizar, enviar QR y workspace leen la misma fila una y otra vez.
+# Las escrituras de este proceso y los eventos de Realtime la invalidan.
+
+cache_cotizaciones = CacheLRU(CACHE_MAX, CACHE_TTL)
+cache_workspace = CacheLRU(CACHE_MAX, CACHE_TTL)
+
+
+def cacheado(cache, clave, cargar):
+    # Con la réplica la lectura ya es local; la caché solo podría guardar
+    # una fila que la réplica aún no refrescó tras un evento. Sin el canal
+    # de Realtime suscrito no llegan las invalidaciones: tampoco se cachea.
+    if lectura() is not supabase or not difusor.suscrito:
+        return cargar()
+    return cache.obtener(clave, cargar)
+
+
+def cotizacion_por_id(v_id):
+    """Fila completa de la cotización (o None), pasando por la caché."""
+    def cargar():
+        filas = medir(
+            "cotizaciones.por_id",
+            lectura().table("cotizaciones")
+            .select("*")
+            .eq("id", v_id)
+            .limit(1),
+        ).data
+        return filas[0] if filas else None
+
+    return cacheado(cache_cotizaciones, v_id, cargar)
+
+
+def workspace_por_cotizacion(cotizacion_id):
+    def cargar():
+        filas = medir(
+            "workspace.por_cotizacion",
+            lectura().table("workspace")
+            .select("*")
+            .eq("cotizacion_id", cotizacion_id)
+            .limit(1),
+        ).data
+        return filas[0] if filas else None
+
+    return cacheado(cache_workspace, cotizacion_id, cargar)
+
+
+# ----------------- RÉPLICA LOCAL DE LECTURAS -----------------
+# Con REPLICA_DB las páginas leen de una copia en SQLite que se sincroniza
+# sola (replica.py, migrations/0012); búsqueda, rpcs y escrituras siguen en
+# Supabase. Lo que escribe este dashboard entra a la réplica en el momento.
+
+replica = None
+if REPLICA_DB:
+    replica = Replica(REPLICA_DB, supabase, logger=app.logger, intervalo=REPLICA_INTERVALO, margen=REPLICA_MARGEN)
+    replica.iniciar()
+
+
+def lectura():
+    """Origen de las lecturas: la réplica si ya hizo su primera
+    sincronización completa, si no Supabase."""
+    if replica is not None and replica.lista():
+        return replica
+    return supabase
+
+
+def replicar(tabla: str, filas: list = None, ids: list = None):
+    """Leer lo propio: `filas` (como las devolvió Supabase) se aplican tal
+    cual; `ids` se vuelven a leer de Supabase. Un error aquí no deshace la
+    escritura: la sincronización la trae en el siguiente ciclo."""
+    if replica is None:
+        return
+    try:
+        if filas:
+            replica.aplicar(tabla, filas)
+        if ids:
+            replica.refrescar(tabla, ids)
+    except Exception as e:
+        app.logger.error(f"réplica: no se aplicó la escritura en {tabla}: {e}")
+
+
+@app.context_processor
+def _aviso_replica():
+    atraso = replica.atraso() if lectura() is not supabase else None
+    return {"replica_atraso": int(atraso) if atraso and atraso > REPLICA_AVISO else None}
+
+
+# ----------------- TRANSICIONES DE ESTADO -----------------
+# Todo cambio de estado individual pasa por la rpc transicionar()
+# (migrations/0010), igual que en bot.py: valida el paso y aplica el cambio
+# en una sola consulta. Si otro (el bot, otra pestaña) ya lo hizo, ok=False
+# y no se notifica de nuevo al usuario.
+
+def transicionar(v_id, hacia: str, desde: str = None, **campos) -> dict:
+    """{"ok", "desde", "fila"} o {"ok": False, "error": "no_existe" | "estado", "estado"}."""
+    if not str(v_id).isdigit():
+        return {"ok": False, "error": "no_existe"}
+    res = medir(
+        "rpc.transicionar",
+        supabase.rpc("transicionar", {"p_id": int(v_id), "p_hacia": hacia, "p_desde": desde, "p_campos": campos}),
+    ).data
+    cache_cotizaciones.invalidar(v_id)
+    if res.get("fila"):
+        replicar("cotizaciones", [res["fila"]])
+    if res.get("ok"):
+        metricas.transicion(hacia)
+    return res
+
+
+def transicionar_lote(hacia: str, items: list, desde: str = None) -> dict:
+    """items [{"id", "campos"}] -> {id: respuesta de transicionar()} (migrations/0013)."""
+    res = medir(
+        "rpc.transicionar_lote",
+        supabase.rpc("transicionar_lote", {"p_hacia": hacia, "p_items": items, "p_desde": desde}),
+    ).data
+    cache_cotizaciones.invalidar(*[i["id"] for i in items])
+    replicar("cotizaciones", [r["fila"] for r in res if r.get("fila")])
+    metricas.transicion(hacia, sum(1 for r in res if r.get("ok")))
+    return {int(r["id"]): r for r in res}
+
+
+def error_transicion(res: dict) -> str:
+    if res.get("error") == "no_existe":
+        return "No se encontró el vuelo."
+    return f"El vuelo está en '{res.get('estado')}'; no se cambió (¿ya lo hizo alguien más?)."
+
+
+# ----------------- CONSULTAS EN PARALELO -----------------
+# Las lecturas independientes de una página salen a la vez: la página tarda
+# lo que la consulta más lenta y no la suma de todas. Pool compartido por
+# el proceso (con gthread, por todos los hilos de gunicorn).
+
+_pool_consultas = ThreadPoolExecutor(max_workers=PARALELO_HILOS, thread_name_prefix="consultas")
+
+
+def en_paralelo(consultas: dict, plazo: float = None):
+    """{clave: (nombre, query)} -> ({clave: .data o None}, [claves que fallaron]).
+
+    Lo que falla o no termina en `plazo` segundos queda en None y se loguea;
+    la página decide cómo mostrarse sin ese dato en lugar de dar un 500."""
+    futuros = {
+        _pool_consultas.submit(medir, nombre, query): (clave, nombre)
+        for clave, (nombre, query) in consultas.items()
+    }
+    listos, pendientes = wait(futuros, timeout=plazo or PARALELO_PLAZO)
+
+    datos, fallidas = {clave: None for clave in consultas}, []
+    for futuro in pendientes:
+        clave, nombre = futuros[futuro]
+        futuro.cancel()
+        metricas.DB_VENCIDAS.labels(nombre).inc()
+        app.logger.warning(f"consulta {nombre} vencida (plazo {plazo or PARALELO_PLAZO}s)")
+        fallidas.append(clave)
+    for futuro in listos:
+        clave, nombre = futuros[futuro]
+        try:
+            datos[clave] = futuro.result().data
+        except Exception as e:
+            app.logger.error(f"consulta {nombre} falló: {e}")
+            fallidas.append(clave)
+    return datos, fallidas
+
+
+# ----------------- PAGINACIÓN POR CURSOR (created_at, id) -----------------
+# En lugar de limit/offset desde el más nuevo, cada página continúa después
+# de la última fila vista: el costo por página no crece con la tabla.
+
+PAGINA_DEFAULT = 50
+PAGINA_MAX = 200
+
+
+def leer_paginacion():
+    """Lee ?n= (tamaño) y ?antes= (cursor) del request."""
+    try:
+        tamano = int(request.args.get("n", PAGINA_DEFAULT))
+    except ValueError:
+        tamano = PAGINA_DEFAULT
+    tamano = max(1, min(tamano, PAGINA_MAX))
+    return tamano, decodificar_cursor(request.args.get("antes"))
+
+
+def codificar_cursor(fila: dict) -> str:
+    raw = f"{fila['created_at']}|{fila['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str):
+    """Devuelve (created_at, id) o None si el cursor no es válido.
+    created_at termina dentro del filtro or_() de paginar(): solo pasa si es
+    una fecha ISO, así un cursor armado a mano no puede inyectar condiciones."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, v_id = raw.rsplit("|", 1)
+        datetime.fromisoformat(created_at)
+        return created_at, int(v_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def paginar(nombre: str, query, tamano: int, cursor):
+    """Aplica el cursor y el orden (created_at desc, id desc) a la consulta.
+    Devuelve (filas, cursor_siguiente o None)."""
+    if cursor:
+        created_at, v_id = cursor
+        query = query.or_(
+            f'created_at.lt."{created_at}",'
+            f'and(created_at.eq."{created_at}",id.lt.{v_id})'
+        )
+    filas = medir(
+        nombre,
+        query.order("created_at", desc=True)
+        .order("id", desc=True)
+        .limit(tamano + 1),
+    ).data
+    siguiente = codificar_cursor(filas[tamano - 1]) if len(filas) > tamano else None
+    return filas[:tamano], siguiente
+
+
+TELEGRAM_ALBUM_MAX = 10  # límite de sendMediaGroup
+
+# Cliente HTTP compartido (pool keep-alive) para la Bot API
+tg = TelegramClient(BOT_TOKEN, logger=app.logger)
+
+
+# Outbox: las acciones solo encolan, el worker envía a Telegram
+outbox = Outbox(OUTBOX_DB, enviar=tg.llamar, logger=app.logger)
+outbox.iniciar(OUTBOX_HILOS)
+
+
+def encolar_mensaje(chat_id: int, texto: str, clave: str = None):
     data = {"chat_id": chat_id, "text": texto}
-    r = requests.post(url, data=data, timeout=10)
-    r.raise_for_status()
-    
-def enviar_foto(chat_id: int, fileobj, caption: str = ""):
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendPhoto"
-    files = {"photo": (fileobj.filename, fileobj.stream, fileobj.mimetype)}
-    data = {"chat_id": chat_id, "caption": caption}
-    r = requests.post(url, data=data, files=files, timeout=20)
-    r.raise_for_status()
+    outbox.encolar(chat_id, "sendMessage", data, clave=clave)
+
+
+def encolar_album(chat_id: int, fotos: list, caption: str = "", clave: str = None):
+    """Encola las fotos en álbumes de hasta 10 (sendMediaGroup).
+    `fotos` es una lista de (filename, bytes, mimetype); el caption va en
+    la primera foto del primer álbum."""
+    for inicio in range(0, len(fotos), TELEGRAM_ALBUM_MAX):
+        grupo = fotos[inicio:inicio + TELEGRAM_ALBUM_MAX]
+        texto = caption if inicio == 0 else ""
+        clave_grupo = f"{clave}:{inicio}" if clave else None
+
+        # sendMediaGroup exige al menos 2 elementos
+        if len(grupo) == 1:
+            data = {"chat_id": chat_id, "caption": texto}
+            outbox.encolar(chat_id, "sendPhoto", data, {"photo": grupo[0]}, clave=clave_grupo)
+            continue
+
+        media, archivos = [], {}
+        for idx, foto in enumerate(grupo):
+            nombre = f"foto{idx}"
+            item = {"type": "photo", "media": f"attach://{nombre}"}
+            if idx == 0 and texto:
+                item["caption"] = texto
+            media.append(item)
+            archivos[nombre] = foto
+
+        data = {"chat_id": chat_id, "media": json.dumps(media)}
+        outbox.encolar(chat_id, "sendMediaGroup", data, archivos, clave=clave_grupo)
+
+
+def texto_cotizado(v_id, monto_str: str, total=None, pct=None) -> str:
+    if pct is not None and total is not None:
+        return (
+            f"💰 Tu vuelo ID {v_id} ha sido cotizado.\n"
+            f"Total del vuelo: ${total:.2f}\n"
+            f"Porcentaje a pagar: {pct:.2f}%\n"
+            f"Monto a pagar: ${monto_str}\n\n"
+            "Cuando tengas tu comprobante usa el botón \"📸 Enviar Pago\" en el bot."
+        )
+    return (
+        f"💰 Tu vuelo ID {v_id} ha sido cotizado.\n"
+        f"Monto a pagar: ${monto_str}\n\n"
+        "Cuando tengas tu comprobante usa el botón \"📸 Enviar Pago\" en el bot."
+    )
+
+
+def texto_pago_confirmado(v_id) -> str:
+    return (
+        f"✅ Tu pago para el vuelo ID {v_id} ha sido confirmado.\n"
+        "En breve recibirás tus códigos QR."
+    )
+
 
+# ----------------- ACCIONES EN LOTE -----------------
+# Varias cotizaciones por request: una lectura, una escritura y las
+# notificaciones encoladas en una sola transacción del outbox.
 
+LOTE_MAX = 200
+
+
+def leer_ids_lote():
+    ids = []
+    for raw in request.form.getlist("ids"):
+        raw = raw.strip()
+        if raw.isdigit() and int(raw) not in ids:
+            ids.append(int(raw))
+    return ids
+
+
+def _lote_json() -> bool:
+    return request.args.get("formato") == "json" or request.accept_mimetypes.best == "application/json"
+
+
+def rechazar_lote(ids: list, destino: str):
+    """Más de LOTE_MAX: no se aplica a ninguno en vez de cortar la selección."""
+    error = f"Seleccionaste {len(ids)} vuelos; el máximo por lote es {LOTE_MAX}. No se cambió ninguno."
+    if _lote_json():
+        return jsonify({"ok": False, "error": error}), 400
+    flash(error, "error")
+    return redirect(url_for(destino))
+
+
+def responder_lote(resultados: list, destino: str, accion: str):
+    """JSON con el resultado por ID si el cliente lo pide; si no, flash + redirect."""
+    if _lote_json():
+        return jsonify({"ok": True, "resultados": resultados})
+
+    ok = [r["id"] for r in resultados if r["ok"]]
+    fallidos = [r for r in resultados if not r["ok"]]
+    if ok:
+        flash(f"{accion}: {len(ok)} vuelo(s) ({', '.join(map(str, ok))}); notificaciones en cola.", "success")
+    for r in fallidos:
+        flash(f"ID {r['id']}: {r['error']}", "error")
+    if not resultados:
+        flash("No seleccionaste ningún vuelo.", "error")
+    return redirect(url_for(destino))
+
+
+def _notificar_lote(resultados: list, filas: dict, textos: dict, prefijo_clave: str):
+    """Encola los avisos de los resultados ok; marca error si el user_id no sirve."""
+    items = []
+    for r in resultados:
+        if not r["ok"]:
+            continue
+        try:
+            chat_id = int(filas[r["id"]]["user_id"])
+        except (TypeError, ValueError, KeyError):
+            r.update(ok=False, error="Guardado, pero user_id inválido: no se notificó.")
+            continue
+        clave = f"{prefijo_clave}:{r['id']}" + (f":{r['monto']}" if r.get("monto") else "")
+        items.append((chat_id, "sendMessage", {"chat_id": chat_id, "text": textos[r["id"]]}, None, clave))
+
+    if items:
+        try:
+            outbox.encolar_lote(items)
+        except Exception as e:
+            app.logger.error(f"Error al encolar notificaciones en lote: {e}")
+            for r in resultados:
+                if r["ok"]:
+                    r.update(ok=False, error="Guardado, pero no se pudo notificar al usuario.")
+
+
+@app.route("/accion/cotizar_lote", methods=["POST"])
+def accion_cotizar_lote():
+    """Aplica el mismo porcentaje a todas las seleccionadas."""
+    ids = leer_ids_lote()
+    if len(ids) > LOTE_MAX:
+        return rechazar_lote(ids, "por_cotizar")
+    try:
+        pct = float((request.form.get("porcentaje") or "").strip())
+    except ValueError:
+        flash("Porcentaje inválido.", "error")
+        return redirect(url_for("por_cotizar"))
+    if pct <= 0 or pct > 100:
+        flash("El porcentaje debe estar entre 0 y 100.", "error")
+        return redirect(url_for("por_cotizar"))
+    if not ids:
+        return responder_lote([], "por_cotizar", "Cotizados")
+
+    filas = {
+        v["id"]: v
+        for v in medir(
+            "cotizaciones.in_ids",
+            lectura().table("cotizaciones")
+            .select("id, user_id, estado, pedido_completo, total_vuelo, parseado")
+            .in_("id", ids),
+        ).data
+    }
+
+    resultados, items, totales = [], [], {}
+    for v_id in ids:
+        v = filas.get(v_id)
+        if not v:
+            resultados.append({"id": v_id, "ok": False, "error": "No se encontró el vuelo."})
+            continue
+        total = total_de(v)
+        if total is None:
+            resultados.append({"id": v_id, "ok": False, "error": "No se detectó el total del vuelo; cotízalo manualmente."})
+            continue
+        totales[v_id] = total
+        items.append({"id": v_id, "campos": {"monto": f"{round(total * (pct / 100.0), 2):.2f}"}})
+
+    res = transicionar_lote("Cotizado", items, desde="Esperando atención") if items else {}
+
+    textos = {}
+    for item in items:
+        v_id, monto = item["id"], item["campos"]["monto"]
+        if res[v_id].get("ok"):
+            resultados.append({"id": v_id, "ok": True, "monto": monto})
+            textos[v_id] = texto_cotizado(v_id, monto, totales[v_id], pct)
+        else:
+            resultados.append({"id": v_id, "ok": False, "error": error_transicion(res[v_id])})
+
+    _notificar_lote(resultados, filas, textos, "cotizado")
+    resultados.sort(key=lambda r: ids.index(r["id"]))
+    return responder_lote(resultados, "por_cotizar", "Cotizados")
+
+
+@app.route("/accion/confirmar_pago_lote", methods=["POST"])
+def accion_confirmar_pago_lote():
+    ids = leer_ids_lote()
+    if len(ids) > LOTE_MAX:
+        return rechazar_lote(ids, "validar_pagos")
+    if not ids:
+        return responder_lote([], "validar_pagos", "Pagos confirmados")
+
+    # Solo confirma los que siguen esperando: repetir el envío no duplica avisos
+    res = transicionar_lote(
+        "Pago Confirmado", [{"id": v_id} for v_id in ids], desde="Esperando confirmación de pago"
+    )
+    filas = {v_id: r["fila"] for v_id, r in res.items() if r.get("ok")}
+
+    resultados = [
+        {"id": v_id, "ok": True} if v_id in filas
+        else {"id": v_id, "ok": False, "error": error_transicion(res[v_id])}
+        for v_id in ids
+    ]
+    textos = {v_id: texto_pago_confirmado(v_id) for v_id in filas}
+    _notificar_lote(resultados, filas, textos, "pago_confirmado")
+    return responder_lote(resultados, "validar_pagos", "Pagos confirmados")
 
 
 # ----------------- GENERAL / ESTADÍSTICAS -----------------
@@ -66,33 +517,27 @@ def general():
     manana = hoy + timedelta(days=1)
     pasado_manana = hoy + timedelta(days=2)
 
-    res_usuarios = (
-        supabase.table("cotizaciones")
-        .select("username", count="exact", head=True)
-        .execute()
-    )
-    usuarios_unicos = res_usuarios.count or 0
-
-    res_total = (
-        supabase.table("cotizaciones")
-        .select("monto")
-        .in_("estado", ["Pago Confirmado", "QR Enviados"])
-        .execute()
-        .data
-    )
-    total_recaudado = sum(float(r["monto"]) for r in res_total if r["monto"])
-
-    # URGENTES: vuelos entre hoy y mañana (incluye TODO mañana)
-    urgentes = (
-        supabase.table("cotizaciones")
-        .select("*")
-        .gte("fecha", str(hoy))
-        .lt("fecha", str(pasado_manana))   # <-- clave
-        .order("fecha", desc=False)
-        .order("created_at", desc=True)
-        .execute()
-        .data
-    )
+    datos, fallidas = en_paralelo({
+        # Agregados calculados en Postgres (migrations/0001 y 0002)
+        "resumen": ("rpc.resumen_general", supabase.rpc("resumen_general")),
+        # URGENTES: vuelos entre hoy y mañana (incluye TODO mañana)
+        "urgentes": (
+            "cotizaciones.urgentes",
+            lectura().table("cotizaciones")
+            .select("*")
+            .gte("fecha", str(hoy))
+            .lt("fecha", str(pasado_manana))   # <-- clave
+            .order("fecha", desc=False)
+            .order("created_at", desc=True),
+        ),
+    })
+    if fallidas:
+        flash("Algunos datos no se pudieron cargar; recarga la página en un momento.", "error")
+
+    fila = (datos["resumen"] or [{}])[0]
+    usuarios_unicos = int(fila.get("usuarios_unicos") or 0)
+    total_recaudado = float(fila.get("total_recaudado") or 0)
+    urgentes = datos["urgentes"] or []
 
     return render_template(
         "general.html",
@@ -105,21 +550,46 @@ def general():
 
 # ----------------- POR COTIZAR -----------------
 
+def _leer_total(nombre: str):
+    try:
+        return float(request.args[nombre])
+    except (KeyError, ValueError):
+        return None
+
+
 @app.route("/por-cotizar")
 def por_cotizar():
-    pendientes = (
-        supabase.table("cotizaciones")
+    # ?orden=total (mayor primero; los sin total detectado van arriba, se
+    # cotizan a mano), ?total_min= y ?total_max= filtran en la base
+    orden = request.args.get("orden", "reciente")
+    total_min, total_max = _leer_total("total_min"), _leer_total("total_max")
+
+    query = (
+        lectura().table("cotizaciones")
         .select("*")
         .eq("estado", "Esperando atención")
-        .order("created_at", desc=True)
-        .execute()
-        .data
     )
+    if total_min is not None:
+        query = query.gte("total_vuelo", total_min)
+    if total_max is not None:
+        query = query.lte("total_vuelo", total_max)
+    if orden == "total":
+        query = query.order("total_vuelo", desc=True)
+    pendientes = medir(
+        "cotizaciones.por_estado",
+        query.order("created_at", desc=True),
+    ).data
 
     for v in pendientes:
-        v["total_vuelo"] = extraer_total_vuelo(v.get("pedido_completo", ""))
+        v["total_vuelo"] = total_de(v)
 
-    return render_template("por_cotizar.html", vuelos=pendientes)
+    return render_template(
+        "por_cotizar.html",
+        vuelos=pendientes,
+        orden=orden,
+        total_min=total_min,
+        total_max=total_max,
+    )
 
 
 @app.route("/accion/cotizar", methods=["POST"])
@@ -132,20 +602,13 @@ def accion_cotizar():
         flash("Falta ID.", "error")
         return redirect(url_for("por_cotizar"))
 
-    sel = (
-        supabase.table("cotizaciones")
-        .select("user_id, pedido_completo")
-        .eq("id", v_id)
-        .single()
-        .execute()
-    )
+    sel = cotizacion_por_id(v_id)
 
-    if not sel.data:
+    if not sel:
         flash("No se encontró el vuelo.", "error")
         return redirect(url_for("por_cotizar"))
 
-    pedido = sel.data.get("pedido_completo") or ""
-    total = extraer_total_vuelo(pedido)
+    total = total_de(sel)
 
     pct = None
     if porcentaje_raw:
@@ -169,45 +632,31 @@ def accion_cotizar():
         if not monto_raw:
             flash("Falta porcentaje o monto.", "error")
             return redirect(url_for("por_cotizar"))
-        monto_str = monto_raw
-
-    res = (
-        supabase.table("cotizaciones")
-        .update({"monto": monto_str, "estado": "Cotizado"})
-        .eq("id", v_id)
-        .execute()
-    )
+        monto_manual = leer_monto(monto_raw)
+        if monto_manual is None:
+            flash("Monto inválido. Captúralo como número, p. ej. 1500 o 1,500.50.", "error")
+            return redirect(url_for("por_cotizar"))
+        monto_str = f"{monto_manual:.2f}"
 
-    if not res.data:
-        flash("No se pudo actualizar el vuelo.", "error")
+    res = transicionar(v_id, "Cotizado", monto=monto_str)
+    if not res.get("ok"):
+        flash(error_transicion(res), "error")
         return redirect(url_for("por_cotizar"))
 
-    user_id_raw = sel.data.get("user_id")
+    user_id_raw = res["fila"].get("user_id")
     try:
         user_id = int(user_id_raw)
     except Exception:
         flash("Cotización guardada, pero user_id inválido en la base.", "error")
         return redirect(url_for("por_cotizar"))
 
-    if pct is not None and total is not None:
-        texto = (
-            f"💰 Tu vuelo ID {v_id} ha sido cotizado.\n"
-            f"Total del vuelo: ${total:.2f}\n"
-            f"Porcentaje a pagar: {pct:.2f}%\n"
-            f"Monto a pagar: ${monto_str}\n\n"
-            "Cuando tengas tu comprobante usa el botón \"📸 Enviar Pago\" en el bot."
-        )
-    else:
-        texto = (
-            f"💰 Tu vuelo ID {v_id} ha sido cotizado.\n"
-            f"Monto a pagar: {monto_str}\n\n"
-            "Cuando tengas tu comprobante usa el botón \"📸 Enviar Pago\" en el bot."
-        )
+    texto = texto_cotizado(v_id, monto_str, total, pct)
 
     try:
-        enviar_mensaje(user_id, texto)
-        flash("Cotización enviada y usuario notificado.", "success")
-    except Exception:
+        encolar_mensaje(user_id, texto, clave=f"cotizado:{v_id}:{monto_str}")
+        flash("Cotización guardada; notificación en cola para el usuario.", "success")
+    except Exception as e:
+        app.logger.error(f"Error al encolar notificación de cotización: {e}")
         flash("Cotización guardada pero no se pudo notificar al usuario.", "error")
 
     return redirect(url_for("por_cotizar"))
@@ -218,14 +667,13 @@ def accion_cotizar():
 
 @app.route("/validar-pagos")
 def validar_pagos():
-    pendientes = (
-        supabase.table("cotizaciones")
+    pendientes = medir(
+        "cotizaciones.por_estado",
+        lectura().table("cotizaciones")
         .select("*")
         .eq("estado", "Esperando confirmación de pago")
-        .order("created_at", desc=True)
-        .execute()
-        .data
-    )
+        .order("created_at", desc=True),
+    ).data
     return render_template("validar_pagos.html", vuelos=pendientes)
 
 
@@ -237,18 +685,12 @@ def accion_confirmar_pago():
         flash("Falta ID.", "error")
         return redirect(url_for("validar_pagos"))
 
-    res = (
-        supabase.table("cotizaciones")
-        .update({"estado": "Pago Confirmado"})
-        .eq("id", v_id)
-        .execute()
-    )
-
-    if not res.data:
-        flash("No se encontró el vuelo.", "error")
+    res = transicionar(v_id, "Pago Confirmado", desde="Esperando confirmación de pago")
+    if not res.get("ok"):
+        flash(error_transicion(res), "error")
         return redirect(url_for("validar_pagos"))
 
-    user_id_raw = res.data[0]["user_id"]
+    user_id_raw = res["fila"]["user_id"]
     try:
         user_id = int(user_id_raw)
     except Exception:
@@ -256,16 +698,13 @@ def accion_confirmar_pago():
         flash("Pago confirmado pero user_id inválido en la base.", "error")
         return redirect(url_for("validar_pagos"))
 
-    texto = (
-        f"✅ Tu pago para el vuelo ID {v_id} ha sido confirmado.\n"
-        "En breve recibirás tus códigos QR."
-    )
+    texto = texto_pago_confirmado(v_id)
 
     try:
-        enviar_mensaje(user_id, texto)
-        flash("Pago confirmado y usuario notificado.", "success")
+        encolar_mensaje(user_id, texto, clave=f"pago_confirmado:{v_id}")
+        flash("Pago confirmado; notificación en cola para el usuario.", "success")
     except Exception as e:
-        app.logger.error(f"Error al enviar notificación de pago: {e}")
+        app.logger.error(f"Error al encolar notificación de pago: {e}")
         flash("Pago confirmado pero no se pudo notificar al usuario.", "error")
 
     return redirect(url_for("validar_pagos"))
@@ -274,56 +713,95 @@ def accion_confirmar_pago():
 
 @app.route("/por-enviar-qr")
 def por_enviar_qr():
-    pendientes = (
-        supabase.table("cotizaciones")
+    pendientes = medir(
+        "cotizaciones.por_estado",
+        lectura().table("cotizaciones")
         .select("*")
         .eq("estado", "Pago Confirmado")
-        .order("created_at", desc=True)
-        .execute()
-        .data
-    )
+        .order("created_at", desc=True),
+    ).data
     return render_template("por_enviar_qr.html", vuelos=pendientes)
 #----------- ESPACIO DE TRABAJO --------------
+# El workspace viene embebido en la misma consulta (FK de migrations/0008)
+WORKSPACE_COLUMNAS = (
+    "id, user_id, username, fecha, estado, monto, pedido_completo, created_at, "
+    "workspace(id, cotizacion_id, etiqueta, notas, updated_at)"
+)
+
+
+def separar_workspace(vuelos: list) -> dict:
+    """Quita el workspace embebido de cada vuelo y devuelve {id: workspace}.
+    PostgREST lo manda como objeto (uno a uno) o como lista según la versión."""
+    work_map = {}
+    for v in vuelos:
+        w = v.pop("workspace", None)
+        if isinstance(w, list):
+            w = w[0] if w else None
+        if w:
+            work_map[str(v["id"])] = w
+            cache_workspace.guardar(v["id"], w)
+    return work_map
+
+
 @app.route("/workspace")
 def workspace():
     # Puedes cambiar el filtro según lo que quieras revisar
-    vuelos = (
-        supabase.table("cotizaciones")
-        .select("*")
-        .order("created_at", desc=True)
-        .limit(150)
-        .execute()
-        .data
+    tamano, cursor = leer_paginacion()
+    vuelos, siguiente = paginar(
+        "cotizaciones.pagina_workspace",
+        lectura().table("cotizaciones").select(WORKSPACE_COLUMNAS),
+        tamano,
+        cursor,
     )
+    work_map = separar_workspace(vuelos)
 
-    ids = [v.get("id") for v in vuelos if v.get("id") is not None]
-    work_map = {}
-
-    if ids:
-        ws = (
-            supabase.table("workspace")
-            .select("*")
-            .in_("cotizacion_id", ids)
-            .execute()
-            .data
-        )
-        work_map = {str(w["cotizacion_id"]): w for w in ws}
-
-    return render_template("workspace.html", vuelos=vuelos, work_map=work_map)
+    return render_template(
+        "workspace.html",
+        vuelos=vuelos,
+        work_map=work_map,
+        siguiente=siguiente,
+        tamano=tamano,
+        es_primera=cursor is None,
+    )
 #END ESPACIO DE TRABAJO ------------
 
 
 #---------------- END POINT PARA OBTENER DATOS DE WORKSPACE --------------
+WORKSPACE_LOTE_MAX = PAGINA_MAX
+
+
+@app.route("/workspace/obtener")
+def workspace_obtener_lote():
+    """?ids=1,2,3 -> {"items": {"1": {...}, "3": {...}}}; los que no tienen
+    workspace no aparecen. Lo cacheado no vuelve a la base."""
+    ids = [i for i in (request.args.get("ids") or "").split(",") if i.strip().isdigit()]
+    ids = list(dict.fromkeys(int(i) for i in ids))
+    if len(ids) > WORKSPACE_LOTE_MAX:
+        return jsonify({"ok": False, "error": f"Máximo {WORKSPACE_LOTE_MAX} IDs"}), 400
+
+    items, faltan = {}, []
+    origen = lectura()
+    for i in ids:
+        w = cache_workspace.obtener(i, lambda: None) if origen is supabase else None
+        if w:
+            items[str(i)] = w
+        else:
+            faltan.append(i)
+
+    if faltan:
+        for w in medir(
+            "workspace.in_ids",
+            origen.table("workspace").select("*").in_("cotizacion_id", faltan),
+        ).data:
+            items[str(w["cotizacion_id"])] = w
+            cache_workspace.guardar(w["cotizacion_id"], w)
+
+    return jsonify({"ok": True, "items": items})
+
+
 @app.route("/workspace/obtener/<int:vuelo_id>")
 def workspace_obtener(vuelo_id):
-    res = (
-        supabase.table("workspace")
-        .select("*")
-        .eq("cotizacion_id", vuelo_id)
-        .execute()
-        .data
-    )
-    item = res[0] if res else None
+    item = workspace_por_cotizacion(vuelo_id)
     return jsonify({"ok": True, "item": item})
 #---------------- END POINT PARA OBTENER DATOS DE WORKSPACE --------------
 
@@ -357,7 +835,9 @@ def workspace_guardar():
     }
 
     try:
-        supabase.table("workspace").upsert(data, on_conflict="cotizacion_id").execute()
+        res = medir("workspace.guardar", supabase.table("workspace").upsert(data, on_conflict="cotizacion_id"))
+        cache_workspace.invalidar(cotizacion_id)
+        replicar("workspace", res.data)
         return jsonify({"ok": True})
     except Exception as e:
         app.logger.error(f"workspace_guardar error: {e}")
@@ -375,19 +855,13 @@ def accion_enviar_qr():
         flash("Falta ID de vuelo.", "error")
         return redirect(url_for("por_enviar_qr"))
 
-    res = (
-        supabase.table("cotizaciones")
-        .select("user_id")
-        .eq("id", v_id)
-        .single()
-        .execute()
-    )
+    fila = cotizacion_por_id(v_id)
 
-    if not res.data:
+    if not fila:
         flash("No se encontró el vuelo.", "error")
         return redirect(url_for("por_enviar_qr"))
 
-    user_id_raw = res.data["user_id"]
+    user_id_raw = fila["user_id"]
     try:
         user_id = int(user_id_raw)
     except Exception:
@@ -411,24 +885,26 @@ def accion_enviar_qr():
         "llegar al aeropuerto y escanear directamente."
     )
 
-    try:
-        enviar_mensaje(user_id, instrucciones)
-
-        # mandar cada foto una por una
-        for idx, f in enumerate(fotos):
-            caption = f"Códigos QR vuelo ID {v_id}" if idx == 0 else ""
-            enviar_foto(user_id, f, caption=caption)
+    contenidos = [(f.filename, f.read(), f.mimetype) for f in fotos]
 
-        enviar_mensaje(user_id, "🎉 Disfruta tu vuelo.")
-
-        supabase.table("cotizaciones").update(
-            {"estado": "QR Enviados"}
-        ).eq("id", v_id).execute()
+    # primero el estado: si otro admin ya los envió, no se encola nada
+    res = transicionar(v_id, "QR Enviados", desde="Pago Confirmado")
+    if not res.get("ok"):
+        flash(error_transicion(res), "error")
+        return redirect(url_for("por_enviar_qr"))
 
-        flash("QRs enviados y estado actualizado a 'QR Enviados'.", "success")
+    try:
+        huella = hashlib.sha1(b"".join(c[1] for c in contenidos)).hexdigest()
+        clave = f"qr:{v_id}:{huella}"
+
+        # el worker respeta el orden: instrucciones, álbumes, despedida
+        encolar_mensaje(user_id, instrucciones, clave=f"{clave}:instrucciones")
+        encolar_album(user_id, contenidos, caption=f"Códigos QR vuelo ID {v_id}", clave=f"{clave}:fotos")
+        encolar_mensaje(user_id, "🎉 Disfruta tu vuelo.", clave=f"{clave}:fin")
+        flash("Estado actualizado a 'QR Enviados'; QRs en cola de envío.", "success")
     except Exception as e:
-        app.logger.error(f"Error al enviar QRs a Telegram: {e}")
-        flash("No se pudieron enviar los QRs al usuario.", "error")
+        app.logger.error(f"Error al encolar QRs: {e}")
+        flash("Estado actualizado a 'QR Enviados' pero no se pudieron encolar los QRs.", "error")
 
     return redirect(url_for("por_enviar_qr"))
 # ----------------- PARA ENVIAR QRS --------------
@@ -440,15 +916,14 @@ def accion_enviar_qr():
 @app.route("/proximos-vuelos")
 def proximos_vuelos():
     hoy, hasta = rango_proximos()
-    proximos = (
-        supabase.table("cotizaciones")
+    proximos = medir(
+        "cotizaciones.proximos",
+        lectura().table("cotizaciones")
         .select("*")
         .gte("fecha", str(hoy))
         .lte("fecha", str(hasta))
-        .order("fecha", desc=False)
-        .execute()
-        .data
-    )
+        .order("fecha", desc=False),
+    ).data
     return render_template("proximos_vuelos.html", vuelos=proximos)
 
 _MONEY_RE = re.compile(r"(?:\$|MXN\s*)\s*([0-9][0-9.,]*)", re.IGNORECASE)
@@ -465,32 +940,252 @@ def extraer_total_vuelo(texto: str):
         return float(raw)
     except ValueError:
         return None
-    
+
+
+def leer_monto(texto: str):
+    """Monto capturado a mano ("$1,500.50") -> float, o None si no es un
+    número positivo. monto_pagado() en Postgres solo suma montos numéricos."""
+    limpio = re.sub(r"[\s$,]", "", texto or "")
+    if not re.fullmatch(r"\d+(\.\d+)?", limpio):
+        return None
+    valor = float(limpio)
+    return valor if valor > 0 else None
+
+
+def total_de(v: dict):
+    """Total del vuelo desde la columna guardada por el bot (migrations/0006).
+    Solo las filas que el backfill aún no procesó se parsean aquí."""
+    if v.get("parseado"):
+        total = v.get("total_vuelo")
+        return float(total) if total is not None else None
+    return extraer_total_vuelo(v.get("pedido_completo") or "")
+
+# ----------------- API RESUMEN (polling del dashboard) -----------------
+# Todas las pestañas consultan /api/resumen cada 20 s. El snapshot se arma con
+# una consulta por lista (en paralelo), se guarda en memoria RESUMEN_TTL
+# segundos y se sirve con ETag: si no cambió, el navegador recibe un 304 sin
+# tocar Supabase.
+
+RESUMEN_TTL = float(os.getenv("RESUMEN_TTL", "10"))
+RESUMEN_COLUMNAS = "id, user_id, username, fecha, estado, monto, created_at"
+# filas por lista; los conteos son exactos aunque la lista se corte
+RESUMEN_LISTA_MAX = int(os.getenv("RESUMEN_LISTA_MAX", "100"))
+ESTADOS_RESUMEN = {
+    "Esperando atención": "por_cotizar",
+    "Esperando confirmación de pago": "validar_pagos",
+    "Pago Confirmado": "por_enviar_qr",
+}
+
+_resumen_cache = {"ts": 0.0, "etag": None, "body": None}
+_resumen_lock = threading.Lock()
+
+
+def construir_resumen() -> dict:
+    # count="exact" en cada lista: PostgREST corta la respuesta en max-rows
+    # (1000), así que len() de lo devuelto no es el total
+    hoy, hasta = rango_proximos()
+    consultas = {
+        clave: lectura().table("cotizaciones")
+        .select(RESUMEN_COLUMNAS, count="exact")
+        .eq("estado", estado)
+        .order("created_at", desc=True)
+        .limit(RESUMEN_LISTA_MAX)
+        for estado, clave in ESTADOS_RESUMEN.items()
+    }
+    consultas["proximos_vuelos"] = (
+        lectura().table("cotizaciones")
+        .select(RESUMEN_COLUMNAS, count="exact")
+        .gte("fecha", str(hoy))
+        .lte("fecha", str(hasta))
+        .order("fecha")
+        .order("created_at", desc=True)
+        .limit(RESUMEN_LISTA_MAX)
+    )
+    futuros = {
+        clave: _pool_consultas.submit(medir, f"cotizaciones.resumen[{clave}]", query)
+        for clave, query in consultas.items()
+    }
+    respuestas = {clave: futuro.result() for clave, futuro in futuros.items()}
+
+    return {
+        "conteos": {clave: res.count for clave, res in respuestas.items()},
+        "listas": {clave: res.data for clave, res in respuestas.items()},
+        "rango_proximos": {"desde": str(hoy), "hasta": str(hasta)},
+    }
+
+
+def obtener_resumen():
+    """Devuelve (etag, body_json) del snapshot, reconstruyéndolo si expiró."""
+    with _resumen_lock:
+        if _resumen_cache["body"] is None or time.monotonic() - _resumen_cache["ts"] > RESUMEN_TTL:
+            body = json.dumps(construir_resumen(), ensure_ascii=False, sort_keys=True)
+            _resumen_cache["body"] = body
+            _resumen_cache["etag"] = hashlib.sha1(body.encode("utf-8")).hexdigest()
+            _resumen_cache["ts"] = time.monotonic()
+        return _resumen_cache["etag"], _resumen_cache["body"]
+
+
+@app.route("/api/resumen")
+def api_resumen():
+    try:
+        etag, body = obtener_resumen()
+    except Exception as e:
+        app.logger.error(f"api_resumen error: {e}")
+        return jsonify({"ok": False, "error": "No se pudo cargar el resumen"}), 500
+
+    if request.if_none_match.contains(etag):
+        resp = app.response_class(status=304)
+    else:
+        resp = app.response_class(body, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+# ----------------- EVENTOS EN VIVO (SSE) -----------------
+# Una suscripción a Supabase Realtime por proceso; cada pestaña abierta
+# recibe los cambios por /api/eventos y parcha sus filas sin recargar.
+# Cada conexión ocupa un hilo mientras está abierta: gunicorn corre con
+# workers gthread (dashboard/gunicorn.conf.py).
+
+SSE_HEARTBEAT = 15
+
+difusor = en_vivo.Difusor()
+
+
+def _invalidar_caches(evento):
+    _resumen_cache["ts"] = 0.0
+    fila = evento["fila"] or evento["anterior"]
+    if evento["tabla"] == "cotizaciones":
+        cache_cotizaciones.invalidar(fila.get("id"))
+    elif evento["tabla"] == "workspace":
+        cache_workspace.invalidar(fila.get("cotizacion_id"))
+    if replica is not None:
+        replica.al_evento(evento)
+
+
+difusor.al_publicar(_invalidar_caches)
+
+
+def _al_cambiar_realtime(suscrito: bool):
+    # lo cacheado antes o durante el corte pudo perderse un evento
+    cache_cotizaciones.limpiar()
+    cache_workspace.limpiar()
+
+
+difusor.al_cambiar_estado(_al_cambiar_realtime)
+
+
+@app.route("/api/cache")
+def api_cache():
+    return jsonify({
+        "cotizaciones": cache_cotizaciones.estadisticas(),
+        "workspace": cache_workspace.estadisticas(),
+        "replica": replica.estadisticas() if replica is not None else None,
+    })
+
+
+# ----------------- FOTOS (referencia y comprobante) -----------------
+# La clave es el sha256 del contenido: nunca cambia, se cachea un año.
+
+FOTO_CLAVE_RE = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{64}\.jpg$")
+FOTO_MAX_AGE = 365 * 24 * 3600
+
+
+@app.route("/fotos/<path:clave>")
+def foto(clave):
+    if not FOTO_CLAVE_RE.match(clave):
+        abort(404)
+    etag = clave[3:67]
+
+    if FOTOS_DIR:
+        resp = send_from_directory(FOTOS_DIR, clave, mimetype="image/jpeg", max_age=FOTO_MAX_AGE, etag=etag)
+    elif FOTOS_BUCKET:
+        if request.if_none_match.contains(etag):
+            resp = Response(status=304)
+        else:
+            try:
+                datos = supabase.storage.from_(FOTOS_BUCKET).download(clave)
+            except Exception:
+                abort(404)
+            resp = Response(datos, mimetype="image/jpeg")
+        resp.set_etag(etag)
+        resp.cache_control.max_age = FOTO_MAX_AGE
+    else:
+        abort(404)
+
+    resp.cache_control.public = True
+    resp.cache_control.immutable = True
+    return resp
+
+
+@app.route("/metrics")
+def metrics():
+    cuerpo, tipo = metricas.exponer()
+    return Response(cuerpo, content_type=tipo)
+
+if REALTIME_ACTIVO:
+    en_vivo.iniciar(SUPABASE_URL, SUPABASE_KEY, difusor, logger=app.logger)
+
+
+@app.route("/api/eventos")
+def api_eventos():
+    cola = difusor.suscribir()
+
+    def generar():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    evento = cola.get(timeout=SSE_HEARTBEAT)
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                if evento is None:
+                    return
+                yield en_vivo.formato_sse(evento)
+        finally:
+            difusor.desuscribir(cola)
+
+    return Response(
+        stream_with_context(generar()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # ----------------- HISTORIAL -----------------
 
+HISTORIAL_COLUMNAS = "id, user_id, username, fecha, monto, estado, created_at"
+HISTORIAL_USUARIO_COLUMNAS = "id, user_id, username, fecha, monto, estado, pedido_completo, created_at"
+
 @app.route("/historial")
 def historial():
-    vuelos = (
-        supabase.table("cotizaciones")
-        .select("*")
-        .order("created_at", desc=True)
-        .limit(300)
-        .execute()
-        .data
+    tamano, cursor = leer_paginacion()
+    vuelos, siguiente = paginar(
+        "cotizaciones.pagina_historial",
+        lectura().table("cotizaciones").select(HISTORIAL_COLUMNAS),
+        tamano,
+        cursor,
+    )
+    return render_template(
+        "historial.html",
+        vuelos=vuelos,
+        estados=ESTADOS,
+        siguiente=siguiente,
+        tamano=tamano,
+        es_primera=cursor is None,
     )
-    return render_template("historial.html", vuelos=vuelos)
 
 #historial por usuario
 @app.route("/historial/usuario/<user_id>")
 def historial_usuario(user_id):
-    vuelos = (
-        supabase.table("cotizaciones")
-        .select("*")
-        .eq("user_id", str(user_id))
-        .order("created_at", desc=True)
-        .limit(500)
-        .execute()
-        .data
+    tamano, cursor = leer_paginacion()
+    vuelos, siguiente = paginar(
+        "cotizaciones.pagina_usuario",
+        lectura().table("cotizaciones")
+        .select(HISTORIAL_USUARIO_COLUMNAS)
+        .eq("user_id", str(user_id)),
+        tamano,
+        cursor,
     )
 
     username = vuelos[0].get("username", "SinUser") if vuelos else "SinUser"
@@ -498,30 +1193,184 @@ def historial_usuario(user_id):
         "historial_usuario.html",
         vuelos=vuelos,
         user_id=user_id,
-        username=username
+        username=username,
+        siguiente=siguiente,
+        tamano=tamano,
+        es_primera=cursor is None,
+    )
+# ----------------- EXPORTAR -----------------
+# Todas las cotizaciones (con la etiqueta del workspace) en CSV o JSONL
+# para contabilidad. Se leen por bloques con el mismo cursor que el
+# historial y cada bloque se envía en cuanto llega: la memoria no crece
+# con la tabla.
+
+ESTADOS = (
+    "Esperando atención", "Cotizado", "Esperando confirmación de pago", "Pago Confirmado", "QR Enviados",
+)
+EXPORT_COLUMNAS = (
+    "id, created_at, user_id, username, fecha, estado, monto, total_vuelo, moneda, origen, destino, "
+    "workspace(etiqueta)"
+)
+EXPORT_CAMPOS = [
+    "id", "created_at", "user_id", "username", "fecha", "estado", "monto",
+    "total_vuelo", "moneda", "origen", "destino", "etiqueta",
+]
+# paginar() pide lote + 1 filas: con el max-rows de PostgREST en 1000 (el
+# default de Supabase) un lote de 1000 cortaría el export sin avisar
+EXPORT_LOTE = 500
+_CSV_FORMULA = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _leer_fecha(nombre: str):
+    raw = (request.args.get(nombre) or "").strip()
+    return datetime.strptime(raw, "%Y-%m-%d").date() if raw else None
+
+
+def _celda_csv(valor):
+    # Excel toma como fórmula un texto que empieza con =, +, -, @
+    if isinstance(valor, str) and valor.startswith(_CSV_FORMULA):
+        return "'" + valor
+    return valor
+
+
+def _fila_export(v: dict) -> dict:
+    w = v.get("workspace")
+    if isinstance(w, list):
+        w = w[0] if w else None
+    return {**{c: v.get(c) for c in EXPORT_CAMPOS}, "etiqueta": (w or {}).get("etiqueta")}
+
+
+@app.route("/export")
+def exportar():
+    """?formato=csv|jsonl, ?desde= y ?hasta= (AAAA-MM-DD sobre created_at
+    en UTC, ambos inclusive) y ?estado= (se puede repetir)."""
+    formato = request.args.get("formato", "csv")
+    estados = [e for e in request.args.getlist("estado") if e]
+    try:
+        desde, hasta = _leer_fecha("desde"), _leer_fecha("hasta")
+    except ValueError:
+        return jsonify({"ok": False, "error": "Fecha inválida; usa AAAA-MM-DD"}), 400
+    if formato not in ("csv", "jsonl"):
+        return jsonify({"ok": False, "error": "Formato inválido; usa csv o jsonl"}), 400
+    if any(e not in ESTADOS for e in estados):
+        return jsonify({"ok": False, "error": "Estado inválido"}), 400
+
+    def consulta():
+        query = lectura().table("cotizaciones").select(EXPORT_COLUMNAS)
+        if desde:
+            query = query.gte("created_at", str(desde))
+        if hasta:
+            query = query.lt("created_at", str(hasta + timedelta(days=1)))
+        if estados:
+            query = query.in_("estado", estados)
+        return query
+
+    # El primer bloque antes de responder: si la base falla aquí es un 500
+    # y no un archivo vacío con status 200
+    filas, siguiente = paginar("cotizaciones.export", consulta(), EXPORT_LOTE, None)
+
+    def generar(filas, siguiente):
+        buffer = io.StringIO()
+        escritor = csv.DictWriter(buffer, EXPORT_CAMPOS)
+        if formato == "csv":
+            buffer.write("\ufeff")  # BOM: Excel abre bien los acentos
+            escritor.writeheader()
+        while True:
+            for v in filas:
+                fila = _fila_export(v)
+                if formato == "csv":
+                    escritor.writerow({c: _celda_csv(x) for c, x in fila.items()})
+                else:
+                    buffer.write(json.dumps(fila, ensure_ascii=False, default=str) + "\n")
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            if not siguiente:
+                return
+            try:
+                filas, siguiente = paginar(
+                    "cotizaciones.export", consulta(), EXPORT_LOTE, decodificar_cursor(siguiente)
+                )
+            except Exception as e:
+                # ya se mandó el status: cortar la conexión para que la
+                # descarga falle en lugar de quedar incompleta sin aviso
+                app.logger.error(f"export interrumpido: {e}")
+                raise
+
+    nombre = f"cotizaciones_{desde or 'inicio'}_{hasta or datetime.utcnow().date()}.{formato}"
+    return Response(
+        stream_with_context(generar(filas, siguiente)),
+        mimetype="text/csv" if formato == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{nombre}"', "X-Accel-Buffering": "no"},
     )
+
+
+# ----------------- BÚSQUEDA -----------------
+# Texto libre sobre ID, @usuario, pedido_completo y notas del workspace
+# (columna `busqueda` con índice GIN, migrations/0007). Cada término se
+# busca como prefijo y deben aparecer todos: "canc cdmx" encuentra
+# "CDMX a Cancún". Los resultados se paginan igual que el historial.
+
+BUSQUEDA_COLUMNAS = "id, user_id, username, fecha, monto, estado, pedido_completo, created_at"
+BUSQUEDA_MAX_TERMINOS = 8
+
+
+def terminos_busqueda(texto: str) -> list:
+    """Misma normalización que busqueda_normalizar() en la migración."""
+    sin_acentos = unicodedata.normalize("NFKD", texto or "").encode("ascii", "ignore").decode().lower()
+    return re.findall(r"[a-z0-9]+", sin_acentos)
+
+
+def consulta_busqueda(q: str) -> str:
+    """'Cancún  @u123' -> 'cancun:* & u123:*'."""
+    return " & ".join(f"{t}:*" for t in terminos_busqueda(q)[:BUSQUEDA_MAX_TERMINOS])
+
+
+@app.route("/buscar")
+def buscar():
+    q = (request.args.get("q") or "").strip()
+    tsquery = consulta_busqueda(q)
+    tamano, cursor = leer_paginacion()
+
+    vuelos, siguiente = [], None
+    if tsquery:
+        vuelos, siguiente = paginar(
+            "cotizaciones.buscar",
+            supabase.table("cotizaciones")
+            .select(BUSQUEDA_COLUMNAS)
+            .filter("busqueda", "fts(simple)", tsquery),
+            tamano,
+            cursor,
+        )
+
+    if request.args.get("formato") == "json" or request.accept_mimetypes.best == "application/json":
+        return jsonify({"ok": True, "q": q, "resultados": vuelos, "siguiente": siguiente})
+
+    return render_template(
+        "buscar.html",
+        q=q,
+        vuelos=vuelos,
+        siguiente=siguiente,
+        tamano=tamano,
+        es_primera=cursor is None,
+    )
+
+
 @app.route("/vuelo/<vuelo_id>")
 def vuelo_detalle(vuelo_id):
     """Detalle completo de un vuelo por ID."""
     try:
-        res = (
-            supabase.table("cotizaciones")
-            .select("*")
-            .eq("id", vuelo_id)
-            .single()
-            .execute()
-        )
+        v = cotizacion_por_id(vuelo_id)
     except Exception as e:
         app.logger.error(f"Error al cargar vuelo {vuelo_id}: {e}")
         flash("No se pudo cargar el detalle del vuelo.", "error")
         return redirect(url_for("historial"))
 
-    v = res.data
     if not v:
         flash("Vuelo no encontrado.", "error")
         return redirect(url_for("historial"))
 
-    total_vuelo = extraer_total_vuelo(v.get("pedido_completo", "") or "")
+    total_vuelo = total_de(v)
 
     monto_val = None
     try:
@@ -0,0 +1,145 @@
+"""Eventos en vivo para el dashboard.
+
+Una sola suscripción a Supabase Realtime por proceso (cambios en
+`cotizaciones` y `workspace`) que se reparte a todos los navegadores
+conectados por Server-Sent Events.
+"""
+import asyncio
+import json
+import queue
+import threading
+
+from supabase import acreate_client
+
+TABLAS = ("cotizaciones", "workspace")
+COLA_MAX = 200  # eventos sin leer antes de desconectar a un cliente lento
+REINTENTO_MAX = 60
+
+
+class Difusor:
+    """Reparte cada evento a la cola de cada cliente SSE conectado."""
+
+    def __init__(self):
+        self._clientes = set()
+        self._lock = threading.Lock()
+        self._oyentes = []
+        self._oyentes_estado = []
+        # True solo con el canal en SUBSCRIBED: entonces llegan todos los cambios
+        self.suscrito = False
+
+    def suscribir(self) -> queue.Queue:
+        cola = queue.Queue(maxsize=COLA_MAX)
+        with self._lock:
+            self._clientes.add(cola)
+        return cola
+
+    def desuscribir(self, cola: queue.Queue):
+        with self._lock:
+            self._clientes.discard(cola)
+
+    def al_publicar(self, fn):
+        """Registra una función que se llama con cada evento (p. ej. invalidar cachés)."""
+        self._oyentes.append(fn)
+
+    def al_cambiar_estado(self, fn):
+        """Registra una función que se llama con `suscrito` cuando la
+        suscripción se activa o se pierde (p. ej. vaciar cachés)."""
+        self._oyentes_estado.append(fn)
+
+    def marcar_suscrito(self, suscrito: bool):
+        if suscrito == self.suscrito:
+            return
+        self.suscrito = suscrito
+        for fn in self._oyentes_estado:
+            fn(suscrito)
+
+    def publicar(self, evento: dict):
+        for fn in self._oyentes:
+            fn(evento)
+
+        with self._lock:
+            clientes = list(self._clientes)
+        for cola in clientes:
+            try:
+                cola.put_nowait(evento)
+            except queue.Full:
+                # cliente que no lee: lo soltamos, el navegador reconecta
+                self.desuscribir(cola)
+                with cola.mutex:
+                    cola.queue.clear()
+                cola.put_nowait(None)
+
+    @property
+    def conectados(self) -> int:
+        with self._lock:
+            return len(self._clientes)
+
+
+def normalizar(tabla: str, payload: dict) -> dict:
+    """Convierte el payload de Realtime a {tabla, tipo, fila, anterior}."""
+    datos = payload.get("data", payload)
+    return {
+        "tabla": datos.get("table", tabla),
+        "tipo": datos.get("type") or datos.get("eventType"),
+        "fila": datos.get("record") or datos.get("new") or {},
+        "anterior": datos.get("old_record") or datos.get("old") or {},
+    }
+
+
+def formato_sse(evento: dict) -> str:
+    return f"event: {evento['tabla']}\ndata: {json.dumps(evento, ensure_ascii=False)}\n\n"
+
+
+def iniciar(url: str, key: str, difusor: Difusor, logger=None):
+    """Arranca en un hilo propio el loop asyncio con la suscripción."""
+
+    def al_suscribir(estado, error=None):
+        suscrito = getattr(estado, "value", estado) == "SUBSCRIBED"
+        difusor.marcar_suscrito(suscrito)
+        if logger and suscrito:
+            logger.info(f"realtime: suscrito a {', '.join(TABLAS)}")
+        elif logger:
+            logger.warning(f"realtime: suscripción {estado} ({error})")
+
+    async def escuchar():
+        cliente = await acreate_client(url, key)
+        try:
+            canal = cliente.channel("dashboard")
+            for tabla in TABLAS:
+                canal.on_postgres_changes(
+                    "*",
+                    schema="public",
+                    table=tabla,
+                    callback=lambda payload, t=tabla: difusor.publicar(normalizar(t, payload)),
+                )
+            await canal.subscribe(al_suscribir)
+            await cliente.realtime.listen()
+            # según la versión de realtime, listen() bloquea o vuelve enseguida
+            while cliente.realtime.is_connected:
+                await asyncio.sleep(5)
+            if logger:
+                logger.error("realtime: conexión cerrada")
+        finally:
+            difusor.marcar_suscrito(False)
+            try:
+                await cliente.realtime.close()
+            except Exception:
+                pass
+
+    async def principal():
+        espera = 1
+        while True:
+            try:
+                await escuchar()
+                espera = 1
+            except Exception as e:
+                if logger:
+                    logger.error(f"realtime: conexión perdida ({e}), reintento en {espera}s")
+            await asyncio.sleep(espera)
+            espera = min(espera * 2, REINTENTO_MAX)
+
+    hilo = threading.Thread(
+        target=lambda: asyncio.run(principal()), name="realtime", daemon=True
+    )
+    hilo.start()
+    return hilo
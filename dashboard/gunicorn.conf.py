@@ -0,0 +1,16 @@
+"""Configuración de gunicorn del dashboard (dashboard/Procfile).
+
+gunicorn la carga sola al arrancar desde dashboard/. Cada pestaña abierta
+mantiene un /api/eventos (SSE) y ocupa un hilo mientras está abierta: con
+el worker sync por defecto, unas pocas pestañas dejan sin workers libres al
+resto de las páginas. Con gthread cada conexión tiene su hilo.
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = "gthread"
+# un proceso: una suscripción a Realtime y las métricas sin
+# PROMETHEUS_MULTIPROC_DIR; se escala con hilos
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+# pestañas con eventos en vivo + requests normales a la vez
+threads = int(os.getenv("GUNICORN_HILOS", "64"))
@@ -0,0 +1,108 @@
+"""Métricas Prometheus del dashboard (expuestas en /metrics).
+
+- Tiempo de cada consulta a Supabase por nombre (`cotizaciones.por_estado`,
+  `workspace.in_ids`, ...) y aviso en el log si pasa de SLOW_QUERY_MS.
+- Latencia y errores de la Bot API por método.
+- Latencia por ruta y tiempo de render de cada plantilla.
+- Transiciones de estado hechas desde el dashboard.
+
+Con varios workers de gunicorn define PROMETHEUS_MULTIPROC_DIR (un
+directorio vacío por deploy) para que /metrics sume todos los procesos.
+"""
+import logging
+import os
+import time
+
+from flask import before_render_template, g, request, template_rendered
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram,
+    generate_latest, multiprocess,
+)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+log = logging.getLogger(__name__)
+
+DB_CONSULTA = Histogram(
+    "dashboard_db_consulta_segundos", "Duración de consultas a Supabase", ["consulta"], buckets=BUCKETS
+)
+DB_ERRORES = Counter("dashboard_db_errores_total", "Consultas a Supabase que fallaron", ["consulta"])
+DB_VENCIDAS = Counter(
+    "dashboard_db_vencidas_total", "Consultas en paralelo que no terminaron antes del plazo de la página", ["consulta"]
+)
+TELEGRAM_LLAMADA = Histogram(
+    "dashboard_telegram_segundos", "Duración de llamadas a la Bot API", ["metodo"], buckets=BUCKETS
+)
+TELEGRAM_ERRORES = Counter(
+    "dashboard_telegram_errores_total", "Llamadas a la Bot API con error", ["metodo", "codigo"]
+)
+RUTA = Histogram("dashboard_ruta_segundos", "Duración de cada request por ruta", ["ruta"], buckets=BUCKETS)
+RESPUESTAS = Counter("dashboard_respuestas_total", "Respuestas por ruta y status", ["ruta", "status"])
+RENDER = Histogram("dashboard_render_segundos", "Render de plantillas Jinja", ["plantilla"], buckets=BUCKETS)
+TRANSICIONES = Counter("dashboard_transiciones_total", "Cambios de estado hechos desde el dashboard", ["hacia"])
+
+
+def medir(nombre: str, query):
+    """Ejecuta `query` (builder de supabase-py o rpc) midiendo su duración.
+    Las consultas a la réplica local (replica.py) se etiquetan `replica.<nombre>`."""
+    nombre = getattr(query, "prefijo_metrica", "") + nombre
+    inicio = time.perf_counter()
+    try:
+        return query.execute()
+    except Exception:
+        DB_ERRORES.labels(nombre).inc()
+        raise
+    finally:
+        segundos = time.perf_counter() - inicio
+        DB_CONSULTA.labels(nombre).observe(segundos)
+        if segundos * 1000 > SLOW_QUERY_MS:
+            log.warning(f"consulta lenta {nombre}: {segundos * 1000:.0f} ms")
+
+
+def transicion(hacia: str, n: int = 1):
+    if n:
+        TRANSICIONES.labels(hacia).inc(n)
+
+
+def instrumentar(app):
+    """Mide cada request por endpoint y cada render de plantilla."""
+
+    @app.before_request
+    def _inicio():
+        g.metricas_inicio = time.perf_counter()
+
+    @app.teardown_request
+    def _fin(exc):
+        inicio = g.pop("metricas_inicio", None)
+        if inicio is None or request.endpoint in (None, "static", "metrics", "api_eventos"):
+            return
+        RUTA.labels(request.endpoint).observe(time.perf_counter() - inicio)
+
+    @app.after_request
+    def _status(resp):
+        if request.endpoint not in (None, "static", "metrics"):
+            RESPUESTAS.labels(request.endpoint, str(resp.status_code)).inc()
+        return resp
+
+    def _antes_render(sender, template, context, **extra):
+        g.metricas_render = time.perf_counter()
+
+    def _despues_render(sender, template, context, **extra):
+        inicio = g.pop("metricas_render", None)
+        if inicio is not None:
+            RENDER.labels(template.name or "?").observe(time.perf_counter() - inicio)
+
+    before_render_template.connect(_antes_render, app, weak=False)
+    template_rendered.connect(_despues_render, app, weak=False)
+
+
+def exponer():
+    """(cuerpo, content_type) para /metrics."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+    else:
+        registro = REGISTRY
+    return generate_latest(registro), CONTENT_TYPE_LATEST
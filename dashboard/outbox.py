@@ -0,0 +1,327 @@
+"""Cola persistente (outbox) de notificaciones salientes a Telegram.
+
+Las acciones del dashboard solo encolan; un hilo worker drena la cola
+respetando los límites de Telegram (global y por chat), reintenta con
+backoff exponencial ante 429/5xx (usando retry_after cuando viene) y
+sobrevive reinicios porque todo vive en SQLite. Los límites también se
+guardan en el archivo: varios procesos (workers de gunicorn) con el mismo
+OUTBOX_DB los comparten en lugar de multiplicarlos.
+"""
+import json
+import random
+import sqlite3
+import threading
+import time
+
+from telegram_http import TelegramError
+
+ESQUEMA = """
+create table if not exists outbox (
+    id integer primary key autoincrement,
+    clave text unique,
+    chat_id integer not null,
+    metodo text not null,
+    payload text not null,
+    estado text not null default 'pendiente',
+    intentos integer not null default 0,
+    proximo_intento real not null default 0,
+    error text,
+    creado real not null,
+    enviado real
+);
+create index if not exists outbox_pendientes on outbox (estado, chat_id, id);
+
+create table if not exists outbox_archivos (
+    outbox_id integer not null references outbox (id) on delete cascade,
+    campo text not null,
+    filename text,
+    mimetype text,
+    contenido blob not null
+);
+create index if not exists outbox_archivos_id on outbox_archivos (outbox_id);
+
+-- límites de envío compartidos entre procesos (reloj: time.time())
+create table if not exists outbox_tokens (
+    id integer primary key check (id = 1),
+    tokens real not null,
+    ts real not null
+);
+
+create table if not exists outbox_chats (
+    chat_id integer primary key,
+    ultimo real not null
+);
+"""
+
+# Límites recomendados por Telegram
+GLOBAL_POR_SEG = 25
+INTERVALO_POR_CHAT = 1.0
+
+MAX_INTENTOS = 8
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 600.0
+LEASE = 120.0  # segundos que un envío queda reservado por un worker
+RETENCION_ENVIADOS = 7 * 24 * 3600
+
+
+class Outbox:
+    def __init__(self, ruta: str, enviar, logger=None, intervalo: float = 1.0):
+        """`enviar(metodo, data, files=None, timeout=...)` hace la llamada
+        real a la Bot API y lanza TelegramError si falla."""
+        self.ruta = ruta
+        self.enviar = enviar
+        self.logger = logger
+        self.intervalo = intervalo
+
+        self._local = threading.local()
+        self._despertar = threading.Event()
+        self._parar = threading.Event()
+        self._hilos = []
+        self._ultima_limpieza = 0.0
+
+        self._conexion().executescript(ESQUEMA)
+
+    # ---------- conexión ----------
+
+    def _conexion(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.ruta, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("pragma journal_mode=wal")
+            conn.execute("pragma foreign_keys=on")
+            self._local.conn = conn
+        return conn
+
+    # ---------- encolar ----------
+
+    def encolar(self, chat_id: int, metodo: str, data: dict, archivos=None, clave=None):
+        """Guarda una notificación. `archivos` es {campo: (filename, bytes, mimetype)}.
+        Si `clave` ya existe no se duplica. Devuelve el id o None si era duplicado."""
+        return self.encolar_lote([(chat_id, metodo, data, archivos, clave)])[0]
+
+    def encolar_lote(self, items: list) -> list:
+        """Como encolar() pero con varias notificaciones en una sola transacción.
+        `items` son tuplas (chat_id, metodo, data, archivos, clave)."""
+        conn = self._conexion()
+        ids = []
+        conn.execute("begin immediate")
+        try:
+            for chat_id, metodo, data, archivos, clave in items:
+                ids.append(self._insertar(conn, chat_id, metodo, data, archivos, clave))
+            conn.execute("commit")
+        except Exception:
+            conn.execute("rollback")
+            raise
+
+        self._despertar.set()
+        return ids
+
+    def _insertar(self, conn, chat_id, metodo, data, archivos, clave):
+        cur = conn.execute(
+            "insert or ignore into outbox (clave, chat_id, metodo, payload, creado) "
+            "values (?, ?, ?, ?, ?)",
+            (clave, chat_id, metodo, json.dumps(data), time.time()),
+        )
+        if cur.rowcount == 0:
+            return None
+
+        outbox_id = cur.lastrowid
+        for campo, (filename, contenido, mimetype) in (archivos or {}).items():
+            conn.execute(
+                "insert into outbox_archivos (outbox_id, campo, filename, mimetype, contenido) "
+                "values (?, ?, ?, ?, ?)",
+                (outbox_id, campo, filename, mimetype, contenido),
+            )
+        return outbox_id
+
+    # ---------- worker ----------
+
+    def iniciar(self, hilos: int = 1):
+        """Arranca `hilos` workers; cada uno reserva filas distintas."""
+        if any(h.is_alive() for h in self._hilos):
+            return
+        self._hilos = [
+            threading.Thread(target=self._bucle, name=f"outbox-{i}", daemon=True)
+            for i in range(hilos)
+        ]
+        for hilo in self._hilos:
+            hilo.start()
+
+    def detener(self):
+        self._parar.set()
+        self._despertar.set()
+
+    def _bucle(self):
+        while not self._parar.is_set():
+            procesados = 0
+            try:
+                procesados = self.procesar_lote()
+                self._limpiar()
+            except Exception as e:
+                self._log("error", f"outbox: error en el worker: {e}")
+
+            if not procesados:
+                if self._despertar.wait(self.intervalo):
+                    self._despertar.clear()
+
+    def procesar_lote(self, limite: int = 50) -> int:
+        """Envía lo que toque ahora. Solo toma el primer pendiente de cada
+        chat, así los mensajes de un mismo usuario llegan en orden."""
+        conn = self._conexion()
+        ahora = time.time()
+        filas = conn.execute(
+            """
+            select o.* from outbox o
+            where o.estado = 'pendiente'
+              and o.proximo_intento <= ?
+              and o.id = (
+                  select min(p.id) from outbox p
+                  where p.chat_id = o.chat_id and p.estado = 'pendiente'
+              )
+            order by o.id
+            limit ?
+            """,
+            (ahora, limite),
+        ).fetchall()
+
+        enviados = 0
+        for fila in filas:
+            if self._parar.is_set():
+                break
+            if not self._reservar(fila["id"]):
+                continue  # otro hilo o proceso lo tomó, o el chat aún no está libre
+            self._esperar_token()
+            self._enviar_fila(fila)
+            enviados += 1
+        return enviados
+
+    def _reservar(self, outbox_id: int) -> bool:
+        """Toma la fila si nadie la tiene y su chat no recibió nada en el
+        último INTERVALO_POR_CHAT (en cualquier proceso)."""
+        ahora = time.time()
+        cur = self._conexion().execute(
+            "update outbox set proximo_intento = ?, intentos = intentos + 1 "
+            "where id = ? and estado = 'pendiente' and proximo_intento <= ? "
+            "and not exists (select 1 from outbox_chats c "
+            "                where c.chat_id = outbox.chat_id and c.ultimo > ?)",
+            (ahora + LEASE, outbox_id, ahora, ahora - INTERVALO_POR_CHAT),
+        )
+        return cur.rowcount == 1
+
+    def _enviar_fila(self, fila):
+        conn = self._conexion()
+        archivos = {
+            a["campo"]: (a["filename"], a["contenido"], a["mimetype"])
+            for a in conn.execute(
+                "select * from outbox_archivos where outbox_id = ?", (fila["id"],)
+            )
+        }
+        intentos = fila["intentos"] + 1
+
+        try:
+            self.enviar(
+                fila["metodo"],
+                json.loads(fila["payload"]),
+                files=archivos or None,
+                timeout=30 if archivos else 10,
+            )
+        except TelegramError as e:
+            if e.reintentable:
+                self._reprogramar(fila, intentos, str(e), e.retry_after)
+            else:
+                # 400/403 (chat bloqueado, datos inválidos): reintentar no sirve
+                self._marcar_fallido(fila, str(e))
+            return
+        except Exception as e:
+            # red, payload corrupto, bug: con backoff y MAX_INTENTOS, no cada LEASE para siempre
+            self._reprogramar(fila, intentos, f"{type(e).__name__}: {e}", None)
+            return
+        finally:
+            conn.execute(
+                "insert into outbox_chats (chat_id, ultimo) values (?, ?) "
+                "on conflict (chat_id) do update set ultimo = excluded.ultimo",
+                (fila["chat_id"], time.time()),
+            )
+
+        conn.execute(
+            "update outbox set estado = 'enviado', enviado = ?, error = null where id = ?",
+            (time.time(), fila["id"]),
+        )
+
+    def _reprogramar(self, fila, intentos: int, error: str, retry_after):
+        if intentos >= MAX_INTENTOS:
+            self._marcar_fallido(fila, error)
+            return
+        if retry_after is not None:
+            espera = float(retry_after)
+        else:
+            espera = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (intentos - 1))
+            espera += random.uniform(0, espera / 4)
+        self._log("warning", f"outbox: {fila['metodo']} id={fila['id']} falló ({error}), reintento en {espera:.0f}s")
+        self._conexion().execute(
+            "update outbox set proximo_intento = ?, error = ? where id = ?",
+            (time.time() + espera, error, fila["id"]),
+        )
+
+    def _marcar_fallido(self, fila, error: str):
+        self._log("error", f"outbox: {fila['metodo']} id={fila['id']} descartado: {error}")
+        self._conexion().execute(
+            "update outbox set estado = 'fallido', error = ? where id = ?",
+            (error, fila["id"]),
+        )
+
+    # ---------- límites de envío ----------
+
+    def _esperar_token(self):
+        """Token bucket de GLOBAL_POR_SEG guardado en el archivo."""
+        conn = self._conexion()
+        while True:
+            conn.execute("begin immediate")
+            try:
+                ahora = time.time()
+                fila = conn.execute("select tokens, ts from outbox_tokens where id = 1").fetchone()
+                tokens = float(GLOBAL_POR_SEG)
+                if fila:
+                    tokens = min(tokens, fila["tokens"] + max(0.0, ahora - fila["ts"]) * GLOBAL_POR_SEG)
+                espera = 0.0
+                if tokens >= 1:
+                    tokens -= 1
+                else:
+                    espera = (1 - tokens) / GLOBAL_POR_SEG
+                conn.execute(
+                    "insert into outbox_tokens (id, tokens, ts) values (1, ?, ?) "
+                    "on conflict (id) do update set tokens = excluded.tokens, ts = excluded.ts",
+                    (tokens, ahora),
+                )
+                conn.execute("commit")
+            except Exception:
+                conn.execute("rollback")
+                raise
+            if not espera:
+                return
+            time.sleep(espera)
+
+    # ---------- mantenimiento ----------
+
+    def _limpiar(self):
+        ahora = time.monotonic()
+        if ahora - self._ultima_limpieza < 3600:
+            return
+        self._ultima_limpieza = ahora
+        conn = self._conexion()
+        conn.execute(
+            "delete from outbox where estado = 'enviado' and enviado < ?",
+            (time.time() - RETENCION_ENVIADOS,),
+        )
+        conn.execute("delete from outbox_chats where ultimo < ?", (time.time() - INTERVALO_POR_CHAT,))
+
+    def pendientes(self) -> int:
+        fila = self._conexion().execute(
+            "select count(*) from outbox where estado = 'pendiente'"
+        ).fetchone()
+        return fila[0]
+
+    def _log(self, nivel: str, msg: str):
+        if self.logger:
+            getattr(self.logger, nivel)(msg)
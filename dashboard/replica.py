@@ -0,0 +1,635 @@
+"""Réplica local (SQLite en modo WAL) de `cotizaciones` y `workspace` para
+las lecturas del dashboard.
+
+Opcional (REPLICA_DB). Las páginas leen de aquí con el mismo query builder
+que supabase-py (el subconjunto que usa app_dashboard.py); las escrituras
+siguen yendo a Supabase.
+
+- Sincronización incremental por marca de agua (updated_at, clave) de
+  migrations/0012 cada `intervalo` segundos, y enseguida tras un evento de
+  Realtime. Un solo proceso por archivo sincroniza (flock); los demás
+  workers de gunicorn leen el mismo archivo.
+- Leer lo propio: después de escribir, el dashboard aplica aquí la fila que
+  devolvió Supabase (aplicar / refrescar), así quien hizo el cambio lo ve
+  al recargar aunque la sincronización vaya atrasada.
+- Si Supabase no responde se sigue leyendo la réplica; atraso() dice
+  cuántos segundos lleva sin sincronizar para avisarlo en la página.
+
+Las columnas se crean al llegar, así que una columna nueva en Supabase
+aparece aquí sin tocar este archivo.
+"""
+import fcntl
+import json
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from metricas import medir
+
+# tabla -> columna clave (única en Supabase)
+TABLAS = {"cotizaciones": "id", "workspace": "cotizacion_id"}
+
+# Tipos conocidos; el resto se deduce del primer valor no nulo que llega.
+# Con afinidad, SQLite convierte el parámetro al comparar: eq("user_id", 123)
+# encuentra "123" como en Postgres.
+TIPOS = {
+    "cotizaciones": {
+        "id": "integer", "created_at": "text", "updated_at": "text", "user_id": "text",
+        "estado": "text", "fecha": "text", "total_vuelo": "real", "parseado": "bool",
+    },
+    "workspace": {
+        "cotizacion_id": "integer", "id": "integer", "updated_at": "text", "user_id": "text",
+    },
+}
+AFINIDAD = {"bool": "integer", "json": "text"}
+# Nunca null en Supabase: se ordenan sin `nulls first/last`, que en SQLite
+# impide usar el índice para el orden
+SIN_NULOS = {"id", "cotizacion_id", "created_at", "updated_at"}
+IGNORAR = {"busqueda"}  # tsvector de migrations/0007: la réplica no busca
+
+INDICES = [
+    "create index if not exists cot_estado_created on cotizaciones (estado, created_at)",
+    "create index if not exists cot_created_id on cotizaciones (created_at, id)",
+    "create index if not exists cot_fecha on cotizaciones (fecha)",
+    "create index if not exists cot_user_created on cotizaciones (user_id, created_at)",
+    "create index if not exists ws_id on workspace (id)",
+]
+
+ESQUEMA_META = """
+create table if not exists _meta (clave text primary key, valor text);
+create table if not exists _columnas (
+    tabla text not null,
+    columna text not null,
+    tipo text not null,
+    primary key (tabla, columna)
+);
+"""
+
+# Recursos embebidos: (tabla, relación) -> (columna propia, columna de la relación)
+RELACIONES = {("cotizaciones", "workspace"): ("id", "cotizacion_id")}
+
+OPERADORES = {"eq": "=", "neq": "<>", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+NOMBRE_RE = re.compile(r"^[a-z_][a-z0-9_]*$")
+LOTE_IDS = 200  # ids por consulta in_ al refrescar
+
+
+class Respuesta:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class Replica:
+    def __init__(self, ruta: str, supabase, logger=None, intervalo: float = 5.0,
+                 margen: float = 30.0, lote: int = 1000, reconciliar: float = 3600.0):
+        """`supabase` es el cliente de donde se sincroniza. `margen`: segundos
+        que se vuelven a pedir hacia atrás de la marca en cada ciclo.
+        `reconciliar`: cada cuánto se buscan filas borradas sin evento."""
+        self.ruta = ruta
+        self.supabase = supabase
+        self.logger = logger
+        self.intervalo = intervalo
+        self.margen = margen
+        self.lote = lote
+        self.cada_reconciliar = reconciliar
+
+        self._local = threading.local()
+        self._escritura = threading.Lock()
+        self._despertar = threading.Event()
+        self._sucios = {tabla: set() for tabla in TABLAS}
+        self._sucios_lock = threading.Lock()
+        self._lider = None  # archivo con el flock si este proceso sincroniza
+        self._lista = False
+        self._ultima_reconciliacion = None  # la primera, en el primer ciclo
+        self._tipos = {}
+        self._version = None
+
+        conn = self._conexion()
+        conn.executescript(ESQUEMA_META)
+        with self._escritura:
+            conn.execute("begin immediate")
+            try:
+                for tabla, clave in TABLAS.items():
+                    conn.execute(f"create table if not exists {tabla} ({clave} integer primary key)")
+                    self._agregar_columnas(conn, tabla, TIPOS[tabla])
+                for sql in INDICES:
+                    conn.execute(sql)
+                conn.execute("commit")
+            except Exception:
+                conn.execute("rollback")
+                raise
+
+    # ---------- conexión y esquema ----------
+
+    def _conexion(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.ruta, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("pragma journal_mode=wal")
+            conn.execute("pragma synchronous=normal")  # es una copia: perder el último commit no importa
+            self._local.conn = conn
+        return conn
+
+    def _columnas(self, tabla: str) -> dict:
+        """{columna: tipo} de la tabla; se recarga si otro proceso cambió el esquema."""
+        conn = self._conexion()
+        version = conn.execute("pragma schema_version").fetchone()[0]
+        if version != self._version:
+            tipos = {t: {} for t in TABLAS}
+            for fila in conn.execute("select tabla, columna, tipo from _columnas"):
+                tipos[fila["tabla"]][fila["columna"]] = fila["tipo"]
+            self._tipos, self._version = tipos, version
+        return self._tipos[tabla]
+
+    def _agregar_columnas(self, conn, tabla: str, tipos: dict):
+        """Crea las columnas que falten. Corre dentro de `begin immediate`, así
+        que dos procesos no agregan la misma a la vez."""
+        existentes = {f["name"] for f in conn.execute(f"pragma table_info({tabla})")}
+        for col, tipo in tipos.items():
+            if col not in existentes:
+                conn.execute(f"alter table {tabla} add column {col} {AFINIDAD.get(tipo, tipo)}")
+            conn.execute(
+                "insert into _columnas (tabla, columna, tipo) values (?, ?, ?) "
+                "on conflict (tabla, columna) do update set tipo = excluded.tipo where _columnas.tipo = ''",
+                (tabla, col, tipo),
+            )
+
+    def _meta(self, clave: str):
+        fila = self._conexion().execute("select valor from _meta where clave = ?", (clave,)).fetchone()
+        return fila["valor"] if fila else None
+
+    def _guardar_meta(self, clave: str, valor: str):
+        with self._escritura:
+            self._conexion().execute(
+                "insert into _meta (clave, valor) values (?, ?) "
+                "on conflict (clave) do update set valor = excluded.valor",
+                (clave, valor),
+            )
+
+    # ---------- lectura ----------
+
+    def table(self, nombre: str) -> "Consulta":
+        if nombre not in TABLAS:
+            raise ValueError(f"la réplica no tiene la tabla {nombre}")
+        return Consulta(self, nombre)
+
+    def lista(self) -> bool:
+        """True cuando ya terminó una sincronización completa (en este u otro proceso)."""
+        if not self._lista:
+            self._lista = self._meta("lista") == "1"
+        return self._lista
+
+    def atraso(self):
+        """Segundos desde la última sincronización exitosa, o None si nunca hubo."""
+        ts = self._meta("sincronizado")
+        return time.time() - float(ts) if ts else None
+
+    def estadisticas(self) -> dict:
+        conn = self._conexion()
+        return {
+            "lista": self.lista(),
+            "lider": self._lider is not None,
+            "atraso": self.atraso(),
+            **{tabla: conn.execute(f"select count(*) from {tabla}").fetchone()[0] for tabla in TABLAS},
+        }
+
+    # ---------- escritura ----------
+
+    def aplicar(self, tabla: str, filas: list) -> int:
+        """Upsert de filas completas como las devuelve Supabase. No pisa una
+        versión más nueva (updated_at) que ya esté en la réplica."""
+        clave = TABLAS[tabla]
+        filas = [f for f in filas or [] if f.get(clave) is not None]
+        if not filas:
+            return 0
+
+        nuevas = {}
+        tipos = self._columnas(tabla)
+        for fila in filas:
+            for col, valor in fila.items():
+                if tipos.get(col) or col in IGNORAR or not NOMBRE_RE.match(col):
+                    continue
+                if valor is not None or col not in nuevas:
+                    nuevas[col] = _tipo_de(valor)
+
+        grupos = {}
+        for fila in filas:
+            cols = tuple(c for c in fila if c not in IGNORAR and NOMBRE_RE.match(c))
+            grupos.setdefault(cols, []).append(fila)
+
+        conn = self._conexion()
+        with self._escritura:
+            conn.execute("begin immediate")
+            try:
+                if nuevas:
+                    self._agregar_columnas(conn, tabla, nuevas)
+                    self._version = None  # un tipo '' que se conoció no cambia schema_version
+                tipos = {**tipos, **nuevas}
+                for cols, grupo in grupos.items():
+                    sets = ", ".join(f"{c} = excluded.{c}" for c in cols if c != clave)
+                    conn.executemany(
+                        f"insert into {tabla} ({', '.join(cols)}) values ({', '.join('?' * len(cols))}) "
+                        f"on conflict ({clave}) do update set {sets} "
+                        f"where excluded.updated_at is null or {tabla}.updated_at is null "
+                        f"or excluded.updated_at >= {tabla}.updated_at",
+                        [[_a_sqlite(f[c], tipos.get(c)) for c in cols] for f in grupo],
+                    )
+                conn.execute("commit")
+            except Exception:
+                conn.execute("rollback")
+                raise
+        return len(filas)
+
+    def borrar(self, tabla: str, valores: list, columna: str = None):
+        valores = list(valores)
+        if not valores:
+            return
+        with self._escritura:
+            self._conexion().execute(
+                f"delete from {tabla} where {columna or TABLAS[tabla]} in ({', '.join('?' * len(valores))})",
+                valores,
+            )
+
+    def refrescar(self, tabla: str, claves: list):
+        """Vuelve a leer esas filas de Supabase; las que ya no existen se borran."""
+        clave = TABLAS[tabla]
+        claves = list(dict.fromkeys(int(c) for c in claves))
+        for inicio in range(0, len(claves), LOTE_IDS):
+            parte = claves[inicio:inicio + LOTE_IDS]
+            filas = medir(
+                f"replica.refrescar.{tabla}",
+                self.supabase.table(tabla).select("*").in_(clave, parte),
+            ).data
+            self.aplicar(tabla, filas)
+            self.borrar(tabla, set(parte) - {f[clave] for f in filas})
+
+    # ---------- eventos de Realtime ----------
+
+    def al_evento(self, evento: dict):
+        """Marca la fila del evento para refrescarla desde Supabase en el
+        siguiente ciclo (se adelanta). El payload de Realtime no trae las
+        fechas en el mismo formato que PostgREST, por eso no se aplica tal cual."""
+        tabla = evento.get("tabla")
+        if self._lider is None or tabla not in TABLAS:
+            return
+        fila = evento.get("fila") or {}
+        anterior = evento.get("anterior") or {}
+        if evento.get("tipo") == "DELETE":
+            # sin replica identity full, el anterior solo trae la llave primaria
+            if anterior.get("id") is not None:
+                self.borrar(tabla, [anterior["id"]], columna="id")
+            return
+        valor = fila.get(TABLAS[tabla])
+        if valor is None:
+            return
+        with self._sucios_lock:
+            self._sucios[tabla].add(valor)
+        self._despertar.set()
+
+    # ---------- sincronización ----------
+
+    def iniciar(self):
+        """Arranca el hilo que sincroniza. Solo el proceso que obtiene el
+        flock sincroniza; los demás reintentan tomarlo en cada ciclo."""
+        hilo = threading.Thread(target=self._bucle, name="replica", daemon=True)
+        hilo.start()
+        return hilo
+
+    def _tomar_lider(self) -> bool:
+        archivo = open(self.ruta + ".lock", "a")
+        try:
+            fcntl.flock(archivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            archivo.close()
+            return False
+        self._lider = archivo  # se libera solo si el proceso muere
+        return True
+
+    def _bucle(self):
+        while True:
+            try:
+                if self._lider is not None or self._tomar_lider():
+                    self.sincronizar()
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"réplica: no se pudo sincronizar ({e}); atraso {self.atraso() or 0:.0f}s")
+            self._despertar.wait(self.intervalo)
+            self._despertar.clear()
+
+    def sincronizar(self):
+        """Un ciclo: lo que cambió desde la marca, lo marcado por eventos y,
+        de vez en cuando, los borrados que no llegaron por Realtime."""
+        for tabla in TABLAS:
+            self._sincronizar_tabla(tabla)
+
+        for tabla in TABLAS:
+            with self._sucios_lock:
+                sucios, self._sucios[tabla] = self._sucios[tabla], set()
+            if sucios:
+                self.refrescar(tabla, sucios)
+
+        if self._ultima_reconciliacion is None or time.monotonic() - self._ultima_reconciliacion > self.cada_reconciliar:
+            for tabla in TABLAS:
+                self._reconciliar(tabla)
+            self._ultima_reconciliacion = time.monotonic()
+
+        self._guardar_meta("sincronizado", str(time.time()))
+        if not self.lista():
+            self._guardar_meta("lista", "1")
+
+    def _sincronizar_tabla(self, tabla: str):
+        clave = TABLAS[tabla]
+        marca = self._meta(f"marca:{tabla}")
+        marca = tuple(json.loads(marca)) if marca else None
+        desde = _restar(marca[0], self.margen) if marca else None
+
+        cursor = None
+        while True:
+            query = self.supabase.table(tabla).select("*")
+            if cursor:
+                w, k = cursor
+                query = query.or_(f'updated_at.gt."{w}",and(updated_at.eq."{w}",{clave}.gt.{k})')
+            elif desde:
+                query = query.gte("updated_at", desde)
+            filas = medir(
+                f"replica.sincronizar.{tabla}",
+                query.order("updated_at").order(clave).limit(self.lote),
+            ).data
+            self.aplicar(tabla, filas)
+
+            if filas:
+                cursor = (filas[-1]["updated_at"], filas[-1][clave] or 0)
+                # updated_at llega siempre con el formato de PostgREST: el
+                # orden de los textos es el orden de las fechas
+                if marca is None or cursor > marca:
+                    marca = cursor
+                    self._guardar_meta(f"marca:{tabla}", json.dumps(marca))
+            if len(filas) < self.lote:
+                return
+
+    def _reconciliar(self, tabla: str):
+        """Borra las filas locales que ya no están en Supabase. Solo toca las
+        que no cambiaron desde antes de empezar, para no borrar una que se
+        creó mientras se recorrían las claves."""
+        clave = TABLAS[tabla]
+        inicio = (datetime.now(timezone.utc) - timedelta(seconds=self.margen)).isoformat()
+        remotas, ultima = set(), None
+        while True:
+            query = self.supabase.table(tabla).select(clave)
+            if ultima is not None:
+                query = query.gt(clave, ultima)
+            filas = medir(
+                f"replica.reconciliar.{tabla}",
+                query.order(clave).limit(self.lote),
+            ).data
+            remotas.update(f[clave] for f in filas)
+            if len(filas) < self.lote:
+                break
+            ultima = filas[-1][clave]
+
+        sobran = [
+            f[0] for f in self._conexion().execute(
+                f"select {clave} from {tabla} where updated_at < ?", (inicio,)
+            )
+            if f[0] not in remotas
+        ]
+        if sobran:
+            self.borrar(tabla, sobran)
+            if self.logger:
+                self.logger.info(f"réplica: {len(sobran)} fila(s) de {tabla} borradas en Supabase")
+
+
+class Consulta:
+    """Solo lectura: select (con workspace embebido y count), filtros, or_,
+    order y limit con la misma semántica que PostgREST."""
+
+    prefijo_metrica = "replica."  # medir() etiqueta las consultas locales aparte
+
+    def __init__(self, replica: Replica, tabla: str):
+        self.replica = replica
+        self.tabla = tabla
+        self.tipos = replica._columnas(tabla)
+        self.cols = "*"
+        self.where = []
+        self.args = []
+        self.orden = []
+        self.limite = None
+        self.contar = False
+        self.solo_conteo = False
+
+    def select(self, cols: str = "*", count=None, head=False):
+        self.cols = cols
+        self.contar = count is not None  # "exact": siempre exacto aquí
+        self.solo_conteo = head
+        return self
+
+    # --- filtros ---
+
+    def _col(self, col: str) -> str:
+        # una columna que nunca trajo un valor es null en todas las filas
+        return col if col in self.tipos else "null"
+
+    def _filtro(self, col, op, valor):
+        self.where.append(f"{self._col(col)} {OPERADORES[op]} ?")
+        self.args.append(_a_sqlite(valor, self.tipos.get(col)))
+        return self
+
+    def eq(self, col, valor):
+        return self._filtro(col, "eq", valor)
+
+    def neq(self, col, valor):
+        return self._filtro(col, "neq", valor)
+
+    def gt(self, col, valor):
+        return self._filtro(col, "gt", valor)
+
+    def gte(self, col, valor):
+        return self._filtro(col, "gte", valor)
+
+    def lt(self, col, valor):
+        return self._filtro(col, "lt", valor)
+
+    def lte(self, col, valor):
+        return self._filtro(col, "lte", valor)
+
+    def is_(self, col, valor):
+        self.where.append(f"{self._col(col)} is null" if valor in (None, "null") else "0")
+        return self
+
+    def in_(self, col, valores):
+        valores = list(valores)
+        if not valores:
+            self.where.append("0")
+            return self
+        self.where.append(f"{self._col(col)} in ({', '.join('?' * len(valores))})")
+        self.args.extend(_a_sqlite(v, self.tipos.get(col)) for v in valores)
+        return self
+
+    def or_(self, expr: str):
+        sql, args = self._logica(expr, "or")
+        self.where.append(sql)
+        self.args.extend(args)
+        return self
+
+    def _logica(self, expr: str, union: str):
+        partes, args = [], []
+        for cond in _partir(expr):
+            m = re.match(r"^(and|or)\((.*)\)$", cond)
+            if m:
+                sql, a = self._logica(m.group(2), m.group(1))
+                partes.append(sql)
+                args.extend(a)
+                continue
+            col, op, valor = cond.split(".", 2)
+            if op == "in":
+                vals = [_sin_comillas(v) for v in _partir(valor.strip("()"))]
+                partes.append(f"{self._col(col)} in ({', '.join('?' * len(vals))})")
+                args.extend(vals)
+            elif op == "is":
+                partes.append(f"{self._col(col)} is null")
+            else:
+                partes.append(f"{self._col(col)} {OPERADORES[op]} ?")
+                args.append(_a_sqlite(_sin_comillas(valor), self.tipos.get(col)))
+        return "(" + f" {union} ".join(partes) + ")", args
+
+    def order(self, col, desc=False, nullsfirst=None):
+        orden = f"{self._col(col)} {'desc' if desc else 'asc'}"
+        if col not in SIN_NULOS:
+            # mismo lugar para los NULL que Postgres por defecto
+            nulos = nullsfirst if nullsfirst is not None else desc
+            orden += f" nulls {'first' if nulos else 'last'}"
+        self.orden.append(orden)
+        return self
+
+    def limit(self, n: int):
+        self.limite = int(n)
+        return self
+
+    # --- ejecución ---
+
+    def _proyeccion(self):
+        if self.cols.strip() == "*":
+            return [f"{self.tabla}.*"], {}
+        cols, embebidos = [], {}
+        for c in _partir(self.cols):
+            m = re.fullmatch(r"(\w+)\((.*)\)", c, re.S)
+            if not m:
+                cols.append(f"{self._col(c)} as {c}" if NOMBRE_RE.match(c) else self._col(c))
+                continue
+            relacion, sub = m.group(1), m.group(2)
+            propia, ajena = RELACIONES[(self.tabla, relacion)]
+            tipos = self.replica._columnas(relacion)
+            sub_cols = list(tipos) if sub.strip() == "*" else _partir(sub)
+            pares = ", ".join(f"'{s}', {'r.' + s if s in tipos else 'null'}" for s in sub_cols)
+            cols.append(
+                f"(select json_object({pares}) from {relacion} r "
+                f"where r.{ajena} = {self.tabla}.{propia}) as {relacion}"
+            )
+            embebidos[relacion] = tipos
+        return cols, embebidos
+
+    def execute(self) -> Respuesta:
+        cols, embebidos = self._proyeccion()
+        where = " where " + " and ".join(self.where) if self.where else ""
+        count = None
+        if self.contar:
+            count = self.replica._conexion().execute(
+                f"select count(*) from {self.tabla}{where}", self.args
+            ).fetchone()[0]
+            if self.solo_conteo:
+                return Respuesta([], count)
+
+        sql = f"select {', '.join(cols)} from {self.tabla}{where}"
+        if self.orden:
+            sql += " order by " + ", ".join(self.orden)
+        if self.limite is not None:
+            sql += f" limit {self.limite}"
+
+        cur = self.replica._conexion().cursor()
+        cur.row_factory = None
+        cur.execute(sql, self.args)
+        nombres = [d[0] for d in cur.description]
+        filas = [dict(zip(nombres, f)) for f in cur]
+
+        decodificar = [c for c in nombres if self.tipos.get(c) in ("bool", "json")]
+        for fila in filas:
+            _de_sqlite(fila, decodificar, self.tipos)
+            for relacion, tipos in embebidos.items():
+                if fila[relacion]:
+                    sub = json.loads(fila[relacion])
+                    fila[relacion] = _de_sqlite(sub, list(sub), tipos)
+        return Respuesta(filas, count)
+
+
+# --- VALORES ---
+
+def _tipo_de(valor) -> str:
+    if isinstance(valor, bool):
+        return "bool"
+    if isinstance(valor, int):
+        return "integer"
+    if isinstance(valor, float):
+        return "real"
+    if isinstance(valor, (dict, list)):
+        return "json"
+    if isinstance(valor, str):
+        return "text"
+    return ""  # siempre null hasta ahora: sin afinidad
+
+
+def _a_sqlite(valor, tipo: str = None):
+    if isinstance(valor, (dict, list)):
+        return json.dumps(valor, ensure_ascii=False)
+    if isinstance(valor, bool):
+        return int(valor)
+    if tipo == "bool" and valor in ("true", "false"):
+        return int(valor == "true")
+    return valor
+
+
+def _de_sqlite(fila: dict, columnas: list, tipos: dict) -> dict:
+    """Devuelve bool y json de `columnas` a como los manda PostgREST."""
+    for col in columnas:
+        valor = fila[col]
+        if valor is None:
+            continue
+        tipo = tipos.get(col)
+        if tipo == "bool":
+            fila[col] = bool(valor)
+        elif tipo == "json" and isinstance(valor, str):
+            fila[col] = json.loads(valor)
+    return fila
+
+
+def _restar(marca: str, segundos: float) -> str:
+    return (datetime.fromisoformat(marca) - timedelta(seconds=segundos)).isoformat()
+
+
+def _sin_comillas(v: str) -> str:
+    v = v.strip()
+    if len(v) >= 2 and v[0] == v[-1] == '"':
+        return v[1:-1]
+    return v
+
+
+def _partir(expr: str) -> list:
+    """Parte por comas de primer nivel (respeta paréntesis y comillas)."""
+    partes, actual, nivel, comillas = [], "", 0, False
+    for ch in expr:
+        if ch == '"':
+            comillas = not comillas
+        elif not comillas and ch == "(":
+            nivel += 1
+        elif not comillas and ch == ")":
+            nivel -= 1
+        elif not comillas and nivel == 0 and ch == ",":
+            partes.append(actual)
+            actual = ""
+            continue
+        actual += ch
+    if actual:
+        partes.append(actual)
+    return [p.strip() for p in partes]
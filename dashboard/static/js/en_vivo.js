@@ -0,0 +1,88 @@
+// Actualizaciones en vivo: escucha /api/eventos (SSE) y parcha las filas
+// de la página sin recargar. Las filas llevan data-vuelo-id y las celdas
+// editables data-campo. Si la lista filtra por estado (data-live-estado),
+// las filas que cambian de estado se quitan y las nuevas se avisan.
+(function () {
+  if (!window.EventSource) return;
+
+  const lista = document.querySelector("[data-live-estado]");
+  const estadoLista = lista ? lista.dataset.liveEstado : null;
+  let nuevos = 0;
+
+  function filas(id) {
+    return document.querySelectorAll(`tr[data-vuelo-id="${id}"]`);
+  }
+
+  function setCampo(tr, campo, valor) {
+    const el = tr.querySelector(`[data-campo="${campo}"]`);
+    if (!el) return;
+    el.textContent = (valor === null || valor === undefined || valor === "") ? "-" : valor;
+  }
+
+  function marcar(tr) {
+    tr.classList.remove("row-flash");
+    void tr.offsetWidth; // reinicia la animación
+    tr.classList.add("row-flash");
+  }
+
+  function quitar(tr) {
+    tr.classList.add("row-out");
+    setTimeout(() => tr.remove(), 350);
+  }
+
+  function avisarNuevos() {
+    let aviso = document.getElementById("live-banner");
+    if (!aviso) {
+      aviso = document.createElement("div");
+      aviso.id = "live-banner";
+      aviso.className = "live-banner";
+      aviso.addEventListener("click", () => window.location.reload());
+      lista.prepend(aviso);
+    }
+    aviso.textContent = `Hay ${nuevos} vuelo(s) nuevo(s) en esta lista · Clic para actualizar`;
+  }
+
+  const eventos = new EventSource("/api/eventos");
+
+  eventos.addEventListener("cotizaciones", (e) => {
+    const ev = JSON.parse(e.data);
+    const v = ev.fila || {};
+    const id = v.id ?? (ev.anterior || {}).id;
+    if (id === undefined) return;
+    const trs = filas(id);
+
+    if (ev.tipo === "DELETE" || (estadoLista && v.estado !== estadoLista)) {
+      trs.forEach(quitar);
+      return;
+    }
+
+    trs.forEach(tr => {
+      ["estado", "monto"].forEach(c => { if (c in v) setCampo(tr, c, v[c]); });
+      marcar(tr);
+    });
+
+    if (estadoLista && !trs.length && v.estado === estadoLista) {
+      nuevos += 1;
+      avisarNuevos();
+    }
+  });
+
+  eventos.addEventListener("workspace", (e) => {
+    const ev = JSON.parse(e.data);
+    const w = ev.fila || {};
+    // La página del workspace guarda las notas en memoria para el modal
+    document.dispatchEvent(new CustomEvent("en-vivo:workspace", { detail: w }));
+    filas(w.cotizacion_id).forEach(tr => {
+      const el = tr.querySelector('[data-campo="etiqueta"]');
+      if (el && w.etiqueta) {
+        el.innerHTML = "";
+        const tag = document.createElement("span");
+        tag.className = `tag tag-${w.etiqueta}`;
+        tag.textContent = w.etiqueta;
+        el.appendChild(tag);
+      }
+      setCampo(tr, "ws_updated_at", w.updated_at);
+      marcar(tr);
+    });
+  });
+})();
@@ -0,0 +1,109 @@
+"""Cliente HTTP compartido para la Bot API de Telegram.
+
+Un solo pool de conexiones keep-alive (httpx, HTTP/2 si `h2` está
+instalado) para todos los hilos del proceso, en lugar de abrir una
+conexión TLS nueva por cada mensaje.
+"""
+import os
+import time
+
+import httpx
+
+import metricas
+
+TELEGRAM_API = os.getenv("TELEGRAM_API", "https://api.telegram.org")
+TELEGRAM_POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", "16"))
+TELEGRAM_TIMEOUT = float(os.getenv("TELEGRAM_TIMEOUT", "10"))
+TELEGRAM_CONNECT_TIMEOUT = float(os.getenv("TELEGRAM_CONNECT_TIMEOUT", "5"))
+TELEGRAM_HTTP2 = os.getenv("TELEGRAM_HTTP2", "1") == "1"
+
+
+def _h2_disponible() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class TelegramError(Exception):
+    """Fallo de una llamada a la Bot API. `status_code` es None si fue de red."""
+
+    def __init__(self, metodo: str, status_code=None, descripcion: str = "", retry_after=None):
+        super().__init__(f"{metodo}: {status_code or 'red'} {descripcion}".strip())
+        self.metodo = metodo
+        self.status_code = status_code
+        self.descripcion = descripcion
+        self.retry_after = retry_after
+
+    @property
+    def reintentable(self) -> bool:
+        return self.status_code is None or self.status_code == 429 or self.status_code >= 500
+
+
+class TelegramClient:
+    def __init__(
+        self,
+        token: str,
+        pool_size: int = TELEGRAM_POOL_SIZE,
+        timeout: float = TELEGRAM_TIMEOUT,
+        http2: bool = TELEGRAM_HTTP2,
+        logger=None,
+    ):
+        self.token = token
+        self.timeout = timeout
+        self.logger = logger
+        self.http2 = http2 and _h2_disponible()
+        self._http = httpx.Client(
+            base_url=f"{TELEGRAM_API}/bot{token}/",
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size,
+            ),
+            timeout=httpx.Timeout(timeout, connect=TELEGRAM_CONNECT_TIMEOUT),
+        )
+
+    def llamar(self, metodo: str, data: dict = None, files=None, timeout: float = None):
+        """Llama un método de la Bot API y devuelve `result`.
+        `files` es {campo: (filename, contenido, mimetype)}."""
+        data = {k: str(v) for k, v in (data or {}).items() if v is not None}
+        inicio = time.perf_counter()
+        try:
+            r = self._http.post(
+                metodo,
+                data=data,
+                files=files,
+                timeout=timeout or self.timeout,
+            )
+        except httpx.TransportError as e:
+            metricas.TELEGRAM_ERRORES.labels(metodo, "red").inc()
+            raise TelegramError(metodo, None, str(e)) from e
+        segundos = time.perf_counter() - inicio
+        ms = segundos * 1000
+        metricas.TELEGRAM_LLAMADA.labels(metodo).observe(segundos)
+
+        if self.logger:
+            enviados = r.request.headers.get("content-length", "?")
+            self.logger.info(
+                f"telegram {metodo}: {ms:.0f} ms, {enviados} bytes enviados, "
+                f"{len(r.content)} bytes recibidos, status {r.status_code} ({r.http_version})"
+            )
+
+        try:
+            cuerpo = r.json()
+        except ValueError:
+            cuerpo = {}
+
+        if r.status_code != 200 or not cuerpo.get("ok"):
+            metricas.TELEGRAM_ERRORES.labels(metodo, str(r.status_code)).inc()
+            raise TelegramError(
+                metodo,
+                r.status_code,
+                cuerpo.get("description") or r.text[:200],
+                (cuerpo.get("parameters") or {}).get("retry_after"),
+            )
+        return cuerpo.get("result")
+
+    def cerrar(self):
+        self._http.close()
@@ -0,0 +1,110 @@
+"""Fotos de las cotizaciones: referencia del vuelo y comprobante de pago.
+
+El bot descarga cada foto de Telegram una sola vez y la guarda por
+contenido: la clave es el sha256 de los bytes (`ab/abcd….jpg`), así que la
+misma imagen enviada dos veces ocupa un solo archivo y una clave nunca
+cambia de contenido (el dashboard la sirve con caché de un año).
+
+La miniatura no se recalcula: Telegram ya manda cada foto en varios
+tamaños (≈90, 320, 800 y 1280 px) y se guarda el más chico que tenga al
+menos MINI_LADO px de lado mayor.
+
+- Carpeta local (FOTOS_DIR) si bot y dashboard comparten disco.
+- Bucket de Supabase Storage (FOTOS_BUCKET) si corren en hosts distintos.
+- Sin ninguna de las dos no se guarda nada (como antes).
+"""
+import asyncio
+import hashlib
+import io
+import os
+import tempfile
+
+MINI_LADO = int(os.getenv("FOTOS_MINI_LADO", "320"))
+
+
+def clave_para(datos: bytes) -> str:
+    h = hashlib.sha256(datos).hexdigest()
+    return f"{h[:2]}/{h}.jpg"  # Telegram recodifica las fotos a JPEG
+
+
+def elegir_tamanos(fotos):
+    """(más grande, miniatura) de la lista de PhotoSize de un mensaje."""
+    fotos = sorted(fotos, key=lambda f: max(f.width, f.height))
+    mini = next((f for f in fotos if max(f.width, f.height) >= MINI_LADO), fotos[-1])
+    return fotos[-1], mini
+
+
+# --- ALMACENES ---
+
+class AlmacenFotosLocal:
+    def __init__(self, carpeta: str):
+        self.carpeta = carpeta
+        os.makedirs(carpeta, exist_ok=True)
+
+    def ruta(self, clave: str) -> str:
+        return os.path.join(self.carpeta, clave)
+
+    def guardar(self, clave: str, datos: bytes):
+        ruta = self.ruta(clave)
+        if os.path.exists(ruta):
+            return  # mismo contenido, ya está
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(ruta), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(datos)
+        os.replace(tmp, ruta)  # nadie ve un archivo a medias
+
+
+class AlmacenFotosSupabase:
+    def __init__(self, supabase, bucket: str):
+        self.supabase = supabase
+        self.bucket = bucket
+
+    def guardar(self, clave: str, datos: bytes):
+        try:
+            self.supabase.storage.from_(self.bucket).upload(
+                clave, datos, {"content-type": "image/jpeg", "upsert": "false"}
+            )
+        except Exception as e:
+            # la clave es el hash: si ya existe, es la misma imagen
+            if "Duplicate" not in str(e) and "already exists" not in str(e):
+                raise
+
+
+def almacen_desde_entorno(supabase):
+    if os.getenv("FOTOS_BUCKET"):
+        return AlmacenFotosSupabase(supabase, os.getenv("FOTOS_BUCKET"))
+    if os.getenv("FOTOS_DIR"):
+        return AlmacenFotosLocal(os.getenv("FOTOS_DIR"))
+    return None
+
+
+# --- DESCARGA DESDE TELEGRAM ---
+
+async def _descargar(foto) -> bytes:
+    # PTB lee la respuesta entera antes de escribirla (no hay descarga por
+    # partes); las fotos de Telegram pesan pocos cientos de KB. BytesIO evita
+    # las dos copias de download_as_bytearray() + bytes().
+    archivo = await foto.get_file()
+    buf = io.BytesIO()
+    await archivo.download_to_memory(buf)
+    return buf.getvalue()
+
+
+async def guardar_fotos(almacen, fotos, ejecutor=None) -> tuple:
+    """Descarga la foto grande y la miniatura de un mensaje, las guarda y
+    devuelve sus claves (grande, mini). Escribir al almacén es bloqueante,
+    así que corre en `ejecutor`."""
+    grande, mini = elegir_tamanos(fotos)
+    if mini.file_unique_id == grande.file_unique_id:
+        datos = [await _descargar(grande)]
+    else:
+        datos = await asyncio.gather(_descargar(grande), _descargar(mini))
+
+    loop = asyncio.get_running_loop()
+    claves = []
+    for d in datos:
+        clave = clave_para(d)
+        await loop.run_in_executor(ejecutor, almacen.guardar, clave, d)
+        claves.append(clave)
+    return claves[0], claves[-1]
@@ -0,0 +1,100 @@
+"""Métricas Prometheus del bot (expuestas en /metrics del servidor web).
+
+- Tiempo de cada consulta a Supabase por nombre y aviso en el log si pasa
+  de SLOW_QUERY_MS.
+- Latencia y errores de la Bot API por método.
+- Latencia de cada update por tipo (incluye la espera por el lock del usuario).
+- Transiciones de user_data["estado"].
+
+Con BOT_WORKERS > 1 define PROMETHEUS_MULTIPROC_DIR para que el /metrics
+del proceso de ingreso sume las métricas de todos los workers.
+"""
+import logging
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram,
+    generate_latest, multiprocess,
+)
+from telegram.request import HTTPXRequest
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+log = logging.getLogger(__name__)
+
+DB_CONSULTA = Histogram(
+    "bot_db_consulta_segundos", "Duración de consultas a Supabase", ["consulta"], buckets=BUCKETS
+)
+DB_ERRORES = Counter("bot_db_errores_total", "Consultas a Supabase que fallaron", ["consulta"])
+TELEGRAM_LLAMADA = Histogram(
+    "bot_telegram_segundos", "Duración de llamadas a la Bot API", ["metodo"], buckets=BUCKETS
+)
+TELEGRAM_ERRORES = Counter("bot_telegram_errores_total", "Llamadas a la Bot API con error", ["metodo", "codigo"])
+UPDATE = Histogram("bot_update_segundos", "Procesamiento de cada update por tipo", ["tipo"], buckets=BUCKETS)
+TRANSICIONES = Counter("bot_transiciones_total", "Cambios de user_data['estado']", ["desde", "hacia"])
+
+
+def medir(nombre: str, query):
+    """Ejecuta `query` (builder de supabase-py) midiendo su duración.
+    Corre en el pool de hilos de la base, no en el event loop."""
+    inicio = time.perf_counter()
+    try:
+        return query.execute()
+    except Exception:
+        DB_ERRORES.labels(nombre).inc()
+        raise
+    finally:
+        segundos = time.perf_counter() - inicio
+        DB_CONSULTA.labels(nombre).observe(segundos)
+        if segundos * 1000 > SLOW_QUERY_MS:
+            log.warning(f"consulta lenta {nombre}: {segundos * 1000:.0f} ms")
+
+
+def tipo_update(update) -> str:
+    if getattr(update, "callback_query", None):
+        return "callback"
+    msg = getattr(update, "message", None)
+    if msg is None:
+        return "otro"
+    if msg.photo:
+        return "foto"
+    if msg.text and msg.text.startswith("/"):
+        return "comando"
+    return "texto" if msg.text else "otro"
+
+
+def transicion(desde, hacia):
+    if desde != hacia:
+        TRANSICIONES.labels(desde or "ninguno", hacia or "ninguno").inc()
+
+
+class RequestMedido(HTTPXRequest):
+    """HTTPXRequest de PTB que mide cada llamada a la Bot API."""
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        # descargas de archivos: una sola etiqueta, no una por file_path
+        metodo = "descarga" if "/file/bot" in url else url.rsplit("/", 1)[-1]
+        inicio = time.perf_counter()
+        try:
+            codigo, cuerpo = await super().do_request(url, method, request_data, *args, **kwargs)
+        except Exception:
+            TELEGRAM_ERRORES.labels(metodo, "red").inc()
+            raise
+        finally:
+            TELEGRAM_LLAMADA.labels(metodo).observe(time.perf_counter() - inicio)
+        if codigo != 200:
+            TELEGRAM_ERRORES.labels(metodo, str(codigo)).inc()
+        return codigo, cuerpo
+
+
+def exponer():
+    """(cuerpo, content_type) para /metrics."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+    else:
+        registro = REGISTRY
+    return generate_latest(registro), CONTENT_TYPE_LATEST
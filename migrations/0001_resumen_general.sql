@@ -0,0 +1,29 @@
+-- Agregados de la página General / Estadísticas en una sola llamada.
+-- Uso desde Python: supabase.rpc("resumen_general").execute()
+
+-- monto es texto libre ('$1,500', 'abc' en filas viejas): se quitan '$',
+-- comas y espacios y lo que aún no sea un número cuenta como 0. Un cast
+-- directo fallaría en la carga inicial y en el trigger de 0002.
+create or replace function monto_pagado(estado text, monto text)
+returns numeric
+language sql
+immutable
+as $$
+    select case
+        when estado in ('Pago Confirmado', 'QR Enviados')
+             and regexp_replace(coalesce(monto, ''), '[\s$,]', '', 'g') ~ '^-?\d+(\.\d+)?$'
+            then regexp_replace(monto, '[\s$,]', '', 'g')::numeric
+        else 0
+    end
+$$;
+
+create or replace function resumen_general()
+returns table (usuarios_unicos bigint, total_recaudado numeric)
+language sql
+stable
+as $$
+    select
+        count(distinct c.user_id)::bigint,
+        coalesce(sum(monto_pagado(c.estado, c.monto::text)), 0)
+    from cotizaciones c
+$$;
@@ -0,0 +1,95 @@
+-- OPCIONAL: resumen incremental para que General cueste lo mismo sin
+-- importar cuántas cotizaciones haya. Un trigger mantiene los totales en
+-- cada insert/update/delete y resumen_general() pasa a leer una sola fila.
+
+create table if not exists resumen_totales (
+    id boolean primary key default true check (id),
+    usuarios_unicos bigint not null default 0,
+    total_recaudado numeric not null default 0
+);
+
+create table if not exists resumen_usuarios (
+    user_id text primary key,
+    cotizaciones bigint not null
+);
+
+create or replace function resumen_cotizaciones_trigger()
+returns trigger
+language plpgsql
+as $$
+declare
+    delta_total numeric := 0;
+    delta_usuarios bigint := 0;
+    restantes bigint;
+begin
+    if tg_op in ('UPDATE', 'DELETE') then
+        delta_total := delta_total - monto_pagado(old.estado, old.monto::text);
+    end if;
+    if tg_op in ('INSERT', 'UPDATE') then
+        delta_total := delta_total + monto_pagado(new.estado, new.monto::text);
+    end if;
+
+    -- Conteo de cotizaciones por usuario (solo si cambia el user_id)
+    if old.user_id is not null and (tg_op = 'DELETE'
+       or (tg_op = 'UPDATE' and old.user_id is distinct from new.user_id)) then
+        update resumen_usuarios
+           set cotizaciones = cotizaciones - 1
+         where user_id = old.user_id::text
+        returning cotizaciones into restantes;
+        if restantes = 0 then
+            delete from resumen_usuarios where user_id = old.user_id::text;
+            delta_usuarios := delta_usuarios - 1;
+        end if;
+    end if;
+
+    if new.user_id is not null and (tg_op = 'INSERT'
+       or (tg_op = 'UPDATE' and old.user_id is distinct from new.user_id)) then
+        insert into resumen_usuarios (user_id, cotizaciones)
+        values (new.user_id::text, 1)
+        on conflict (user_id)
+        do update set cotizaciones = resumen_usuarios.cotizaciones + 1
+        returning cotizaciones into restantes;
+        if restantes = 1 then
+            delta_usuarios := delta_usuarios + 1;
+        end if;
+    end if;
+
+    if delta_total <> 0 or delta_usuarios <> 0 then
+        update resumen_totales
+           set total_recaudado = total_recaudado + delta_total,
+               usuarios_unicos = usuarios_unicos + delta_usuarios
+         where id;
+    end if;
+
+    return null;
+end;
+$$;
+
+drop trigger if exists cotizaciones_resumen on cotizaciones;
+create trigger cotizaciones_resumen
+after insert or update of user_id, estado, monto or delete on cotizaciones
+for each row execute function resumen_cotizaciones_trigger();
+
+-- Carga inicial desde los datos existentes
+truncate resumen_usuarios;
+insert into resumen_usuarios (user_id, cotizaciones)
+select user_id::text, count(*) from cotizaciones
+where user_id is not null
+group by user_id;
+
+insert into resumen_totales (id, usuarios_unicos, total_recaudado)
+select true,
+       (select count(*) from resumen_usuarios),
+       coalesce(sum(monto_pagado(estado, monto::text)), 0)
+from cotizaciones
+on conflict (id) do update
+set usuarios_unicos = excluded.usuarios_unicos,
+    total_recaudado = excluded.total_recaudado;
+
+create or replace function resumen_general()
+returns table (usuarios_unicos bigint, total_recaudado numeric)
+language sql
+stable
+as $$
+    select usuarios_unicos, total_recaudado from resumen_totales where id
+$$;
@@ -0,0 +1,19 @@
+-- Publica los cambios de cotizaciones y workspace en Supabase Realtime
+-- (los consume dashboard/en_vivo.py para /api/eventos).
+
+do $$
+begin
+    if not exists (
+        select 1 from pg_publication_tables
+        where pubname = 'supabase_realtime' and tablename = 'cotizaciones'
+    ) then
+        alter publication supabase_realtime add table cotizaciones;
+    end if;
+    if not exists (
+        select 1 from pg_publication_tables
+        where pubname = 'supabase_realtime' and tablename = 'workspace'
+    ) then
+        alter publication supabase_realtime add table workspace;
+    end if;
+end
+$$;
@@ -0,0 +1,16 @@
+-- Cotiza varias solicitudes en una sola escritura. Solo toca las que siguen
+-- en 'Esperando atención' y devuelve las que sí se actualizaron.
+-- Uso: supabase.rpc("cotizar_lote", {"items": [{"id": 1, "monto": "1500.00"}, ...]})
+
+create or replace function cotizar_lote(items jsonb)
+returns table (id bigint, user_id text, monto text)
+language sql
+as $$
+    update cotizaciones c
+       set monto = i.monto,
+           estado = 'Cotizado'
+      from jsonb_to_recordset(items) as i(id bigint, monto text)
+     where c.id = i.id
+       and c.estado = 'Esperando atención'
+    returning c.id, c.user_id::text, c.monto::text
+$$;
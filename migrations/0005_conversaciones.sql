@@ -0,0 +1,10 @@
+-- Estado de conversación del bot compartido entre réplicas
+-- (persistencia.AlmacenSupabase, ESTADO_BACKEND=supabase).
+
+create table if not exists conversaciones (
+    user_id bigint primary key,
+    datos jsonb not null,
+    actualizado timestamptz not null default now()
+);
+
+create index if not exists conversaciones_actualizado on conversaciones (actualizado);
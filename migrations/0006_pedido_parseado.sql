@@ -0,0 +1,39 @@
+-- Campos derivados de pedido_completo, parseados una vez (pedido.py) al
+-- crear la cotización en el bot. `parseado` distingue "no se detectó total"
+-- de "fila vieja sin procesar"; las viejas las llena backfill_pedidos.py.
+
+alter table cotizaciones
+    add column if not exists total_vuelo numeric,
+    add column if not exists moneda text,
+    add column if not exists origen text,
+    add column if not exists destino text,
+    add column if not exists parseado boolean not null default false;
+
+-- Por cotizar ordenado/filtrado por total sin tocar el texto
+create index if not exists cotizaciones_estado_total
+    on cotizaciones (estado, total_vuelo);
+
+create index if not exists cotizaciones_sin_parsear
+    on cotizaciones (id) where not parseado;
+
+-- Aplica un lote del backfill en una sola escritura. `fecha` no se toca:
+-- el bot ya la guardaba con el mismo parseo.
+-- Uso: supabase.rpc("aplicar_pedidos_parseados", {"items": [{"id": 1, "total_vuelo": 5633, ...}]})
+create or replace function aplicar_pedidos_parseados(items jsonb)
+returns integer
+language sql
+as $$
+    with actualizadas as (
+        update cotizaciones c
+           set total_vuelo = i.total_vuelo,
+               moneda = i.moneda,
+               origen = i.origen,
+               destino = i.destino,
+               parseado = true
+          from jsonb_to_recordset(items)
+               as i(id bigint, total_vuelo numeric, moneda text, origen text, destino text)
+         where c.id = i.id
+        returning 1
+    )
+    select count(*)::integer from actualizadas
+$$;
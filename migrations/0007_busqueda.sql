@@ -0,0 +1,84 @@
+-- Búsqueda del dashboard (/buscar): un tsvector por cotización con ID,
+-- username, pedido_completo y las notas de su fila en workspace, con
+-- índice GIN. El dashboard consulta con prefijos: 'cancun:* & cdmx:*'.
+--
+-- Los textos se normalizan igual que en Python (app_dashboard.terminos_busqueda):
+-- sin acentos, minúsculas y solo [a-z0-9], así "Cancún" encuentra "cancun".
+
+create extension if not exists unaccent;
+
+-- unaccent() es STABLE; el envoltorio IMMUTABLE permite usarlo en índices
+create or replace function busqueda_normalizar(t text)
+returns text
+language sql
+immutable
+parallel safe
+as $$
+    select regexp_replace(lower(public.unaccent('public.unaccent'::regdictionary, coalesce(t, ''))), '[^a-z0-9]+', ' ', 'g')
+$$;
+
+create or replace function cotizacion_busqueda(c_id bigint, username text, pedido text, notas text)
+returns tsvector
+language sql
+immutable
+parallel safe
+as $$
+    select to_tsvector(
+        'simple',
+        busqueda_normalizar(concat_ws(' ', c_id::text, username, pedido, notas))
+    )
+$$;
+
+alter table cotizaciones add column if not exists busqueda tsvector;
+
+-- Cotización nueva o editada: recalcula con las notas actuales
+create or replace function cotizaciones_busqueda_trigger()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.busqueda := cotizacion_busqueda(
+        new.id,
+        new.username,
+        new.pedido_completo,
+        (select w.notas from workspace w where w.cotizacion_id = new.id)
+    );
+    return new;
+end;
+$$;
+
+drop trigger if exists cotizaciones_busqueda on cotizaciones;
+create trigger cotizaciones_busqueda
+    before insert or update of pedido_completo, username on cotizaciones
+    for each row execute function cotizaciones_busqueda_trigger();
+
+-- Notas del workspace: actualiza el vector de su cotización
+create or replace function workspace_busqueda_trigger()
+returns trigger
+language plpgsql
+as $$
+declare
+    c_id bigint := coalesce(new.cotizacion_id, old.cotizacion_id);
+    notas text := case when tg_op = 'DELETE' then null else new.notas end;
+begin
+    update cotizaciones c
+       set busqueda = cotizacion_busqueda(c.id, c.username, c.pedido_completo, notas)
+     where c.id = c_id;
+    return null;
+end;
+$$;
+
+drop trigger if exists workspace_busqueda on workspace;
+create trigger workspace_busqueda
+    after insert or delete or update of notas on workspace
+    for each row execute function workspace_busqueda_trigger();
+
+-- Filas existentes
+update cotizaciones c
+   set busqueda = cotizacion_busqueda(
+       c.id, c.username, c.pedido_completo,
+       (select w.notas from workspace w where w.cotizacion_id = c.id)
+   );
+
+create index if not exists cotizaciones_busqueda_gin
+    on cotizaciones using gin (busqueda);
@@ -0,0 +1,25 @@
+-- Relación workspace.cotizacion_id -> cotizaciones.id para que PostgREST
+-- pueda embeber el workspace en la misma consulta de cotizaciones:
+--     select=id,...,workspace(etiqueta,notas,updated_at)
+-- Como cotizacion_id es único, PostgREST la trata como uno a uno y devuelve
+-- un objeto (o null) en lugar de una lista.
+--
+-- `not valid` evita recorrer la tabla ni fallar por filas huérfanas que ya
+-- existan; las nuevas sí se validan. Para validar las viejas después:
+--     alter table workspace validate constraint workspace_cotizacion_fk;
+
+do $$
+begin
+    if not exists (
+        select 1 from pg_constraint where conname = 'workspace_cotizacion_fk'
+    ) then
+        alter table workspace
+            add constraint workspace_cotizacion_fk
+            foreign key (cotizacion_id) references cotizaciones (id)
+            on delete cascade
+            not valid;
+    end if;
+end $$;
+
+-- PostgREST recarga su caché de esquema para ver la relación
+notify pgrst, 'reload schema';
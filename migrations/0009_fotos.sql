@@ -0,0 +1,14 @@
+-- Claves de las fotos guardadas por el bot (fotos.py): ruta por contenido
+-- `ab/<sha256>.jpg` en FOTOS_DIR o en el bucket FOTOS_BUCKET. La foto de
+-- referencia llega al crear la cotización y el comprobante con el pago.
+-- Null en las filas viejas o si no hay almacén configurado.
+
+alter table cotizaciones
+    add column if not exists foto_ref text,
+    add column if not exists foto_ref_mini text,
+    add column if not exists comprobante text,
+    add column if not exists comprobante_mini text;
+
+-- Con FOTOS_BUCKET: bucket privado, el dashboard lo lee con su service key
+--     insert into storage.buckets (id, name, public) values ('fotos', 'fotos', false)
+--     on conflict (id) do nothing;
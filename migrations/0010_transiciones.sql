@@ -0,0 +1,70 @@
+-- Cambios de estado de una cotización en un solo lugar. El bot y el
+-- dashboard llaman a transicionar() en vez de hacer update directo:
+-- valida que el paso esté permitido, aplica el cambio con la fila bloqueada
+-- y devuelve el resultado en una sola ida y vuelta. Dos confirmaciones del
+-- mismo pago (Telegram y web a la vez) no pueden ganar las dos.
+--
+-- Uso: supabase.rpc("transicionar", {"p_id": 12, "p_hacia": "Pago Confirmado",
+--                                    "p_desde": "Esperando confirmación de pago"})
+-- Devuelve {"ok": true, "desde": ..., "fila": {...}} o
+--          {"ok": false, "error": "no_existe" | "estado", "estado": ..., "fila": {...}}
+
+create table if not exists transiciones_permitidas (
+    desde text not null,
+    hacia text not null,
+    primary key (desde, hacia)
+);
+
+insert into transiciones_permitidas (desde, hacia) values
+    ('Esperando atención', 'Cotizado'),
+    ('Cotizado', 'Cotizado'),                                              -- corregir el monto
+    ('Cotizado', 'Esperando confirmación de pago'),
+    ('Esperando confirmación de pago', 'Esperando confirmación de pago'),  -- reenviar comprobante
+    ('Esperando confirmación de pago', 'Pago Confirmado'),
+    ('Pago Confirmado', 'QR Enviados')
+on conflict do nothing;
+
+-- p_desde null: cualquier estado actual con un paso permitido hacia p_hacia.
+-- p_campos: solo monto, comprobante y comprobante_mini; el resto se ignora.
+create or replace function transicionar(
+    p_id bigint,
+    p_hacia text,
+    p_desde text default null,
+    p_campos jsonb default '{}'::jsonb
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+    actual cotizaciones;
+    nueva cotizaciones;
+begin
+    select * into actual from cotizaciones where id = p_id for update;
+    if not found then
+        return jsonb_build_object('ok', false, 'error', 'no_existe');
+    end if;
+
+    if (p_desde is not null and actual.estado is distinct from p_desde)
+       or not exists (
+           select 1 from transiciones_permitidas t
+            where t.desde = actual.estado and t.hacia = p_hacia
+       ) then
+        return jsonb_build_object(
+            'ok', false, 'error', 'estado', 'estado', actual.estado, 'fila', to_jsonb(actual)
+        );
+    end if;
+
+    -- jsonb_populate_record sobre la fila actual: lo que no viene en
+    -- p_campos conserva su valor y cada campo toma el tipo de su columna
+    update cotizaciones c
+       set estado = p_hacia,
+           (monto, comprobante, comprobante_mini) = (
+               select r.monto, r.comprobante, r.comprobante_mini
+                 from jsonb_populate_record(actual, coalesce(p_campos, '{}'::jsonb)) r
+           )
+     where c.id = p_id
+    returning c.* into nueva;
+
+    return jsonb_build_object('ok', true, 'desde', actual.estado, 'fila', to_jsonb(nueva));
+end;
+$$;
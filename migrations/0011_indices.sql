@@ -0,0 +1,35 @@
+-- Índices para las consultas con nombre del dashboard (las de medir() en
+-- app_dashboard.py). bench/auditar_consultas.py corre EXPLAIN ANALYZE de
+-- cada una y falla si alguna recorre la tabla completa.
+--
+-- En una tabla grande en producción conviene crearlos uno por uno con
+-- `create index concurrently` (fuera de una transacción) para no bloquear
+-- las escrituras del bot.
+
+-- Por cotizar / Validar pagos / Por enviar QR y el snapshot de /api/resumen:
+-- estado = X order by created_at desc. Parcial: la gran mayoría de filas son
+-- históricas ('QR Enviados', 'Cotizado') y ninguna lista las filtra por estado.
+create index if not exists cotizaciones_abiertas_created
+    on cotizaciones (estado, created_at desc, id desc)
+    where estado in ('Esperando atención', 'Esperando confirmación de pago', 'Pago Confirmado');
+
+-- General (urgentes) y Próximos vuelos: rango de fecha, orden fecha y created_at
+create index if not exists cotizaciones_fecha_created
+    on cotizaciones (fecha, created_at desc);
+
+-- Historial y Espacio de trabajo: paginación por cursor (created_at, id)
+create index if not exists cotizaciones_created_id
+    on cotizaciones (created_at desc, id desc);
+
+-- Historial por usuario
+create index if not exists cotizaciones_usuario_created
+    on cotizaciones (user_id, created_at desc, id desc);
+
+-- workspace.cotizacion_id: el upsert on_conflict del dashboard ya exige un
+-- índice único, normalmente el de la constraint `workspace_cotizacion_id_key`.
+-- Con el mismo nombre, esto no hace nada si ya existe y lo crea si no.
+create unique index if not exists workspace_cotizacion_id_key
+    on workspace (cotizacion_id);
+
+analyze cotizaciones;
+analyze workspace;
@@ -0,0 +1,38 @@
+-- Marca de agua para la réplica local del dashboard (dashboard/replica.py):
+-- cada cambio en cotizaciones y workspace sube `updated_at`, y la réplica
+-- pide solo lo que cambió desde la última vez:
+--     ?select=*&or=(updated_at.gt."W",and(updated_at.eq."W",id.gt.I))
+--      &order=updated_at,id&limit=1000
+--
+-- now() es el inicio de la transacción: una que confirma tarde puede quedar
+-- con un updated_at menor que filas ya leídas. La réplica vuelve a pedir un
+-- margen hacia atrás (REPLICA_MARGEN) en cada ciclo por eso.
+
+alter table cotizaciones add column if not exists updated_at timestamptz not null default now();
+alter table workspace add column if not exists updated_at timestamptz not null default now();
+
+create or replace function tocar_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at := now();
+    return new;
+end;
+$$;
+
+drop trigger if exists cotizaciones_updated_at on cotizaciones;
+create trigger cotizaciones_updated_at
+    before update on cotizaciones
+    for each row execute function tocar_updated_at();
+
+drop trigger if exists workspace_updated_at on workspace;
+create trigger workspace_updated_at
+    before update on workspace
+    for each row execute function tocar_updated_at();
+
+create index if not exists cotizaciones_updated_id on cotizaciones (updated_at, id);
+create index if not exists workspace_updated_cotizacion on workspace (updated_at, cotizacion_id);
+
+-- PostgREST recarga su caché de esquema para ver la columna nueva
+notify pgrst, 'reload schema';
@@ -0,0 +1,38 @@
+-- Cambios de estado en lote para las acciones en lote del dashboard
+-- (cotizar y confirmar pago). Cada elemento pasa por transicionar()
+-- (migrations/0010): mismas reglas de transiciones_permitidas y la fila
+-- bloqueada, en una sola ida y vuelta.
+--
+-- Uso: supabase.rpc("transicionar_lote", {"p_hacia": "Cotizado", "p_desde": "Esperando atención",
+--                                         "p_items": [{"id": 1, "campos": {"monto": "1500.00"}}, ...]})
+-- Devuelve un arreglo con la respuesta de transicionar() de cada elemento
+-- más su "id", en orden de id.
+
+create or replace function transicionar_lote(
+    p_hacia text,
+    p_items jsonb,
+    p_desde text default null
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+    item record;
+    resultado jsonb := '[]'::jsonb;
+begin
+    -- en orden de id: dos lotes a la vez bloquean sus filas en el mismo orden
+    for item in
+        select (i ->> 'id')::bigint as id, coalesce(i -> 'campos', '{}'::jsonb) as campos
+          from jsonb_array_elements(p_items) i
+         order by 1
+    loop
+        resultado := resultado || jsonb_build_array(
+            transicionar(item.id, p_hacia, p_desde, item.campos) || jsonb_build_object('id', item.id)
+        );
+    end loop;
+    return resultado;
+end;
+$$;
+
+-- Reemplazada por transicionar_lote: se saltaba transiciones_permitidas
+drop function if exists cotizar_lote(jsonb);
@@ -0,0 +1,136 @@
+"""Parseo del texto libre de una solicitud (`pedido_completo`).
+
+Se hace una sola vez, cuando el usuario manda los datos, y el resultado
+se guarda en columnas de `cotizaciones` (migrations/0006). El dashboard
+lee las columnas en lugar de volver a parsear el texto en cada vista.
+"""
+import re
+from datetime import datetime
+
+DATE_PATTERN = re.compile(r"\b(\d{1,2})[/-](\d{1,2})[/-](\d{4})\b")
+# Montos con su moneda antes ($5,633.50, MXN 1.234,50, USD 300) o después
+# (300 USD, 250,00 €). Se toma el último; el número de una fecha no cuenta.
+MONTO_ANTES_PATTERN = re.compile(
+    r"(US\$|\$|€|\b(?:MXN|USD|EUR|COP)(?![a-z]))\s*(\d[\d.,]*)", re.IGNORECASE
+)
+MONTO_DESPUES_PATTERN = re.compile(
+    r"(?<![\d/.,-])(\d[\d.,]*)\s*(\b(?:MXN|USD|EUR|COP)\b|€)", re.IGNORECASE
+)
+# Miles con el mismo separador siempre ("1.234.567") y 1 o 2 decimales
+NUMERO_PATTERN = re.compile(r"\d{1,3}(?:([.,])\d{3}(?:\1\d{3})*)?(?:([.,])\d{1,2})?|\d+(?:([.,])\d{1,2})?")
+MONEDA_PATTERN = re.compile(r"\b(MXN|USD|EUR|COP)\b|(US\$|€)", re.IGNORECASE)
+SIMBOLOS_MONEDA = {"US$": "USD", "€": "EUR", "$": None}
+
+# Ruta. Antes se quitan saludos y frases como "quiero ir", "vuelo de"; luego
+# "[de|desde] X a Y" o "a Y desde X". Si algo no cuadra, origen y destino
+# quedan en None: es mejor una columna vacía que una ciudad inventada.
+_LUGAR = r"(?P<{}>[^\d\n,.;:()!?]+?)"
+_FIN_LUGAR = (
+    r"(?=\s+(?:el|para|fecha|desde|y|ida|regreso|redondo|sencillo|con|en|a\s+las)\b"
+    r"|\s+del?\s+\d|\s*[\d,.;:\n()!?]|\s*$)"
+)
+_CONECTOR = r"\s+(?:a|al|hacia|hasta|->|→|-)\s+"
+RELLENO_PATTERN = re.compile(
+    r"^(?:(?:hola|buen[oa]s?|d[ií]as|tardes|noches|quiero|quisiera|necesito|busco|"
+    r"me\s+gustar[ií]a|cot[ií]za(?:me|r)?|un|una|vuelos?|viajes?|boletos?|"
+    r"redondo|sencillo|ir|viajar|volar)\b[\s,!.:]*)+",
+    re.IGNORECASE,
+)
+RUTA_PATTERN = re.compile(
+    r"^(?:(?:de|desde)\s+)?" + _LUGAR.format("origen") + _CONECTOR
+    + _LUGAR.format("destino") + _FIN_LUGAR,
+    re.IGNORECASE,
+)
+RUTA_INVERSA_PATTERN = re.compile(
+    r"^(?:a|al|hacia|para)\s+" + _LUGAR.format("destino") + r"\s+desde\s+"
+    + _LUGAR.format("origen") + _FIN_LUGAR,
+    re.IGNORECASE,
+)
+NO_LUGAR = {"quiero", "ir", "vuelo", "viaje", "desde", "a", "al", "para", "hacia", "necesito", "busco"}
+PALABRAS_LUGAR_MAX = 4
+
+
+def extraer_fecha(texto: str):
+    m = DATE_PATTERN.search(texto)
+    if not m:
+        return None
+    d, mth, y = m.groups()
+    try:
+        dt = datetime(int(y), int(mth), int(d))
+        return dt.date().isoformat()
+    except ValueError:
+        return None
+
+
+def numero(raw: str):
+    """"5,633.50", "1.234,50", "300" -> float. None si los separadores no
+    cuadran ("1.2345", "1,234,56") en vez de adivinar."""
+    m = NUMERO_PATTERN.fullmatch(raw.rstrip(".,"))
+    if not m:
+        return None
+    miles, decimal = m.group(1), m.group(2) or m.group(3)
+    if miles and miles == decimal:
+        return None
+    limpio = m.group(0).replace(miles, "") if miles else m.group(0)
+    return float(limpio.replace(decimal, ".") if decimal else limpio)
+
+
+def extraer_monto(texto: str):
+    """(total, moneda) del último monto con moneda; (None, None) si no hay."""
+    encontrados = [
+        (m.start(), m.group(2), m.group(1)) for m in MONTO_ANTES_PATTERN.finditer(texto)
+    ] + [
+        (m.start(), m.group(1), m.group(2)) for m in MONTO_DESPUES_PATTERN.finditer(texto)
+    ]
+    if not encontrados:
+        return None, None
+    _, raw, marca = max(encontrados)
+    marca = marca.upper()
+    return numero(raw), SIMBOLOS_MONEDA.get(marca, marca)
+
+
+def extraer_moneda(texto: str):
+    m = MONEDA_PATTERN.search(texto)
+    if not m:
+        return None
+    codigo = m.group(1) or m.group(2)
+    return SIMBOLOS_MONEDA.get(codigo.upper(), codigo.upper())
+
+
+def _lugar(nombre: str):
+    nombre = nombre.strip()
+    palabras = nombre.lower().split()
+    if not palabras or len(palabras) > PALABRAS_LUGAR_MAX or NO_LUGAR & set(palabras):
+        return None
+    return nombre
+
+
+def extraer_ruta(texto: str):
+    """(origen, destino) de textos como "CDMX a Cancún el 25-12-2025",
+    "Vuelo de Monterrey a Tijuana" o "Quiero ir a Cancún desde CDMX"."""
+    linea = RELLENO_PATTERN.sub("", texto.strip().split("\n", 1)[0])
+    m = RUTA_INVERSA_PATTERN.search(linea) or RUTA_PATTERN.search(linea)
+    if not m:
+        return None, None
+    origen, destino = _lugar(m.group("origen")), _lugar(m.group("destino"))
+    if not origen or not destino:
+        return None, None
+    return origen, destino
+
+
+def parsear_pedido(texto: str) -> dict:
+    """Columnas derivadas del texto; las que no se detectan quedan en None."""
+    texto = texto or ""
+    total, moneda = extraer_monto(texto)
+    if total is not None and moneda is None:
+        # "$" solo: la moneda que se mencione en el texto o, si ninguna, pesos
+        moneda = extraer_moneda(texto) or "MXN"
+    origen, destino = extraer_ruta(texto)
+    return {
+        "fecha": extraer_fecha(texto),
+        "total_vuelo": total,
+        "moneda": moneda if total is not None else extraer_moneda(texto),
+        "origen": origen,
+        "destino": destino,
+        "parseado": True,
+    }
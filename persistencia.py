@@ -0,0 +1,265 @@
+"""Persistencia del estado de conversación (context.user_data) del bot.
+
+El flujo de cotización/pago vive en user_data ("estado", "tmp_datos",
+"tmp_parseado", "pago_vuelo_id"). Esta persistencia lo guarda fuera del
+proceso para que un reinicio o deploy no pierda conversaciones a medias:
+
+- SQLite para un solo nodo, tabla `conversaciones` en Supabase para varios.
+- Escritura diferida: PTB llama update_user_data cada `update_interval`
+  segundos solo para los usuarios que cambiaron, y aquí se juntan en una
+  sola escritura por lote (no una por mensaje).
+- Los estados sin actividad por más de `ttl` segundos se descartan.
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+log = logging.getLogger(__name__)
+
+
+# --- ALMACENES ---
+
+class AlmacenSQLite:
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(ruta, check_same_thread=False, isolation_level=None)
+        self._conn.execute("pragma journal_mode=wal")
+        self._conn.execute(
+            "create table if not exists conversaciones ("
+            " user_id integer primary key,"
+            " datos text not null,"
+            " actualizado real not null)"
+        )
+
+    def cargar_todos(self, desde: float) -> dict:
+        with self._lock:
+            filas = self._conn.execute(
+                "select user_id, datos from conversaciones where actualizado >= ?",
+                (desde,),
+            ).fetchall()
+        return {uid: json.loads(datos) for uid, datos in filas}
+
+    def cargar(self, user_id: int, desde: float):
+        with self._lock:
+            fila = self._conn.execute(
+                "select datos from conversaciones where user_id = ? and actualizado >= ?",
+                (user_id, desde),
+            ).fetchone()
+        return json.loads(fila[0]) if fila else None
+
+    def guardar_lote(self, cambios: dict):
+        """`cambios` es {user_id: datos}; datos vacío o None borra la fila."""
+        ahora = time.time()
+        with self._lock:
+            self._conn.execute("begin")
+            try:
+                for uid, datos in cambios.items():
+                    if datos:
+                        self._conn.execute(
+                            "insert into conversaciones (user_id, datos, actualizado) values (?, ?, ?) "
+                            "on conflict (user_id) do update set datos = excluded.datos, "
+                            "actualizado = excluded.actualizado",
+                            (uid, json.dumps(datos), ahora),
+                        )
+                    else:
+                        self._conn.execute("delete from conversaciones where user_id = ?", (uid,))
+                self._conn.execute("commit")
+            except Exception:
+                self._conn.execute("rollback")
+                raise
+
+    def purgar(self, antes: float):
+        with self._lock:
+            self._conn.execute("delete from conversaciones where actualizado < ?", (antes,))
+
+
+class AlmacenSupabase:
+    """Tabla `conversaciones` (migrations/0005) compartida entre réplicas."""
+
+    LOTE = 1000
+
+    def __init__(self, supabase):
+        self.supabase = supabase
+
+    @staticmethod
+    def _iso(ts: float) -> str:
+        return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+    def cargar_todos(self, desde: float) -> dict:
+        # PostgREST corta cada respuesta en max-rows (1000): por páginas de user_id
+        datos, ultimo = {}, None
+        while True:
+            query = (
+                self.supabase.table("conversaciones")
+                .select("user_id, datos")
+                .gte("actualizado", self._iso(desde))
+            )
+            if ultimo is not None:
+                query = query.gt("user_id", ultimo)
+            filas = query.order("user_id").limit(self.LOTE).execute().data
+            datos.update((int(f["user_id"]), f["datos"]) for f in filas)
+            if len(filas) < self.LOTE:
+                return datos
+            ultimo = filas[-1]["user_id"]
+
+    def cargar(self, user_id: int, desde: float):
+        filas = (
+            self.supabase.table("conversaciones")
+            .select("datos")
+            .eq("user_id", user_id)
+            .gte("actualizado", self._iso(desde))
+            .limit(1)
+            .execute()
+            .data
+        )
+        return filas[0]["datos"] if filas else None
+
+    def guardar_lote(self, cambios: dict):
+        ahora = self._iso(time.time())
+        upserts = [
+            {"user_id": uid, "datos": datos, "actualizado": ahora}
+            for uid, datos in cambios.items() if datos
+        ]
+        borrar = [uid for uid, datos in cambios.items() if not datos]
+        if upserts:
+            self.supabase.table("conversaciones").upsert(upserts, on_conflict="user_id").execute()
+        if borrar:
+            self.supabase.table("conversaciones").delete().in_("user_id", borrar).execute()
+
+    def purgar(self, antes: float):
+        self.supabase.table("conversaciones").delete().lt("actualizado", self._iso(antes)).execute()
+
+
+# --- PERSISTENCIA PTB ---
+
+class PersistenciaConversaciones(BasePersistence):
+    """Solo persiste user_data; chat_data, bot_data y callbacks no se usan."""
+
+    def __init__(self, almacen, ttl: float = 86400, update_interval: float = 5, refrescar: bool = False):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.almacen = almacen
+        self.ttl = ttl
+        # Con varias réplicas sin ruteo fijo por usuario, relee el estado antes
+        # de cada update y lo escribe al terminarlo (sin escritura diferida).
+        self.refrescar = refrescar
+
+        self._pendientes = {}
+        self._tarea = None
+        self._tocado = {}  # user_id -> última actividad (monotonic)
+        self._ultima_purga = 0.0
+
+    # user_data
+
+    async def get_user_data(self):
+        desde = time.time() - self.ttl
+        datos = await asyncio.to_thread(self.almacen.cargar_todos, desde)
+        ahora = time.monotonic()
+        self._tocado = {uid: ahora for uid in datos}
+        log.info(f"persistencia: {len(datos)} conversación(es) recuperada(s)")
+        return datos
+
+    async def update_user_data(self, user_id: int, data: dict):
+        self._tocado[user_id] = time.monotonic()
+        self._pendientes[user_id] = dict(data)
+        if self.refrescar:
+            # refresh_user_data relee del almacén en el siguiente update: lo
+            # escrito aquí tiene que estar ya ahí (bot.py pide este volcado al
+            # final de cada update, no cada update_interval)
+            await self._escribir_pendientes()
+            return
+        if self._tarea is None or self._tarea.done():
+            # PTB llama esto para cada usuario modificado en la misma pasada;
+            # la tarea corre al terminar la pasada y escribe todo junto.
+            self._tarea = asyncio.create_task(self._escribir_pendientes())
+
+    async def refresh_user_data(self, user_id: int, user_data: dict):
+        tocado = self._tocado.get(user_id)
+        if user_data and tocado is not None and time.monotonic() - tocado > self.ttl:
+            user_data.clear()  # conversación abandonada
+            self._pendientes[user_id] = {}
+
+        # lo que sigue en _pendientes (un guardado fallido) es más nuevo que el almacén
+        if self.refrescar and user_id not in self._pendientes:
+            datos = await asyncio.to_thread(self.almacen.cargar, user_id, time.time() - self.ttl)
+            user_data.clear()
+            user_data.update(datos or {})
+
+        self._tocado[user_id] = time.monotonic()
+
+    async def drop_user_data(self, user_id: int):
+        self._tocado.pop(user_id, None)
+        self._pendientes[user_id] = {}
+
+    async def _escribir_pendientes(self):
+        await asyncio.sleep(0)
+        lote, self._pendientes = self._pendientes, {}
+        if not lote:
+            return
+        try:
+            await asyncio.to_thread(self.almacen.guardar_lote, lote)
+        except Exception as e:
+            log.error(f"persistencia: no se pudo guardar el lote ({e}); se reintenta")
+            for uid, datos in lote.items():
+                self._pendientes.setdefault(uid, datos)
+            return
+        await self._purgar()
+
+    async def _purgar(self):
+        ahora = time.monotonic()
+        if ahora - self._ultima_purga < 3600:
+            return
+        self._ultima_purga = ahora
+        self._tocado = {u: t for u, t in self._tocado.items() if ahora - t <= self.ttl}
+        await asyncio.to_thread(self.almacen.purgar, time.time() - self.ttl)
+
+    async def flush(self):
+        if self._tarea and not self._tarea.done():
+            await self._tarea
+        if self._pendientes:
+            lote, self._pendientes = self._pendientes, {}
+            await asyncio.to_thread(self.almacen.guardar_lote, lote)
+
+    # Lo que no se persiste
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str):
+        return {}
+
+    async def update_conversation(self, name, key, new_state):
+        pass
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
@@ -0,0 +1,65 @@
+"""Reparto de updates de Telegram entre varios procesos worker.
+
+Un proceso de ingreso recibe los updates (webhook o polling) y los manda a
+N workers según hash del user_id. Todos los updates de un usuario caen
+siempre en el mismo worker y en una cola FIFO, así que el orden por
+usuario (la máquina de estados de user_data["estado"]) se conserva.
+"""
+import multiprocessing as mp
+import queue
+
+
+def usuario_de(data: dict) -> int:
+    """Saca el user_id (o chat_id) de un update en JSON crudo."""
+    for clave, valor in data.items():
+        if clave == "update_id" or not isinstance(valor, dict):
+            continue
+        remitente = valor.get("from") or valor.get("user")
+        if remitente:
+            return int(remitente["id"])
+        chat = valor.get("chat") or (valor.get("message") or {}).get("chat")
+        if chat:
+            return int(chat["id"])
+    return 0
+
+
+def shard_de(data: dict, n: int) -> int:
+    return usuario_de(data) % n
+
+
+class Ingreso:
+    """Colas y procesos de los workers. `target(indice, cola, *args)` corre en
+    cada proceso y termina al recibir None por su cola."""
+
+    def __init__(self, n: int, target, args: tuple = (), tam_cola: int = 10000):
+        ctx = mp.get_context("spawn")
+        self.colas = [ctx.Queue(maxsize=tam_cola) for _ in range(n)]
+        self.procesos = [
+            ctx.Process(target=target, args=(i, cola) + args, name=f"bot-worker-{i}")
+            for i, cola in enumerate(self.colas)
+        ]
+
+    def iniciar(self):
+        for proceso in self.procesos:
+            proceso.start()
+
+    def despachar(self, data: dict, bloquear: bool = True):
+        """Encola el update en su worker. Con bloquear=False lanza queue.Full
+        si el worker va atrasado (el webhook responde 503 y Telegram reintenta)."""
+        cola = self.colas[shard_de(data, len(self.colas))]
+        cola.put(data, block=bloquear)
+
+    def detener(self, timeout: float = 30):
+        for cola in self.colas:
+            try:
+                cola.put(None, timeout=timeout)
+            except queue.Full:
+                pass
+        for proceso in self.procesos:
+            proceso.join(timeout)
+            if proceso.is_alive():
+                proceso.terminate()
+
+    @property
+    def vivos(self) -> int:
+        return sum(p.is_alive() for p in self.procesos)
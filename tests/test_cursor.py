@@ -0,0 +1,77 @@
+import base64
+import os
+import sys
+import tempfile
+
+import pytest
+
+RAIZ = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, os.path.join(RAIZ, "bench"))
+sys.path.insert(0, os.path.join(RAIZ, "dashboard"))
+
+# como bench/bench_dashboard.py: sin Supabase, Realtime ni worker del outbox
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+os.environ.setdefault("SUPABASE_KEY", "bench.bench.bench")
+os.environ.setdefault("BOT_TOKEN", "123456:TEST")
+os.environ["OUTBOX_DB"] = os.path.join(tempfile.mkdtemp(), "outbox.db")
+os.environ["OUTBOX_HILOS"] = "0"
+os.environ["REALTIME_ACTIVO"] = "0"
+os.environ.pop("REPLICA_DB", None)
+
+from app_dashboard import codificar_cursor, decodificar_cursor, paginar  # noqa: E402
+from fake_supabase import SupabaseSQLite  # noqa: E402
+from replica import Replica  # noqa: E402
+
+CREATED = "2025-01-01T10:00:00.123456+00:00"
+
+
+def b64(raw: str) -> str:
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def test_ida_y_vuelta():
+    cursor = codificar_cursor({"created_at": CREATED, "id": 42})
+    assert "=" not in cursor and "+" not in cursor and "/" not in cursor
+    assert decodificar_cursor(cursor) == (CREATED, 42)
+
+
+@pytest.mark.parametrize("cursor", [
+    None,
+    "",
+    "%%%",
+    b64("sin-separador"),
+    b64(f"{CREATED}|no-es-id"),
+    b64("ayer|1"),
+    # un created_at armado a mano para meter condiciones en el or_() de paginar()
+    b64('2025-01-01",id.gt.0,created_at.gt."2025-01-01|1'),
+    base64.urlsafe_b64encode(b"\xff\xfe|1").decode(),
+])
+def test_cursor_invalido(cursor):
+    assert decodificar_cursor(cursor) is None
+
+
+@pytest.fixture(params=["supabase", "replica"])
+def fuente(request, tmp_path):
+    db = SupabaseSQLite()
+    # varias filas con el mismo created_at: el desempate por id no repite ni salta
+    db.table("cotizaciones").insert([
+        {"id": i, "estado": "Cotizado", "created_at": f"2025-01-01T10:00:0{i // 3}+00:00"}
+        for i in range(1, 12)
+    ]).execute()
+    if request.param == "supabase":
+        return db
+    replica = Replica(str(tmp_path / "replica.db"), db)
+    replica.sincronizar()
+    return replica
+
+
+def test_paginar_recorre_todo_en_orden(fuente):
+    vistos, cursor = [], None
+    while True:
+        filas, siguiente = paginar("test", fuente.table("cotizaciones").select("id, created_at"), 3, cursor)
+        vistos.extend(f["id"] for f in filas)
+        if siguiente is None:
+            break
+        cursor = decodificar_cursor(siguiente)
+    esperado = sorted(range(1, 12), key=lambda i: (i // 3, i), reverse=True)
+    assert vistos == esperado
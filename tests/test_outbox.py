@@ -0,0 +1,141 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "dashboard"))
+
+import outbox as modulo  # noqa: E402
+from outbox import LEASE, MAX_INTENTOS, Outbox  # noqa: E402
+from telegram_http import TelegramError  # noqa: E402
+
+
+class Telegram:
+    """enviar() falso: anota cada llamada y lanza lo que haya en `fallas`."""
+
+    def __init__(self):
+        self.enviados = []
+        self.fallas = []
+
+    def __call__(self, metodo, data, files=None, timeout=None):
+        if self.fallas:
+            raise self.fallas.pop(0)
+        self.enviados.append((data["chat_id"], data["text"]))
+
+
+@pytest.fixture
+def tg():
+    return Telegram()
+
+
+@pytest.fixture
+def ruta(tmp_path):
+    return str(tmp_path / "outbox.db")
+
+
+def mensaje(chat_id, texto, clave=None):
+    return (chat_id, "sendMessage", {"chat_id": chat_id, "text": texto}, None, clave)
+
+
+def vencer(ob):
+    """Adelanta el reloj: vence leases y backoffs y libera todos los chats."""
+    conn = ob._conexion()
+    conn.execute("update outbox set proximo_intento = 0 where estado = 'pendiente'")
+    conn.execute("delete from outbox_chats")
+
+
+def fila(ob, outbox_id):
+    return dict(ob._conexion().execute("select * from outbox where id = ?", (outbox_id,)).fetchone())
+
+
+def test_orden_por_chat_y_un_envio_por_chat_a_la_vez(ruta, tg):
+    ob = Outbox(ruta, tg)
+    ob.encolar_lote([mensaje(1, "a1"), mensaje(2, "b1"), mensaje(1, "a2"), mensaje(1, "a3")])
+
+    assert ob.procesar_lote() == 2
+    assert tg.enviados == [(1, "a1"), (2, "b1")]
+    # el chat 1 acaba de recibir: a2 espera INTERVALO_POR_CHAT
+    assert ob.procesar_lote() == 0
+
+    vencer(ob)
+    ob.procesar_lote()
+    vencer(ob)
+    ob.procesar_lote()
+    assert [t for c, t in tg.enviados if c == 1] == ["a1", "a2", "a3"]
+    assert ob.pendientes() == 0
+
+
+def test_clave_no_duplica(ruta, tg):
+    ob = Outbox(ruta, tg)
+    assert ob.encolar(1, "sendMessage", {"chat_id": 1, "text": "x"}, clave="cotizado:7") is not None
+    assert ob.encolar(1, "sendMessage", {"chat_id": 1, "text": "x"}, clave="cotizado:7") is None
+    assert ob.pendientes() == 1
+
+
+def test_lease_compartido_entre_procesos(ruta, tg):
+    a, b = Outbox(ruta, tg), Outbox(ruta, tg)
+    (outbox_id,) = a.encolar_lote([mensaje(1, "hola")])
+
+    assert a._reservar(outbox_id)
+    assert not b._reservar(outbox_id)  # reservado por `a`
+    assert fila(a, outbox_id)["proximo_intento"] > time.time() + LEASE - 5
+
+    # `a` murió sin enviar: vencido el lease, otro lo toma
+    vencer(a)
+    assert b._reservar(outbox_id)
+    assert fila(b, outbox_id)["intentos"] == 2
+
+
+def test_intervalo_por_chat_compartido_entre_procesos(ruta, tg):
+    a, b = Outbox(ruta, tg), Outbox(ruta, tg)
+    a.encolar_lote([mensaje(1, "uno"), mensaje(1, "dos")])
+    assert a.procesar_lote() == 1
+    assert b.procesar_lote() == 0  # `b` ve el último envío de `a` al chat 1
+
+
+def test_reintentable_usa_retry_after(ruta, tg):
+    ob = Outbox(ruta, tg)
+    (outbox_id,) = ob.encolar_lote([mensaje(1, "x")])
+    tg.fallas.append(TelegramError("sendMessage", 429, "Too Many Requests", retry_after=30))
+
+    ob.procesar_lote()
+    f = fila(ob, outbox_id)
+    assert f["estado"] == "pendiente"
+    assert 25 < f["proximo_intento"] - time.time() <= 30
+    assert "429" in f["error"]
+
+    vencer(ob)
+    ob.procesar_lote()
+    assert fila(ob, outbox_id)["estado"] == "enviado"
+    assert tg.enviados == [(1, "x")]
+
+
+def test_no_reintentable_falla_enseguida(ruta, tg):
+    ob = Outbox(ruta, tg)
+    (outbox_id,) = ob.encolar_lote([mensaje(1, "x")])
+    tg.fallas.append(TelegramError("sendMessage", 403, "Forbidden: bot was blocked by the user"))
+
+    ob.procesar_lote()
+    f = fila(ob, outbox_id)
+    assert (f["estado"], f["intentos"]) == ("fallido", 1)
+
+
+@pytest.mark.parametrize("error", [
+    TelegramError("sendMessage", 502, "Bad Gateway"),
+    ValueError("payload roto"),  # no es de Telegram: mismo backoff, no un reintento por LEASE para siempre
+])
+def test_max_intentos(ruta, tg, monkeypatch, error):
+    monkeypatch.setattr(modulo, "BACKOFF_BASE", 0.001)
+    ob = Outbox(ruta, tg)
+    (outbox_id,) = ob.encolar_lote([mensaje(1, "x")])
+    tg.fallas.extend([error] * MAX_INTENTOS)
+
+    for _ in range(MAX_INTENTOS - 1):
+        ob.procesar_lote()
+        assert fila(ob, outbox_id)["estado"] == "pendiente"
+        vencer(ob)
+    ob.procesar_lote()
+    f = fila(ob, outbox_id)
+    assert (f["estado"], f["intentos"]) == ("fallido", MAX_INTENTOS)
+    assert str(error) in f["error"]
@@ -0,0 +1,68 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from pedido import numero, parsear_pedido  # noqa: E402
+
+
+@pytest.mark.parametrize("texto, origen, destino", [
+    ("CDMX a Cancún el 25-12-2025", "CDMX", "Cancún"),
+    ("Vuelo de Monterrey a Tijuana", "Monterrey", "Tijuana"),
+    ("Quiero ir a Cancún desde CDMX", "CDMX", "Cancún"),
+    ("Hola, quiero un vuelo de Guadalajara a Tijuana para el 3/4/2025", "Guadalajara", "Tijuana"),
+    ("de Cancún a Ciudad de México el 25 de diciembre", "Cancún", "Ciudad de México"),
+    ("Vuelo redondo CDMX - Cancún 25-12-2025 $5633", "CDMX", "Cancún"),
+    ("Monterrey → Mérida", "Monterrey", "Mérida"),
+    ("Necesito boletos de Playa del Carmen a Bogotá, 2 adultos", "Playa del Carmen", "Bogotá"),
+    # sin origen claro: mejor vacío que inventado
+    ("Quiero viajar a Cancún", None, None),
+    ("Cotízame algo barato para diciembre", None, None),
+    ("", None, None),
+])
+def test_ruta(texto, origen, destino):
+    campos = parsear_pedido(texto)
+    assert (campos["origen"], campos["destino"]) == (origen, destino)
+
+
+@pytest.mark.parametrize("texto, total, moneda", [
+    ("CDMX a Cancún el 25-12-2025 $5,633.50", 5633.50, "MXN"),
+    ("MXN 1.234,50", 1234.50, "MXN"),
+    ("MXN5633", 5633.0, "MXN"),
+    ("USD 300", 300.0, "USD"),
+    ("300 USD por persona", 300.0, "USD"),
+    ("total US$ 1,200", 1200.0, "USD"),
+    ("250,00 €", 250.0, "EUR"),
+    ("$500 USD", 500.0, "USD"),
+    ("el 25-12-2025 USD 300", 300.0, "USD"),
+    ("antes $4,000 ahora $3,500", 3500.0, "MXN"),
+    # separadores ambiguos: sin total
+    ("precio $1.2345", None, None),
+    ("CDMX a Cancún el 25-12-2025", None, None),
+])
+def test_monto(texto, total, moneda):
+    campos = parsear_pedido(texto)
+    assert (campos["total_vuelo"], campos["moneda"]) == (total, moneda)
+
+
+@pytest.mark.parametrize("raw, valor", [
+    ("5633", 5633.0),
+    ("5,633", 5633.0),
+    ("5,633.50", 5633.50),
+    ("1.234,50", 1234.50),
+    ("1.234.567,8", 1234567.8),
+    ("12.5", 12.5),
+    ("1,234.", 1234.0),
+    ("1,234,56", None),
+    ("1,234.567", None),
+    ("1.2345", None),
+])
+def test_numero(raw, valor):
+    assert numero(raw) == valor
+
+
+def test_fecha():
+    assert parsear_pedido("CDMX a Cancún el 25-12-2025")["fecha"] == "2025-12-25"
+    assert parsear_pedido("el 31/02/2025")["fecha"] is None
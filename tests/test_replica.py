@@ -0,0 +1,124 @@
+import os
+import sys
+
+import pytest
+
+RAIZ = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, os.path.join(RAIZ, "bench"))
+sys.path.insert(0, os.path.join(RAIZ, "dashboard"))
+
+from fake_supabase import SupabaseSQLite  # noqa: E402
+from replica import Replica  # noqa: E402
+
+T = "2025-01-01T10:00:{:02d}+00:00"
+
+FILAS = [
+    # id, user_id, estado, fecha, monto, created_at
+    (1, "10", "Esperando atención", "2025-03-01", None, T.format(1)),
+    (2, "10", "Cotizado", None, "1500.00", T.format(2)),
+    (3, "20", "Pago Confirmado", "2025-02-01", "900.00", T.format(2)),
+    (4, "30", "Esperando atención", None, None, T.format(3)),
+    (5, "20", "QR Enviados", "2025-04-01", "700.00", T.format(4)),
+]
+
+
+@pytest.fixture
+def db():
+    db = SupabaseSQLite()
+    db.table("cotizaciones").insert([
+        {"id": i, "user_id": u, "estado": e, "fecha": f, "monto": m, "created_at": c, "updated_at": c}
+        for i, u, e, f, m, c in FILAS
+    ]).execute()
+    db.table("workspace").insert([
+        {"cotizacion_id": 2, "etiqueta": "vip", "notas": "llamar", "updated_at": T.format(5)},
+    ]).execute()
+    return db
+
+
+@pytest.fixture
+def replica(db, tmp_path):
+    r = Replica(str(tmp_path / "replica.db"), db, margen=0, lote=2)
+    r.sincronizar()
+    return r
+
+
+def ids(query):
+    return [f["id"] for f in query.execute().data]
+
+
+def test_sincroniza_todo_por_lotes(replica):
+    # lote=2 con created_at/updated_at repetidos: el cursor (updated_at, id) no salta filas
+    assert ids(replica.table("cotizaciones").select("id").order("id")) == [1, 2, 3, 4, 5]
+    assert replica.lista()
+    assert replica.atraso() < 5
+
+
+def test_marca_de_agua_trae_solo_lo_nuevo(db, replica):
+    db.table("cotizaciones").update({"estado": "Cotizado", "monto": "10.00"}).eq("id", 1).execute()
+    db.table("cotizaciones").insert({"id": 6, "user_id": "40", "estado": "Esperando atención"}).execute()
+    antes = db.consultas
+    replica.sincronizar()
+    fila = replica.table("cotizaciones").select("estado, monto").eq("id", 1).execute().data[0]
+    assert fila == {"estado": "Cotizado", "monto": "10.00"}
+    assert 6 in ids(replica.table("cotizaciones").select("id"))
+    # la reconciliación ya corrió en el primer ciclo: solo las consultas incrementales
+    assert db.consultas - antes <= 4
+
+
+@pytest.mark.parametrize("armar", [
+    lambda q: q.eq("user_id", 10),  # entero contra texto, como en Postgres
+    lambda q: q.neq("estado", "Esperando atención"),
+    lambda q: q.in_("estado", ["Cotizado", "QR Enviados"]),
+    lambda q: q.in_("id", []),
+    lambda q: q.gte("fecha", "2025-02-01").lt("fecha", "2025-04-01"),
+    lambda q: q.is_("fecha", "null"),
+    lambda q: q.or_('estado.in.("Pago Confirmado","QR Enviados"),and(user_id.eq.10,monto.is.null)'),
+    lambda q: q.or_(f'created_at.lt."{T.format(2)}",and(created_at.eq."{T.format(2)}",id.lt.3)'),
+])
+def test_filtros_como_postgrest(db, replica, armar):
+    local = armar(replica.table("cotizaciones").select("id")).order("id")
+    remoto = armar(db.table("cotizaciones").select("id")).order("id")
+    assert ids(local) == ids(remoto)
+
+
+def test_orden_y_nulos(replica):
+    # como Postgres: asc deja los NULL al final y desc al principio
+    asc = ids(replica.table("cotizaciones").select("id, fecha").order("fecha").order("id"))
+    desc = ids(replica.table("cotizaciones").select("id, fecha").order("fecha", desc=True).order("id"))
+    assert asc == [3, 1, 5, 2, 4]
+    assert desc == [2, 4, 5, 1, 3]
+
+
+def test_cursor_created_at_id(replica):
+    # lo que arma paginar(): (created_at, id) estrictamente antes del cursor
+    filas = ids(
+        replica.table("cotizaciones").select("id")
+        .or_(f'created_at.lt."{T.format(2)}",and(created_at.eq."{T.format(2)}",id.lt.3)')
+        .order("created_at", desc=True).order("id", desc=True)
+    )
+    assert filas == [2, 1]
+
+
+def test_embebido_y_count(replica):
+    res = (
+        replica.table("cotizaciones").select("id, workspace(etiqueta, notas)", count="exact")
+        .in_("id", [1, 2]).order("id").limit(1).execute()
+    )
+    assert res.data == [{"id": 1, "workspace": None}]
+    assert res.count == 2
+    fila = replica.table("cotizaciones").select("id, workspace(etiqueta, notas)").eq("id", 2).execute().data[0]
+    assert fila["workspace"] == {"etiqueta": "vip", "notas": "llamar"}
+
+
+def test_aplicar_no_pisa_una_version_mas_nueva(replica):
+    replica.aplicar("cotizaciones", [{"id": 1, "estado": "Viejo", "updated_at": T.format(0)}])
+    assert replica.table("cotizaciones").select("estado").eq("id", 1).execute().data[0]["estado"] == "Esperando atención"
+    replica.aplicar("cotizaciones", [{"id": 1, "estado": "Cotizado", "extra": True, "updated_at": T.format(9)}])
+    fila = replica.table("cotizaciones").select("estado, extra").eq("id", 1).execute().data[0]
+    assert fila == {"estado": "Cotizado", "extra": True}  # columna nueva creada al llegar
+
+
+def test_refrescar_borra_lo_que_ya_no_existe(db, replica):
+    db.table("cotizaciones").delete().eq("id", 4).execute()
+    replica.refrescar("cotizaciones", [4, 5])
+    assert ids(replica.table("cotizaciones").select("id").order("id")) == [1, 2, 3, 5]